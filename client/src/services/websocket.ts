@@ -4,7 +4,6 @@ import {
   type Setlist,
   type BareSetlist
 } from '@/store/state';
-import {assignScatteredCoordinates} from './scatter';
 import {createApp} from 'vue';
 import ConcertPopup from '@/components/ConcertPopup.vue';
 import {i18n} from '@/main';
@@ -57,6 +56,23 @@ export class WebSocketManager {
     );
   }
 
+  /**
+   * Tell the user where they are in the server's queue, if they're waiting.
+   * @param {object} queue - queue position and estimated wait in seconds
+   */
+  private static updateQueueMessage(
+      queue: {position: number, estimatedWaitS: number}
+  ) {
+    if (queue.position > 0) {
+      setMessage(i18n.global.t('queued', [
+        i18n.global.n(queue.position),
+        i18n.global.n(Math.max(1, queue.estimatedWaitS))
+      ]));
+    } else {
+      setMessage(i18n.global.t('working'));
+    }
+  }
+
   /**
    * Open a new WebSocket connection to the backend server,
    * which will fetch setlists and add them to the global store.
@@ -70,18 +86,28 @@ export class WebSocketManager {
 
       switch (data.type) {
         case 'hello':
-          // Total expected is present in hello message iff the backend
-          // has already fetched at least one page of setlists
-          if (data.totalExpected) {
+          // When the server is busy, the fetch (or this connection) waits
+          // its turn, and the hello says where in the queue it is
+          if (data.queue) {
+            this.updateQueueMessage(data.queue);
+          } else if (data.totalExpected) {
+            // Total expected is present in hello message iff the backend
+            // has already fetched at least one page of setlists
             this.updateMessage(data);
           }
           break;
+        case 'queue':
+          this.updateQueueMessage(data);
+          break;
         case 'update': {
           // Count all new setlists
           this.count += data.setlists.length;
 
-          // Update messaging and profile
-          this.updateMessage(data);
+          // Update messaging and profile. An empty update while queued
+          // (setlists stored so far) keeps the queue message up
+          if (data.setlists.length > 0 || data.totalExpected !== null) {
+            this.updateMessage(data);
+          }
 
           // Build setlist objects
           const receivedSetlists: BareSetlist[] = data.setlists.filter(
@@ -95,8 +121,12 @@ export class WebSocketManager {
             const popupDiv = document.createElement('div');
             createApp(ConcertPopup, {setlist}).use(i18n).mount(popupDiv);
 
-            const marker = L.marker([setlist.cityLat, setlist.cityLong])
-                .bindPopup(popupDiv);
+            // The server places each setlist around its city, so setlists
+            // in the same city don't overlap
+            const marker = L.marker([
+              setlist.scatterLat ?? setlist.cityLat,
+              setlist.scatterLong ?? setlist.cityLong
+            ]).bindPopup(popupDiv);
             newSetlists.push({
               ...setlist,
               marker
@@ -132,13 +162,13 @@ export class WebSocketManager {
 
     if (data.hadError) {
       setMessage(i18n.global.t('fetchedError', [i18n.global.n(this.count)]));
+    } else if (data.stale) {
+      // setlist.fm is down, so these are the setlists the server had stored
+      setMessage(i18n.global.t('fetchedStale', [i18n.global.n(this.count)]));
     } else {
       setMessage(i18n.global.t('fetchedDone', [i18n.global.n(this.count)]));
     }
 
-    // Now that fetching is finished, scatter setlists to prevent overlap
-    assignScatteredCoordinates();
-
     store.isFetching = false;
   }
 }
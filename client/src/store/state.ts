@@ -17,14 +17,16 @@ export type BareSetlist = {
   stateName: string,
   countryName: string,
   setlistUrl: string,
-  songsPerformed: number
+  songsPerformed: number,
+  // Where to show the setlist on the map, scattered around its city.
+  // Sent by the server for valid setlists
+  scatterLat?: number,
+  scatterLong?: number
 };
 
 export type Setlist = BareSetlist & {
   // Attributes for the Map. Store here, so they can exist independently of Map
   marker: L.Marker<any>,
-  scatterLat?: number,
-  scatterLong?: number,
 }
 
 // The store
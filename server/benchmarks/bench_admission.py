@@ -0,0 +1,74 @@
+# bench_admission.py
+# Latency of a burst of artist lookups, with and without the upstream limit from admission.py.
+# The simulated upstream slows down as more requests pile onto it at once (each request takes
+# UPSTREAM_MS, plus SLOWDOWN_MS for every other request in flight), like a rate limited API would.
+#
+# Usage (from server/): python benchmarks/bench_admission.py [burst size]
+
+import logging
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+sys.path.insert(0, "src")
+
+from admission import Limiter
+
+UPSTREAM_MS = 20
+SLOWDOWN_MS = 4
+LIMIT = 8
+
+
+class Upstream:
+    def __init__(self):
+        self.in_flight = 0
+        self.lock = Lock()
+
+    def request(self) -> float:
+        """Make a request. Returns how long it took upstream."""
+        with self.lock:
+            self.in_flight += 1
+            others = self.in_flight - 1
+        start = time.perf_counter()
+        time.sleep((UPSTREAM_MS + SLOWDOWN_MS * others) / 1000)
+        with self.lock:
+            self.in_flight -= 1
+        return time.perf_counter() - start
+
+
+def lookup(upstream: Upstream, limiter: Limiter | None) -> tuple[float, float]:
+    """Returns (time until answered, time spent upstream)."""
+    start = time.perf_counter()
+    if limiter is None:
+        served = upstream.request()
+    else:
+        with limiter.enqueue() as ticket:
+            ticket.wait()
+            served = upstream.request()
+    return time.perf_counter() - start, served
+
+
+def percentile(values: list[float], p: float) -> float:
+    return statistics.quantiles(values, n=100)[int(p) - 1]
+
+
+def main() -> None:
+    burst = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    logging.disable(logging.WARNING)
+
+    for label, limiter in [("unlimited", None), (f"limit {LIMIT}", Limiter("upstream", LIMIT))]:
+        upstream = Upstream()
+        with ThreadPoolExecutor(burst) as pool:
+            results = list(pool.map(lambda _: lookup(upstream, limiter), range(burst)))
+        total = [result[0] * 1000 for result in results]
+        served = [result[1] * 1000 for result in results]
+        print(
+            f"{label:>10}: answered p50 {percentile(total, 50):6.0f} ms, p99 {percentile(total, 99):6.0f} ms | "
+            f"upstream p50 {percentile(served, 50):5.0f} ms, p99 {percentile(served, 99):5.0f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+# bench_asgi.py
+# Compare REST request latency of the WSGI deployment (`create_app`) against the ASGI one (`create_asgi_app`).
+# Upstream APIs are mocked, so this measures only our own middleware stack.
+#
+# Usage (from server/): python benchmarks/bench_asgi.py [requests]
+
+import asyncio
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, "src")
+
+import httpx
+import requests_mock
+import setlistfm_api
+from app import create_app
+from asgi import create_asgi_app
+
+# Upstream is mocked, so don't let our own rate limiter dominate the timings
+setlistfm_api.RATE_LIMIT_MS = 0
+
+ARTIST_MOCK = json.loads(Path("tests/mocks/GET_artists_Charlie_Puth.json").read_text(encoding="utf-8"))
+PATH = "/api/artists/Charlie Puth"
+
+
+def summarize(label: str, timings: list[float]) -> None:
+    timings = sorted(timings)
+    p50 = statistics.median(timings) * 1000
+    p99 = timings[int(len(timings) * 0.99) - 1] * 1000
+    print(f"{label:>6}: p50 {p50:.3f} ms, p99 {p99:.3f} ms, mean {statistics.fmean(timings) * 1000:.3f} ms")
+
+
+def bench_wsgi(n: int) -> list[float]:
+    app = create_app()
+    client = app.test_client()
+    timings = []
+    for _ in range(n):
+        start = time.perf_counter()
+        response = client.get(PATH)
+        timings.append(time.perf_counter() - start)
+        assert response.status_code == 200
+    app.wss.stop_server()
+    return timings
+
+
+async def bench_asgi(n: int) -> list[float]:
+    app = create_asgi_app()
+    transport = httpx.ASGITransport(app=app)
+    timings = []
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for _ in range(n):
+            start = time.perf_counter()
+            response = await client.get(PATH)
+            timings.append(time.perf_counter() - start)
+            assert response.status_code == 200
+    return timings
+
+
+def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    with requests_mock.Mocker() as m:
+        m.get("https://api.spotify.com/v1/search", status_code=404, json={})
+        m.get("https://api.setlist.fm/rest/1.0/search/artists", json=ARTIST_MOCK)
+
+        summarize("WSGI", bench_wsgi(n))
+        summarize("ASGI", asyncio.run(bench_asgi(n)))
+
+
+if __name__ == "__main__":
+    main()
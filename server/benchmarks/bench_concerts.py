@@ -0,0 +1,93 @@
+# bench_concerts.py
+# Time concert index queries (Database.find_concerts) with setlists spread across many artists.
+# MongoDB is included only when a server is reachable at localhost:27017.
+#
+# Usage (from server/): python benchmarks/bench_concerts.py [setlists]
+
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, "src")
+sys.path.insert(0, "benchmarks")
+
+from bench_storage import mongo_available
+from database import ConcertQuery, create_database
+
+SETLISTS_PER_ARTIST = 500
+# Cities around the world, so queries near one point only see a small share of the concerts
+CITIES = 2000
+
+
+def make_setlist(rng: random.Random, i: int) -> dict:
+    city = rng.randrange(CITIES)
+    city_rng = random.Random(city)
+    return {
+        "isValid": True,
+        "eventDate": f"{1990 + rng.randrange(35):04d}-{1 + rng.randrange(12):02d}-{1 + rng.randrange(28):02d}",
+        "venueName": f"Venue {city}-{rng.randrange(20)}",
+        "cityName": f"City {city}",
+        "cityLat": city_rng.uniform(-60, 70),
+        "cityLong": city_rng.uniform(-180, 180),
+        "stateName": "State",
+        "countryName": "Country",
+        "setlistUrl": f"https://www.setlist.fm/setlist/{i}.html",
+        "songsPerformed": rng.randrange(30)
+    }
+
+
+def timed(label: str, fn, repeat: int) -> None:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    elapsed = (time.perf_counter() - start) / repeat
+    print(f"  {label:<36} {elapsed * 1000:9.2f} ms  ({len(result)} concerts)")
+
+
+def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    logging.disable(logging.WARNING)
+    os.environ.setdefault("MONGO_DB_NAME", "cm-bench")
+    os.environ["SQLITE_PATH"] = str(Path(tempfile.mkdtemp()) / "bench.sqlite3")
+
+    rng = random.Random(0)
+    setlists = [make_setlist(rng, i) for i in range(n)]
+    mbids = [f"00000000-0000-4000-8000-{i:012d}" for i in range(0, n, SETLISTS_PER_ARTIST)]
+    city = setlists[0]
+
+    backends = ["memory", "sqlite"] + (["mongo"] if mongo_available() else [])
+    for backend in backends:
+        db = create_database(backend, write_behind=False)
+        start = time.perf_counter()
+        for i, mbid in enumerate(mbids):
+            db.delete_artist(mbid)
+            db.insert_artist(mbid, f"Artist {i}")
+            db.insert_setlists(mbid, setlists[i * SETLISTS_PER_ARTIST:(i + 1) * SETLISTS_PER_ARTIST])
+        print(f"{backend} ({n} setlists, {len(mbids)} artists, stored in {time.perf_counter() - start:.1f} s):")
+
+        near = ConcertQuery(lat=city["cityLat"], long=city["cityLong"], radius_km=50)
+        timed("near, 50 km", lambda: db.find_concerts(near), 20)
+        timed("near, 50 km, 2019", lambda: db.find_concerts(
+            ConcertQuery(lat=city["cityLat"], long=city["cityLong"], radius_km=50, date_from="2019-01-01", date_to="2019-12-31")
+        ), 20)
+        timed("near, 500 km", lambda: db.find_concerts(
+            ConcertQuery(lat=city["cityLat"], long=city["cityLong"], radius_km=500)
+        ), 20)
+        timed("venue", lambda: db.find_concerts(ConcertQuery(venue=city["venueName"])), 20)
+        page = db.find_concerts(near)
+        timed("near, 50 km, second page", lambda: db.find_concerts(
+            ConcertQuery(lat=city["cityLat"], long=city["cityLong"], radius_km=50,
+                         after=(page[-1]["eventDate"], page[-1]["concertId"]))
+        ), 20)
+
+        for mbid in mbids:
+            db.delete_artist(mbid)
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
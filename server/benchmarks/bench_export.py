@@ -0,0 +1,54 @@
+# bench_export.py
+# Peak memory and time of exporting one artist's setlists, streamed from a cursor, compared with
+# encoding the list that get_all_setlists returns.
+#
+# Usage (from server/): python benchmarks/bench_export.py [setlists]
+
+import logging
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, "src")
+sys.path.insert(0, "benchmarks")
+
+from bench_storage import MBID, make_setlist
+from database import create_database
+import export
+
+
+def measure(label: str, fn) -> None:
+    tracemalloc.start()
+    start = time.perf_counter()
+    size = sum(len(chunk) for chunk in fn())
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"  {label:<28} {elapsed * 1000:9.1f} ms  peak {peak / 2**20:7.2f} MiB  ({size / 2**20:.1f} MiB out)")
+
+
+def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    logging.disable(logging.WARNING)
+    os.environ["SQLITE_PATH"] = str(Path(tempfile.mkdtemp()) / "bench.sqlite3")
+
+    for backend in ["memory", "sqlite"]:
+        db = create_database(backend, write_behind=False)
+        db.insert_artist(MBID, "Benchmark")
+        for start in range(0, n, 1000):
+            db.insert_setlists(MBID, [make_setlist(i) for i in range(start, min(start + 1000, n))])
+
+        print(f"{backend} ({n} setlists):")
+        for format, (encoder, _, _) in export.FORMATS.items():
+            measure(f"{format}, whole list", lambda: export._chunked(encoder(db.get_all_setlists(MBID))))
+            measure(f"{format}, streamed", lambda: export._chunked(encoder(db.iter_setlists(MBID))))
+
+        db.delete_artist(MBID)
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+# bench_hedging.py
+# Latency of setlist.fm requests against a local server that is usually quick, but now and then slow
+# (SLOW_SHARE of requests take SLOW_MS) or stalled (STALL_SHARE hang for STALL_MS). Compares a fixed
+# 15 s timeout without hedging against adaptive timeouts and hedged requests (see setlistfm_api.py).
+# First with the rate limit turned off, so only upstream latency is measured. Then with it on, and
+# RATE_LIMITED_FETCHES fetches sharing one key: requests wait their turn for a slot, which mustn't be
+# taken for upstream being slow, and hedges should only go to the requests that really were.
+#
+# Usage (from server/): python benchmarks/bench_hedging.py [requests] [rate limited requests]
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from concurrent.futures import ThreadPoolExecutor
+from threading import Thread
+import logging
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, "src")
+
+import setlistfm_api
+from setlistfm_api import HedgeBudget, KeyPool, SetlistFmAPI
+
+FAST_MS = (20, 60)
+SLOW_SHARE = 0.04
+SLOW_MS = 1500
+STALL_SHARE = 0.01
+STALL_MS = 30_000
+RATE_LIMITED_FETCHES = 4
+
+
+class Handler(BaseHTTPRequestHandler):
+    rng = random.Random(1)
+
+    def do_GET(self):
+        roll = self.rng.random()
+        if roll < STALL_SHARE:
+            delay = STALL_MS
+        elif roll < STALL_SHARE + SLOW_SHARE:
+            delay = SLOW_MS
+        else:
+            delay = self.rng.uniform(*FAST_MS)
+        time.sleep(delay / 1000)
+        try:
+            self.send_response(200)
+            self.end_headers()
+            self.wfile.write(b'{"name": "mxmtoon"}')
+        except OSError:
+            # The client gave up on this one
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+def run(count: int, adaptive: bool, keys: list[str], fetches: int = 1) -> list[float]:
+    setlistfm_api.latencies.clear()
+    setlistfm_api.hedge_budget = HedgeBudget()
+    # Never enough samples: the old fixed timeout, and no hedges
+    setlistfm_api.MIN_LATENCY_SAMPLES = 20 if adaptive else count + 1
+    Handler.rng = random.Random(1)
+    api = SetlistFmAPI(KeyPool(keys))
+
+    def fetch(requests: int) -> list[float]:
+        times = []
+        for _ in range(requests):
+            start = time.perf_counter()
+            api.get_artist_info("x")
+            times.append((time.perf_counter() - start) * 1000)
+        return times
+
+    with ThreadPoolExecutor(fetches) as pool:
+        return [ms for times in pool.map(fetch, [count // fetches] * fetches) for ms in times]
+
+
+def report(label: str, times: list[float], adaptive: bool) -> None:
+    # Leave out the warm up, while the adaptive run has too few samples to go on
+    times = times[setlistfm_api.MIN_LATENCY_SAMPLES:] if adaptive else times[20:]
+    quantiles = statistics.quantiles(times, n=100)
+    print(
+        f"{label:>20}: p50 {quantiles[49]:6.0f} ms, p95 {quantiles[94]:6.0f} ms, "
+        f"p99 {quantiles[98]:6.0f} ms, max {max(times):6.0f} ms, total {sum(times) / 1000:5.1f} s, "
+        f"hedges {setlistfm_api.hedge_budget.hedges}"
+    )
+
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    rate_limited_count = int(sys.argv[2]) if len(sys.argv) > 2 else 160
+    logging.disable(logging.WARNING)
+    rate_limit_ms = setlistfm_api.RATE_LIMIT_MS
+    setlistfm_api.RATE_LIMIT_MS = 0
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    Thread(target=server.serve_forever, daemon=True).start()
+    setlistfm_api.API_URL = f"http://127.0.0.1:{server.server_port}"
+
+    for label, adaptive in [("fixed", False), ("adaptive", True)]:
+        report(label, run(count, adaptive, ["a", "b", "c", "d"]), adaptive)
+
+    setlistfm_api.RATE_LIMIT_MS = rate_limit_ms
+    print(f"rate limited: {RATE_LIMITED_FETCHES} fetches, one key, {1000 / rate_limit_ms:.0f} requests/s")
+    for label, adaptive in [("fixed", False), ("adaptive", True)]:
+        report(f"{label}, rate limited", run(rate_limited_count, adaptive, ["a"], RATE_LIMITED_FETCHES), adaptive)
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+# bench_ingest.py
+# Time a bulk ingest into SQLite and check that memory stays bounded.
+# The archive is a gzipped JSONL file of the recorded setlist pages in tests/mocks, copied across many
+# made-up artists.
+#
+# Usage (from server/): python benchmarks/bench_ingest.py [setlists] [workers]
+
+import gzip
+import io
+import json
+import logging
+import os
+import resource
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, "src")
+
+from ingest import Ingest
+from sqlite_database import SqliteDatabase
+
+PAGES = [json.loads(path.read_bytes()) for path in sorted(Path("tests/mocks").glob("GET_setlists_*/p*.json"))]
+PAGES = [page for page in PAGES if page.get("setlist")]
+SETLISTS_PER_ARTIST = 200
+
+
+def write_archive(path: Path, setlists: int) -> None:
+    written = 0
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        while written < setlists:
+            artist = {"mbid": str(uuid.uuid4()), "name": f"Artist {written}"}
+            artist_setlists = 0
+            for page in PAGES * (SETLISTS_PER_ARTIST // 100 + 1):
+                for raw_setlist in page["setlist"]:
+                    raw_setlist["artist"] = artist
+                f.write(json.dumps(page) + "\n")
+                artist_setlists += len(page["setlist"])
+                written += len(page["setlist"])
+                if artist_setlists >= SETLISTS_PER_ARTIST or written >= setlists:
+                    break
+
+
+def max_rss_mib() -> float:
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main() -> None:
+    setlists = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count()
+    logging.disable(logging.WARNING)
+    tmp = Path(tempfile.mkdtemp())
+
+    archive = tmp / "archive.jsonl.gz"
+    write_archive(archive, setlists)
+    print(f"archive: {archive.stat().st_size / 2**20:.1f} MiB gzipped, ~{setlists} setlists")
+
+    db = SqliteDatabase(str(tmp / "ingest.sqlite3"))
+    rss_before = max_rss_mib()
+    start = time.perf_counter()
+    state = Ingest(db, str(tmp / "state.json"), workers, out=io.StringIO()).run([str(archive)])
+    elapsed = time.perf_counter() - start
+    print(f"ingested {state['setlists']} setlists for {len(state['artists'])} artists with {workers} workers "
+          f"in {elapsed:.1f} s ({state['setlists'] / elapsed:.0f}/s)")
+    print(f"main process peak RSS: {rss_before:.0f} MiB before, {max_rss_mib():.0f} MiB after")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
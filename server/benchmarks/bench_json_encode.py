@@ -0,0 +1,50 @@
+# bench_json_encode.py
+# Time encoding the initial snapshot sent to a client (an "update" event holding all of an artist's setlists),
+# with the json module as before, and with json_codec.
+# Snapshots are built by repeating the recorded setlists in tests/mocks up to each size.
+#
+# Usage (from server/): python benchmarks/bench_json_encode.py [sizes...]
+
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, "src")
+
+import json_codec
+from setlist import convert_raw_setlists
+
+RECORDED = [
+    setlist
+    for path in sorted(Path("tests/mocks").glob("GET_setlists_*/p*.json"))
+    for setlist in convert_raw_setlists(json.loads(path.read_bytes()).get("setlist", []))
+]
+
+
+def best_of(fn, repeat: int = 5) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main() -> None:
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1_000, 10_000, 50_000]
+    print(f"json codec: {json_codec.CODEC}")
+    for size in sizes:
+        setlists = [dict(RECORDED[i % len(RECORDED)]) for i in range(size)]
+        event = {"type": "update", "setlists": setlists, "totalExpected": size}
+
+        # Before: str from the json module, encoded to bytes when the frame is written
+        before = best_of(lambda: json.dumps(event).encode("utf-8"))
+        after = best_of(lambda: json_codec.dumps_bytes(event))
+        megabytes = len(json_codec.dumps_bytes(event)) / 2**20
+        print(f"{size:>7} setlists ({megabytes:5.1f} MiB): json {before * 1000:7.1f} ms, "
+              f"json_codec {after * 1000:6.1f} ms ({before / after:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+# bench_scatter.py
+# Cost of scattering setlists as pages arrive: regrouping every setlist by city on each page
+# (what the client used to do) versus ScatterLayout, which only places the new page.
+#
+# Usage (from server/): python benchmarks/bench_scatter.py [setlists]
+
+import math
+import sys
+import time
+
+sys.path.insert(0, "src")
+sys.path.insert(0, "benchmarks")
+
+from bench_storage import PAGE_SIZE, make_setlist
+from map_layout import ScatterLayout
+
+
+def regroup_all(setlists: list[dict]) -> None:
+    # Same work as the client's old assignScatteredCoordinates
+    cities: dict[tuple[float, float], list[dict]] = {}
+    for setlist in setlists:
+        cities.setdefault((setlist["cityLat"], setlist["cityLong"]), []).insert(0, setlist)
+    for city_setlists in cities.values():
+        radius = 0.02 * math.sqrt(len(city_setlists) - 1)
+        step = 2 * math.pi / len(city_setlists)
+        for index, setlist in enumerate(city_setlists):
+            angle = math.pi / 2 - step * index
+            setlist["scatter"] = (setlist["cityLat"] + radius * math.sin(angle), setlist["cityLong"] + radius * math.cos(angle))
+
+
+def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5_000
+    setlists = [make_setlist(i) for i in range(n)]
+    pages = [setlists[i:i + PAGE_SIZE] for i in range(0, n, PAGE_SIZE)]
+    print(f"{n} setlists in {len(pages)} pages:")
+
+    start = time.perf_counter()
+    received = []
+    for page in pages:
+        received += [dict(setlist) for setlist in page]
+        regroup_all(received)
+    print(f"  regroup every page   {(time.perf_counter() - start) * 1000:9.1f} ms")
+
+    start = time.perf_counter()
+    layout = ScatterLayout()
+    for page in pages:
+        layout.place(page)
+    print(f"  ScatterLayout        {(time.perf_counter() - start) * 1000:9.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
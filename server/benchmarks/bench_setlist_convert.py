@@ -0,0 +1,54 @@
+# bench_setlist_convert.py
+# Time turning a setlist.fm response body into setlist dicts, using the recorded pages in tests/mocks.
+#   before: decode the body to str, json.loads, then Setlist.convert_setlists
+#   after: json_codec.loads on the bytes, then convert_raw_setlists
+#
+# Usage (from server/): python benchmarks/bench_setlist_convert.py [rounds]
+
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, "src")
+
+import json_codec
+from setlist import Setlist, convert_raw_setlists
+
+PAGES = [path.read_bytes() for path in sorted(Path("tests/mocks").glob("GET_setlists_*/p*.json"))]
+
+
+def before(body: bytes) -> list[dict]:
+    return Setlist.convert_setlists(json.loads(body.decode("utf-8")).get("setlist", []))
+
+
+def after(body: bytes) -> list[dict]:
+    return convert_raw_setlists(json_codec.loads(body).get("setlist", []))
+
+
+def per_setlist(fn, rounds: int) -> float:
+    setlists = 0
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for body in PAGES:
+            setlists += len(fn(body))
+    return (time.perf_counter() - start) / setlists
+
+
+def main() -> None:
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    for body in PAGES:
+        assert before(body) == after(body)
+
+    print(f"{len(PAGES)} recorded pages, {sum(len(body) for body in PAGES) / 1024:.0f} KiB, json codec: {json_codec.CODEC}")
+    parse_before = per_setlist(lambda body: json.loads(body.decode("utf-8")).get("setlist", []), rounds)
+    parse_after = per_setlist(lambda body: json_codec.loads(body).get("setlist", []), rounds)
+    total_before = per_setlist(before, rounds)
+    total_after = per_setlist(after, rounds)
+    print(f"  parse only:        {parse_before * 1e6:6.1f} -> {parse_after * 1e6:6.1f} us/setlist")
+    print(f"  parse and convert: {total_before * 1e6:6.1f} -> {total_after * 1e6:6.1f} us/setlist "
+          f"({total_before / total_after:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+# bench_setlist_memory.py
+# Measure memory held by setlists kept in memory, as a list of dicts vs a SetlistStore.
+# Setlists are built the way the Fetcher builds them (from parsed JSON), for many artists at once.
+#
+# Usage (from server/): python benchmarks/bench_setlist_memory.py [artists] [setlists per artist]
+
+import json
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, "src")
+
+from setlist import Setlist
+from setlist_store import SetlistStore
+
+COUNTRIES = [f"Country {i}" for i in range(40)]
+
+
+def raw_page(rng: random.Random, size: int) -> bytes:
+    """A page of setlists as JSON, like the setlist.fm API returns."""
+    setlists = []
+    for _ in range(size):
+        city = rng.randrange(400)
+        setlists.append({
+            "eventDate": f"{rng.randint(1, 28):02d}-{rng.randint(1, 12):02d}-{rng.randint(1990, 2025)}",
+            "url": f"https://www.setlist.fm/setlist/artist/2024/venue-{rng.randrange(10**8):08x}.html",
+            "venue": {
+                "name": f"Venue {rng.randrange(1500)}",
+                "city": {
+                    "name": f"City {city}",
+                    "state": f"State {city % 60}",
+                    "coords": {"lat": rng.uniform(-60, 60), "long": rng.uniform(-180, 180)},
+                    "country": {"name": COUNTRIES[city % len(COUNTRIES)]}
+                }
+            },
+            "sets": {"set": [{"song": [{}] * rng.randint(5, 25)}]}
+        })
+    return json.dumps({"setlist": setlists}).encode()
+
+
+def fill(container_cls, artists: int, per_artist: int) -> tuple[list, float, float]:
+    rng = random.Random(0)
+    pages = [raw_page(rng, 20) for _ in range(per_artist // 20)]
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    held = []
+    for _ in range(artists):
+        container = container_cls()
+        for page in pages:
+            container.extend(Setlist.convert_setlists(json.loads(page)["setlist"]))
+        held.append(container)
+    elapsed = time.perf_counter() - start
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return held, size, elapsed
+
+
+def main() -> None:
+    artists = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    per_artist = int(sys.argv[2]) if len(sys.argv) > 2 else 10_000
+
+    results = {}
+    for label, container_cls in [("list of dicts", list), ("SetlistStore", SetlistStore)]:
+        held, size, elapsed = fill(container_cls, artists, per_artist)
+        results[label] = held
+        print(f"{label:>14}: {size / 2**20:8.1f} MiB for {artists} x {per_artist} setlists "
+              f"({size / (artists * per_artist):6.0f} B/setlist), built in {elapsed:.2f} s")
+
+    # Reading a whole store back out, e.g. for a snapshot
+    store = results["SetlistStore"][0]
+    start = time.perf_counter()
+    assert store.to_list() == results["list of dicts"][0]
+    print(f"SetlistStore.to_list for {per_artist} setlists: {(time.perf_counter() - start) * 1000:.1f} ms (incl. compare)")
+
+
+if __name__ == "__main__":
+    main()
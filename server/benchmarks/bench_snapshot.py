@@ -0,0 +1,80 @@
+# bench_snapshot.py
+# Time to first frame and peak memory of a joining client's snapshot, from reading an artist's setlists out
+# of an SQLite database to the last frame. Before: every setlist read as a dict, laid out, and sent as one
+# update event. After: setlists streamed into a compact store, and sent newest first in frames of about
+# SNAPSHOT_FRAME_BYTES (wss.Snapshot). The read counts towards both.
+# Setlists are the recorded ones in tests/mocks, repeated up to each size.
+#
+# Usage (from server/): python benchmarks/bench_snapshot.py [sizes...]
+
+import json
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, "src")
+
+import json_codec
+import wss
+from map_layout import ScatterLayout
+from setlist import convert_raw_setlists
+from sqlite_database import SqliteDatabase
+
+MBID = "b4db7e5b-fb5f-4bc0-8a5a-2c1b4b7ab5b3"
+
+RECORDED = [
+    setlist
+    for path in sorted(Path("tests/mocks").glob("GET_setlists_*/p*.json"))
+    for setlist in convert_raw_setlists(json.loads(path.read_bytes()).get("setlist", []))
+]
+
+
+def one_frame(db: SqliteDatabase):
+    setlists = ScatterLayout().place(db.get_all_setlists(MBID), in_place=True)
+    event = {"type": "update", "setlists": setlists, "totalExpected": len(setlists)}
+    yield json_codec.dumps_bytes(event)
+
+
+def frames(db: SqliteDatabase):
+    snapshot = wss.Snapshot(db.iter_setlists(MBID), None)
+    yield from snapshot.frames()
+
+
+def measure(encode, db: SqliteDatabase) -> tuple[float, float, int]:
+    """Time to first frame and to all of them, in ms, and peak memory in bytes.
+    Memory is measured on a second run, since tracing slows everything down."""
+    start = time.perf_counter()
+    sent = encode(db)
+    next(sent)
+    first = time.perf_counter() - start
+    for _ in sent:
+        pass
+    total = time.perf_counter() - start
+
+    tracemalloc.start()
+    for _ in encode(db):
+        pass
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return first * 1000, total * 1000, peak
+
+
+def main() -> None:
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1_000, 10_000, 50_000]
+    print(f"json codec: {json_codec.CODEC}, frames of {wss.SNAPSHOT_FRAME_BYTES // 1024} KiB")
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            db = SqliteDatabase(str(Path(directory) / f"{size}.sqlite3"))
+            db.insert_artist(MBID, "Benchmark")
+            db.insert_setlists(MBID, [dict(RECORDED[i % len(RECORDED)]) for i in range(size)])
+            for name, encode in [("one frame", one_frame), ("frames", frames)]:
+                first, total, peak = measure(encode, db)
+                print(f"{size:>7} setlists, {name:>9}: first frame {first:7.1f} ms, all {total:7.1f} ms, "
+                      f"peak {peak / 2**20:6.1f} MiB")
+            db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+# bench_startup.py
+# Enforce a startup-time budget: how long a fresh worker takes to import the app,
+# and to answer its first request. Each run happens in a new interpreter.
+# Exits with status 1 if the median of either measurement is over budget.
+#
+# Usage (from server/): python benchmarks/bench_startup.py [runs]
+# Budgets (ms) can be overridden with STARTUP_IMPORT_BUDGET_MS and STARTUP_FIRST_REQUEST_BUDGET_MS.
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+IMPORT_BUDGET_MS = float(os.getenv("STARTUP_IMPORT_BUDGET_MS", 1000))
+FIRST_REQUEST_BUDGET_MS = float(os.getenv("STARTUP_FIRST_REQUEST_BUDGET_MS", 1500))
+
+# Runs in the child interpreter
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+sys.path.insert(0, "src")
+import app
+imported = time.perf_counter()
+flask_app = app.create_app()
+created = time.perf_counter()
+flask_app.test_client().get("/api/nonsense")
+responded = time.perf_counter()
+print(json.dumps({
+    "import": (imported - start) * 1000,
+    "create_app": (created - imported) * 1000,
+    "first_request": (responded - start) * 1000,
+}))
+"""
+
+
+def run_once() -> dict:
+    env = dict(os.environ, MONGO_DB_NAME=os.getenv("MONGO_DB_NAME", "test"))
+    result = subprocess.run(
+        [sys.executable, "-W", "ignore", "-c", CHILD],
+        capture_output=True, text=True, env=env, check=True
+    )
+    # The app logs to stdout too, so pick out the line with the measurements
+    line = next(line for line in result.stdout.splitlines() if line.startswith("{"))
+    return json.loads(line)
+
+
+def main() -> None:
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    results = [run_once() for _ in range(runs)]
+
+    medians = {key: statistics.median(r[key] for r in results) for key in results[0]}
+    for key, value in medians.items():
+        print(f"{key:>14}: median {value:7.1f} ms")
+
+    over_budget = False
+    for key, budget in [("import", IMPORT_BUDGET_MS), ("first_request", FIRST_REQUEST_BUDGET_MS)]:
+        if medians[key] > budget:
+            print(f"Over budget: {key} took {medians[key]:.1f} ms (budget {budget:.0f} ms)")
+            over_budget = True
+
+    sys.exit(1 if over_budget else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+# bench_storage.py
+# Compare the storage backends on the operations a fetch and a page load perform.
+# MongoDB is included only when a server is reachable at localhost:27017.
+#
+# Usage (from server/): python benchmarks/bench_storage.py [setlists]
+
+import logging
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, "src")
+
+from database import create_database
+
+MBID = "00000000-0000-4000-8000-000000000000"
+PAGE_SIZE = 20
+
+
+def make_setlist(i: int) -> dict:
+    return {
+        "isValid": True,
+        "eventDate": f"{2000 + i % 25:04d}-{1 + i % 12:02d}-{1 + i % 28:02d}",
+        "venueName": f"Venue {i}",
+        "cityName": f"City {i % 500}",
+        "cityLat": 40.0 + (i % 100) / 10,
+        "cityLong": -120.0 + (i % 100) / 10,
+        "stateName": "State",
+        "countryName": "Country",
+        "setlistUrl": f"https://www.setlist.fm/setlist/{i}.html",
+        "songsPerformed": i % 30
+    }
+
+
+def timed(label: str, fn, repeat: int = 1) -> None:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    elapsed = (time.perf_counter() - start) / repeat
+    print(f"  {label:<22} {elapsed * 1000:9.2f} ms")
+
+
+def mongo_available() -> bool:
+    try:
+        from pymongo import MongoClient
+        MongoClient(serverSelectionTimeoutMS=500).admin.command("ping")
+        return True
+    except Exception:
+        return False
+
+
+def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    logging.disable(logging.WARNING)
+    os.environ.setdefault("MONGO_DB_NAME", "cm-bench")
+    os.environ["SQLITE_PATH"] = str(Path(tempfile.mkdtemp()) / "bench.sqlite3")
+
+    setlists = [make_setlist(i) for i in range(n)]
+    pages = [setlists[i:i + PAGE_SIZE] for i in range(0, n, PAGE_SIZE)]
+
+    backends = ["memory", "sqlite"] + (["mongo"] if mongo_available() else [])
+    for backend in backends:
+        print(f"{backend} ({n} setlists):")
+        db = create_database(backend)
+        db.delete_artist(MBID)
+        db.insert_artist(MBID, "Benchmark")
+
+        def insert_pages():
+            for page in pages:
+                db.insert_setlists(MBID, page)
+
+        timed(f"insert {len(pages)} pages", insert_pages)
+        timed("get_all_setlists", lambda: db.get_all_setlists(MBID), repeat=5)
+        timed("get_last_setlist", lambda: db.get_last_setlist(MBID), repeat=20)
+        timed("check_artist", lambda: db.check_artist(MBID), repeat=1000)
+
+        db.delete_artist(MBID)
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
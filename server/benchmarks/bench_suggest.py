@@ -0,0 +1,57 @@
+# bench_suggest.py
+# Time artist suggestions against an index of made-up artist names, for queries of different lengths,
+# including typos that only the trigram fallback can match.
+#
+# Usage (from server/): python benchmarks/bench_suggest.py [artists]
+
+import random
+import sys
+import time
+import uuid
+
+sys.path.insert(0, "src")
+
+from artist_index import SuggestIndex
+from cache_warmer import PopularityTracker
+
+SYLLABLES = ["ka", "lo", "mi", "ra", "to", "ven", "sun", "dar", "el", "io", "ne", "ber", "sha", "qui", "po"]
+WORDS = ["the", "band", "boys", "girls", "of", "night", "black", "city", "club", "moon", "fire", "kids"]
+QUERIES = ["k", "ka", "kalo", "the moon", "night ci", "kalomi ra", "kalmoi", "blakc fire"]
+REPEATS = 200
+
+
+def make_name(rng: random.Random) -> str:
+    made_up = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).title()
+    return " ".join([made_up] + rng.sample(WORDS, rng.randint(0, 3)))
+
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    rng = random.Random(1)
+    artists = [(str(uuid.UUID(int=rng.getrandbits(128))), make_name(rng)) for _ in range(count)]
+
+    index = SuggestIndex()
+    start = time.perf_counter()
+    index.add_many(artists)
+    print(f"Indexed {count} artists in {time.perf_counter() - start:.2f} s")
+
+    added = artists[:1000]
+    start = time.perf_counter()
+    for mbid, name in added:
+        index.add(mbid + "x", name)
+    print(f"add(): {(time.perf_counter() - start) / len(added) * 1000:.3f} ms per artist")
+
+    popularity = PopularityTracker()
+    for mbid, _ in rng.sample(artists, 5000):
+        popularity.record(mbid)
+
+    for query in QUERIES:
+        start = time.perf_counter()
+        for _ in range(REPEATS):
+            results = index.suggest(query, 8, popularity)
+        elapsed = (time.perf_counter() - start) / REPEATS
+        print(f"{query!r:>14}: {elapsed * 1000:.3f} ms, {len(results)} results")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# bench_tours.py
+# Cost of keeping an artist's tours up to date as pages of setlists arrive (newest first, like a fetch):
+# redoing everything with Python loops on each page, versus TourTracker, which works out only the new
+# page's legs with NumPy. Also times building a tracker from every stored setlist, and finding tours.
+#
+# Usage (from server/): python benchmarks/bench_tours.py [shows]
+
+import datetime
+import math
+import random
+import sys
+import time
+
+sys.path.insert(0, "src")
+sys.path.insert(0, "benchmarks")
+
+from bench_storage import PAGE_SIZE
+from tours import EARTH_RADIUS_KM, MIN_TOUR_SHOWS, TOUR_GAP_DAYS, TourTracker
+
+# Pure Python redoes are slow, so they only get this many pages
+LOOP_PAGES = 50
+
+
+def make_setlists(n: int) -> list[dict]:
+    """Shows a day or three apart, with a break every 30 or so, newest first."""
+    rng = random.Random(1)
+    day = datetime.date(2024, 12, 31)
+    setlists = []
+    for i in range(n):
+        day -= datetime.timedelta(days=rng.randint(60, 120) if rng.random() < 1 / 30 else rng.randint(1, 3))
+        setlists.append({
+            "isValid": True,
+            "eventDate": day.isoformat(),
+            "cityName": f"City {i % 500}",
+            "cityLat": rng.uniform(-60, 70),
+            "cityLong": rng.uniform(-180, 180),
+            "countryName": f"Country {i % 40}"
+        })
+    return setlists
+
+
+def loop_tours(setlists: list[dict]) -> list[dict]:
+    """Tours the plain way: sort, then one Python loop over the shows."""
+    shows = sorted(setlists, key=lambda setlist: setlist["eventDate"])
+    tours = []
+    current = None
+    previous = None
+    for show in shows:
+        day = datetime.date.fromisoformat(show["eventDate"])
+        if previous is None or (day - previous[0]).days > TOUR_GAP_DAYS:
+            current = {"shows": 0, "distanceKm": 0.0}
+            tours.append(current)
+        else:
+            lat1, long1, lat2, long2 = map(math.radians, (previous[1], previous[2], show["cityLat"], show["cityLong"]))
+            a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((long2 - long1) / 2) ** 2
+            current["distanceKm"] += 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+        current["shows"] += 1
+        previous = (day, show["cityLat"], show["cityLong"])
+    return [tour for tour in tours if tour["shows"] >= MIN_TOUR_SHOWS]
+
+
+def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    setlists = make_setlists(n)
+    pages = [setlists[i:i + PAGE_SIZE] for i in range(0, n, PAGE_SIZE)]
+    print(f"{n} setlists in {len(pages)} pages:")
+
+    # The last pages are the worst for redoing everything, so time those
+    received = [setlist for page in pages[:-LOOP_PAGES] for setlist in page]
+    start = time.perf_counter()
+    for page in pages[-LOOP_PAGES:]:
+        received += page
+        loop_tours(received)
+    loop_page = (time.perf_counter() - start) / LOOP_PAGES
+    print(f"  python loop, all again:   {loop_page * 1000:8.2f} ms per page (last {LOOP_PAGES} pages)")
+
+    tracker = TourTracker()
+    start = time.perf_counter()
+    for page in pages:
+        tracker.add(page)
+    elapsed = time.perf_counter() - start
+    print(f"  TourTracker.add:          {elapsed / len(pages) * 1000:8.2f} ms per page ({elapsed:.2f} s total)")
+
+    # Tours are only found when asked for
+    start = time.perf_counter()
+    tracker.tours()
+    print(f"  tours:                    {(time.perf_counter() - start) * 1000:8.2f} ms")
+
+    start = time.perf_counter()
+    built = TourTracker(setlists)
+    print(f"  TourTracker, all at once: {(time.perf_counter() - start) * 1000:8.2f} ms")
+
+    start = time.perf_counter()
+    found = built.tours(with_legs=True)
+    print(f"  tours with legs:          {(time.perf_counter() - start) * 1000:8.2f} ms ({len(found)} tours)")
+
+    # Both ways agree
+    expected = loop_tours(setlists)
+    assert [tour["shows"] for tour in found] == [tour["shows"] for tour in reversed(expected)]
+    assert all(abs(a["distanceKm"] - b["distanceKm"]) < 1 for a, b in zip(found, reversed(expected)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+# bench_validation.py
+# Measure the per-request overhead of OpenAPI validation.
+# A stub app stands in for Flask, so only Connexion's work is timed.
+#
+# Usage (from server/): python benchmarks/bench_validation.py [requests]
+
+import asyncio
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, "src")
+
+import httpx
+from connexion import ConnexionMiddleware
+import validation
+
+ARTIST = json.dumps({
+    "mbid": "525f1f1c-03f0-4bc8-8dfd-e7521f87631b",
+    "name": "Charlie Puth",
+    "imageUrl": "https://example.com/image.png"
+}).encode()
+
+
+async def stub_app(scope, receive, send) -> None:
+    await send({"type": "http.response.start", "status": 200,
+                "headers": [(b"content-type", b"application/json")]})
+    await send({"type": "http.response.body", "body": ARTIST})
+
+
+def build(variant: str):
+    if variant == "none":
+        return stub_app
+    app = ConnexionMiddleware(stub_app)
+    if variant == "connexion default":
+        app.add_api(validation.SPEC_PATH, strict_validation=True, validate_responses=True)
+    else:
+        os.environ["OPENAPI_VALIDATION"] = variant
+        app.add_api(validation.load_spec(), **validation.api_options())
+    return app
+
+
+async def time_requests(app, n: int) -> list[float]:
+    transport = httpx.ASGITransport(app=app)
+    timings = []
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        # Warm up (Connexion builds its middleware stack on the first request)
+        await client.get("/api/artists/Charlie Puth")
+        for _ in range(n):
+            start = time.perf_counter()
+            response = await client.get("/api/artists/Charlie Puth")
+            timings.append(time.perf_counter() - start)
+            assert response.status_code == 200
+    return timings
+
+
+def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    # Connexion imports our app module to resolve operationIds, which sets up chatty logging
+    logging.disable(logging.WARNING)
+    baseline = None
+    for variant in ["none", "connexion default", "strict", "production"]:
+        median = statistics.median(asyncio.run(time_requests(build(variant), n))) * 1e6
+        if baseline is None:
+            baseline = median
+        print(f"{variant:>17}: median {median:8.1f} us/request, overhead {median - baseline:8.1f} us")
+
+    start = time.perf_counter()
+    validation.load_spec()
+    print(f"load_spec (cached): {(time.perf_counter() - start) * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# bench_write_behind.py
+# Time a simulated fetch with and without the write-behind buffer.
+# Each page waits UPSTREAM_MS for "setlist.fm", then stores 20 setlists in SQLite. Every call that reaches
+# the database also waits DB_RTT_MS, standing in for a round trip to a MongoDB server.
+#
+# Usage (from server/): python benchmarks/bench_write_behind.py [pages]
+
+import logging
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, "src")
+
+from sqlite_database import SqliteDatabase
+from write_behind import WriteBehindDatabase
+
+MBID = "00000000-0000-4000-8000-000000000000"
+UPSTREAM_MS = 5
+DB_RTT_MS = 2
+
+SETLIST = {
+    "isValid": True,
+    "eventDate": "2024-01-15",
+    "venueName": "Venue",
+    "cityName": "Seattle",
+    "cityLat": 47.6,
+    "cityLong": -122.3,
+    "stateName": "Washington",
+    "countryName": "United States",
+    "setlistUrl": "https://www.setlist.fm/",
+    "songsPerformed": 12
+}
+
+
+class RemoteSqliteDatabase(SqliteDatabase):
+    """SQLite with an artificial round trip on every write."""
+    def __init__(self, path: str):
+        super().__init__(path)
+        self.round_trips = 0
+
+    def _round_trip(self) -> None:
+        self.round_trips += 1
+        time.sleep(DB_RTT_MS / 1000)
+
+    def reinsert_artist(self, mbid):
+        self._round_trip()
+        super().reinsert_artist(mbid)
+
+    def insert_setlists(self, mbid, new_setlists):
+        self._round_trip()
+        super().insert_setlists(mbid, new_setlists)
+
+    def mark_artist_complete(self, mbid):
+        self._round_trip()
+        super().mark_artist_complete(mbid)
+
+    def write_batch(self, writes):
+        self._round_trip()
+        super().write_batch(writes)
+
+
+def simulate_fetch(db, pages: int) -> float:
+    start = time.perf_counter()
+    db.reinsert_artist(MBID)
+    for _ in range(pages):
+        time.sleep(UPSTREAM_MS / 1000)
+        db.insert_setlists(MBID, [SETLIST] * 20)
+    db.mark_artist_complete(MBID)
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    pages = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    logging.disable(logging.WARNING)
+    tmp = Path(tempfile.mkdtemp())
+
+    for label, write_behind in [("direct", False), ("write-behind", True)]:
+        inner = RemoteSqliteDatabase(str(tmp / f"{label}.sqlite3"))
+        db = WriteBehindDatabase(inner) if write_behind else inner
+        db.insert_artist(MBID, "Benchmark")
+        inner.round_trips = 0
+
+        elapsed = simulate_fetch(db, pages)
+        assert len(db.get_all_setlists(MBID)) == pages * 20
+        print(f"{label:>12}: {elapsed * 1000:8.1f} ms for {pages} pages, {inner.round_trips} round trips")
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
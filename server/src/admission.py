@@ -0,0 +1,183 @@
+# admission.py
+# Bounds the work a burst of traffic can start. Work over a limit waits its turn in a queue, rather than
+# piling onto upstream APIs (and slowing everyone down) or being turned away.
+#
+# Limits:
+#   fetches: setlist fetches running at once. Queued fetches already have their channel, so their clients
+#            connect right away and are told their place in the queue (see Fetcher and wss.py).
+#   upstream: requests made while a user waits on an HTTP response (artist search, artist image).
+#             Queued for up to UPSTREAM_QUEUE_TIMEOUT_S, then answered with a 503.
+#   connections per channel: clients past the limit are queued, and get setlists once someone leaves.
+#   connections per IP: clients past the limit are refused. Queueing them would still let one client
+#                       hold any number of sockets open.
+#
+# Config (all optional):
+#   MAX_CONCURRENT_FETCHES (default 8)
+#   MAX_UPSTREAM_REQUESTS (default 16)
+#   UPSTREAM_QUEUE_TIMEOUT_S (default 10)
+#   MAX_CONNECTIONS_PER_CHANNEL (default 200)
+#   MAX_CONNECTIONS_PER_IP (default 20)
+
+from collections import deque
+from threading import Condition, Lock
+import logging
+import math
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+# Until there's a real measurement, assume work holds its slot this long when estimating waits
+DEFAULT_HOLD_S = 10.0
+# Weight of the latest hold time in the running average
+HOLD_SMOOTHING = 0.2
+
+
+class Ticket:
+    """A place in a Limiter's queue, and then its slot once admitted."""
+
+    def __init__(self, limiter: 'Limiter'):
+        self._limiter = limiter
+        self.admitted = False
+        self.admitted_at: float | None = None
+        self.released = False
+
+    @property
+    def position(self) -> int:
+        """1 for the next to be admitted, 2 for the one after... 0 once admitted."""
+        return self._limiter._position(self)
+
+    @property
+    def estimated_wait_s(self) -> float:
+        return self._limiter.estimated_wait_s(self.position)
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """Block until admitted. Returns False if the timeout passed first."""
+        return self._limiter._wait(self, timeout)
+
+    def release(self) -> None:
+        """Give up the slot, or the place in the queue if not admitted yet. Safe to call more than once."""
+        self._limiter._release(self)
+
+    def __enter__(self) -> 'Ticket':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
+
+
+class Limiter:
+    """Lets up to `limit` pieces of work run at once, admitting the rest first come, first served."""
+
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = max(1, limit)
+        self._running = 0
+        self._queue: deque[Ticket] = deque()
+        self._cond = Condition()
+        # Running average of how long work keeps its slot, for wait estimates
+        self.average_hold_s = DEFAULT_HOLD_S
+
+    def __repr__(self) -> str:
+        return f"Limiter('{self.name}', {self._running}/{self.limit} running, {len(self._queue)} queued)"
+
+    @property
+    def running(self) -> int:
+        return self._running
+
+    @property
+    def queued(self) -> int:
+        return len(self._queue)
+
+    def enqueue(self) -> Ticket:
+        """Join the queue. The ticket is admitted right away if there's a free slot."""
+        ticket = Ticket(self)
+        with self._cond:
+            self._queue.append(ticket)
+            self._admit()
+        if not ticket.admitted:
+            logger.info(f"Queued: {self}")
+        return ticket
+
+    def estimated_wait_s(self, position: int) -> float:
+        """Rough time until the ticket at `position` is admitted, assuming slots free up at the average rate."""
+        if position <= 0:
+            return 0.0
+        # Everyone ahead, plus those running, has to finish (about) one slot's worth each
+        return math.ceil(position / self.limit) * self.average_hold_s
+
+    def _admit(self) -> None:
+        # Caller holds the lock
+        admitted = False
+        while self._queue and self._running < self.limit:
+            ticket = self._queue.popleft()
+            ticket.admitted = True
+            ticket.admitted_at = time.monotonic()
+            self._running += 1
+            admitted = True
+        if admitted:
+            self._cond.notify_all()
+
+    def _position(self, ticket: Ticket) -> int:
+        with self._cond:
+            if ticket.admitted or ticket.released:
+                return 0
+            try:
+                return self._queue.index(ticket) + 1
+            except ValueError:
+                return 0
+
+    def _wait(self, ticket: Ticket, timeout: float | None) -> bool:
+        with self._cond:
+            return self._cond.wait_for(lambda: ticket.admitted or ticket.released, timeout) and ticket.admitted
+
+    def _release(self, ticket: Ticket) -> None:
+        with self._cond:
+            if ticket.released:
+                return
+            ticket.released = True
+            if ticket.admitted:
+                self._running -= 1
+                held = time.monotonic() - ticket.admitted_at
+                self.average_hold_s += HOLD_SMOOTHING * (held - self.average_hold_s)
+            else:
+                self._queue.remove(ticket)
+            self._admit()
+            # Wake up anyone waiting on a ticket that was just given up
+            self._cond.notify_all()
+
+
+class CountLimiter:
+    """Counts open things per key (e.g. connections per IP), refusing any past `limit`."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._counts: dict[str, int] = {}
+        self._lock = Lock()
+
+    def add(self, key: str) -> bool:
+        """Count one more for `key`. Returns False, without counting it, if the key is at its limit."""
+        with self._lock:
+            count = self._counts.get(key, 0)
+            if count >= self.limit:
+                return False
+            self._counts[key] = count + 1
+            return True
+
+    def remove(self, key: str) -> None:
+        with self._lock:
+            count = self._counts.get(key, 0) - 1
+            if count <= 0:
+                self._counts.pop(key, None)
+            else:
+                self._counts[key] = count
+
+    def count(self, key: str) -> int:
+        return self._counts.get(key, 0)
+
+
+fetch_limiter = Limiter("fetches", int(os.getenv("MAX_CONCURRENT_FETCHES", 8)))
+upstream_limiter = Limiter("upstream", int(os.getenv("MAX_UPSTREAM_REQUESTS", 16)))
+UPSTREAM_QUEUE_TIMEOUT_S = float(os.getenv("UPSTREAM_QUEUE_TIMEOUT_S", 10))
+MAX_CONNECTIONS_PER_CHANNEL = int(os.getenv("MAX_CONNECTIONS_PER_CHANNEL", 200))
+ip_connections = CountLimiter(int(os.getenv("MAX_CONNECTIONS_PER_IP", 20)))
@@ -1,28 +1,31 @@
 import asyncio
 from threading import Thread
-from flask import Flask, Blueprint
+from flask import Flask, Blueprint, request
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 from connexion import ConnexionMiddleware
 from a2wsgi import WSGIMiddleware, ASGIMiddleware
+from dotenv import load_dotenv
 from logger import initialize_logger
 
-# Set up logging before importing other modules
+# Load .env and set up logging before importing other modules, which read both at import time
+load_dotenv()
 initialize_logger()
 
 import artists
-from database import Database
+import artist_index
+import concerts
+import export
+import songs
+import json_codec
+from cache_warmer import CacheWarmer, PopularityTracker
+import validation
+from database import create_database
 from wss import WebSocketServer
 
 # Application factory
 def create_app():
-    app = Flask(__name__)
-    CORS(app, resources={r"/api/*": {"origins": "*"}})
-
-    # Register blueprint with routes
-    app.register_blueprint(main)
-
-    # Initialize database
-    app.db = Database()
+    app = create_flask_app()
 
     # This convolution is apparently necessary to run the WebSocket server (an async function)
     # from this function, which is synchronous
@@ -33,6 +36,7 @@ def create_app():
         wss = WebSocketServer(loop, app.db)
         # Store wss in the app context
         app.wss = wss
+        start_cache_warmer(app)
 
         loop.run_until_complete(wss.start_server())
         loop.run_forever()
@@ -43,10 +47,7 @@ def create_app():
     # Set up OpenAPI validation: wrap middleware around the inner WSGI app
     # Connexion only speaks ASGI, so need to add 2 more onion layers for that
     asgi_app = WSGIMiddleware(app.wsgi_app)
-    connexion_app = ConnexionMiddleware(asgi_app)
-    connexion_app.add_api("api/openapi.yaml",
-                          strict_validation=True,
-                          validate_responses=True)
+    connexion_app = add_openapi_validation(asgi_app)
     new_wsgi_app = ASGIMiddleware(connexion_app)
     app.wsgi_app = new_wsgi_app
 
@@ -55,15 +56,117 @@ def create_app():
     return app
 
 
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider, with (de)serializing done by json_codec."""
+
+    def dumps(self, obj, **kwargs) -> str:
+        if kwargs:
+            # Pretty printing etc. is left to the json module
+            return super().dumps(obj, **kwargs)
+        return json_codec.dumps(obj, sort_keys=self.sort_keys, default=self.default)
+
+    def loads(self, s: str | bytes, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return json_codec.loads(s)
+
+    def response(self, *args, **kwargs):
+        if self.compact is False or (self.compact is None and self._app.debug):
+            # Pretty printed in debug mode
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        body = json_codec.dumps_bytes(obj, sort_keys=self.sort_keys, default=self.default) + b"\n"
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def create_flask_app() -> Flask:
+    """Create the Flask app with its routes and database, but no WebSocket server."""
+    app = Flask(__name__)
+    app.json = FastJSONProvider(app)
+    CORS(app, resources={r"/api/*": {"origins": "*"}})
+
+    # Register blueprint with routes
+    app.register_blueprint(main)
+
+    # Initialize database
+    app.db = create_database()
+    # Requests per artist, for the cache warmer
+    app.popularity = PopularityTracker()
+    # Stored artists, for search suggestions
+    artist_index.load(app.db)
+
+    return app
+
+
+def start_cache_warmer(app: Flask) -> None:
+    """Start warming popular artists in the background, if configured (see cache_warmer.py)."""
+    app.warmer = CacheWarmer(app.popularity, app.db, app.wss)
+    app.warmer.start()
+
+
+def add_openapi_validation(asgi_app, **kwargs) -> ConnexionMiddleware:
+    """Wrap an ASGI app in Connexion, which validates requests and responses against our OpenAPI spec.
+    How thoroughly is configured in validation.py.
+    Extra keyword args are passed on to ConnexionMiddleware."""
+    connexion_app = ConnexionMiddleware(asgi_app, **kwargs)
+    connexion_app.add_api(validation.load_spec(), **validation.api_options())
+    return connexion_app
+
+
 # Create a blueprint
 main = Blueprint('main', __name__)
 
 # Define routes
+@main.route("/api/artists/suggest")
+def suggest_artists():
+    return artists.suggest_artists()
+
+
 @main.route("/api/artists/<path:artist_name>")
 def get_artist(artist_name: str):
     return artists.query_artist(artist_name)
 
 
+@main.route("/api/artists/<artist_mbid>/stats")
+def get_artist_stats(artist_mbid: str):
+    return artists.get_artist_stats(artist_mbid)
+
+
+@main.route("/api/artists/<artist_mbid>/tours")
+def get_artist_tours(artist_mbid: str):
+    return artists.get_artist_tours(artist_mbid)
+
+
+@main.route("/api/artists/<artist_mbid>/songs")
+def get_top_songs(artist_mbid: str):
+    return songs.top_songs(artist_mbid)
+
+
+@main.route("/api/artists/<artist_mbid>/songs/plays")
+def get_song_plays(artist_mbid: str):
+    return songs.song_plays(artist_mbid)
+
+
 @main.route("/api/setlists/<path:artist_mbid>")
 def get_setlists(artist_mbid: str):
     return artists.get_artist_setlists(artist_mbid)
+
+
+@main.route("/api/export/<artist_mbid>")
+def export_setlists(artist_mbid: str):
+    return export.export_setlists(artist_mbid, request.args.get("format", "ndjson"))
+
+
+@main.route("/api/clusters/<artist_mbid>")
+def get_clusters(artist_mbid: str):
+    return artists.get_artist_clusters(artist_mbid, int(request.args.get("zoom", 4)))
+
+
+@main.route("/api/concerts/near")
+def get_concerts_near():
+    return concerts.concerts_near()
+
+
+@main.route("/api/concerts/venue")
+def get_concerts_at_venue():
+    return concerts.concerts_at_venue()
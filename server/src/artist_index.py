@@ -0,0 +1,190 @@
+# artist_index.py
+# Artist suggestions as the user types, from the artists already stored, without calling setlist.fm.
+#
+# SuggestIndex holds every stored artist's name in memory, in two forms:
+#   keys: a sorted list with one entry per word of each name ("boys go to jupiter", "go to jupiter", ...),
+#         so names starting with the query, or with a word starting with it, are found by binary search
+#   trigrams: 3-letter pieces of each name, for queries that match no word's start (typos, missing spaces)
+# Names are compared lowercased and without accents, so "beyonce" finds "Beyoncé".
+# Matches rank by how they matched (start of the name, start of a word, then trigrams), then by how
+# popular the artist is (see cache_warmer.PopularityTracker).
+#
+# The index is loaded from the database when the app starts, and Fetchers add each artist they insert.
+
+from bisect import bisect_left, insort
+from collections import Counter
+from threading import Lock, Thread
+from typing import TYPE_CHECKING, Iterable
+from database import Database
+import heapq
+import logging
+import math
+import re
+import time
+import unicodedata
+
+if TYPE_CHECKING:  # pragma: no cover
+    from cache_warmer import PopularityTracker
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LIMIT = 8
+MAX_LIMIT = 20
+# Prefix matches looked at per query, so short queries ("a") stay as quick as long ones
+MAX_PREFIX_CANDIDATES = 200
+# Share of the query's trigrams a name needs to be suggested for it
+MIN_TRIGRAM_SHARE = 0.5
+# Name stored when an artist's name couldn't be looked up
+UNKNOWN_NAME = "??"
+
+_WORD = re.compile(r"\w+")
+
+# How a name matched, best first
+NAME_PREFIX, WORD_PREFIX, TRIGRAMS = 0, 1, 2
+
+
+def normalize(text: str) -> list[str]:
+    """The words of a name or query, lowercased and without accents."""
+    text = unicodedata.normalize("NFKD", text.casefold())
+    return _WORD.findall("".join(char for char in text if not unicodedata.combining(char)))
+
+
+def _keys(words: list[str]) -> list[tuple[str, int]]:
+    """Index keys of a name, each with the position of its first word."""
+    keys = [(" ".join(words[position:]), position) for position in range(len(words))]
+    if len(words) > 1:
+        # "acdc" for "AC/DC"
+        keys.append(("".join(words), 0))
+    return keys
+
+
+def _trigrams(words: list[str]) -> set[str]:
+    text = f" {' '.join(words)} "
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class SuggestIndex:
+    def __init__(self):
+        self._names: dict[str, str] = {}
+        # (key, position of its first word in the name, mbid), sorted
+        self._keys: list[tuple[str, int, str]] = []
+        self._trigrams: dict[str, set[str]] = {}
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def add(self, mbid: str, name: str | None) -> None:
+        """Add an artist, or update their name."""
+        words = normalize(name) if name and name != UNKNOWN_NAME else []
+        if len(words) == 0:
+            return
+        with self._lock:
+            if self._names.get(mbid) == name:
+                return
+            self._remove(mbid)
+            self._names[mbid] = name
+            for key, position in _keys(words):
+                insort(self._keys, (key, position, mbid))
+            self._add_trigrams(mbid, words)
+
+    def add_many(self, artists: Iterable[tuple[str, str | None]]) -> None:
+        """Add many (mbid, name) at once. Sorts once at the end instead of inserting each key in place."""
+        # mbid -> (name, words). An artist listed twice gets their last name
+        added: dict[str, tuple[str, list[str]]] = {}
+        for mbid, name in artists:
+            words = normalize(name) if name and name != UNKNOWN_NAME else []
+            if len(words) > 0:
+                added[mbid] = (name, words)
+        with self._lock:
+            added = {mbid: added[mbid] for mbid in added if self._names.get(mbid) != added[mbid][0]}
+            # Old names come out first: _remove binary-searches _keys, so it has to still be sorted
+            for mbid in added:
+                self._remove(mbid)
+            for mbid, (name, words) in added.items():
+                self._names[mbid] = name
+                self._keys.extend((key, position, mbid) for key, position in _keys(words))
+                self._add_trigrams(mbid, words)
+            self._keys.sort()
+
+    def _add_trigrams(self, mbid: str, words: list[str]) -> None:
+        for gram in _trigrams(words):
+            self._trigrams.setdefault(gram, set()).add(mbid)
+
+    def _remove(self, mbid: str) -> None:
+        # Caller holds the lock
+        name = self._names.pop(mbid, None)
+        if name is None:
+            return
+        words = normalize(name)
+        for key, position in _keys(words):
+            index = bisect_left(self._keys, (key, position, mbid))
+            if index < len(self._keys) and self._keys[index] == (key, position, mbid):
+                del self._keys[index]
+        for gram in _trigrams(words):
+            self._trigrams.get(gram, set()).discard(mbid)
+
+    def suggest(self, query: str, limit: int = DEFAULT_LIMIT,
+                popularity: 'PopularityTracker | None' = None) -> list[dict]:
+        """Artists matching a partial name, best first.
+        Returns:
+            Up to `limit` of {"mbid", "name"}.
+        """
+        words = normalize(query)
+        if len(words) == 0:
+            return []
+        prefix = " ".join(words)
+
+        # mbid -> (how it matched, share of trigrams in common)
+        matches: dict[str, tuple[int, float]] = {}
+        with self._lock:
+            start = bisect_left(self._keys, (prefix,))
+            for index in range(start, min(start + MAX_PREFIX_CANDIDATES, len(self._keys))):
+                key, position, mbid = self._keys[index]
+                if not key.startswith(prefix):
+                    break
+                match = (NAME_PREFIX if position == 0 else WORD_PREFIX, 1.0)
+                if match < matches.get(mbid, (TRIGRAMS, 0)):
+                    matches[mbid] = match
+
+            if len(matches) < limit and len(prefix) >= 3:
+                grams = _trigrams(words)
+                needed = math.ceil(len(grams) * MIN_TRIGRAM_SHARE)
+                # Rarest first. A name with `needed` of the grams has at least one of the rarest
+                # len(grams) - needed + 1, so only those are walked; common grams ("the") are only looked up
+                postings = sorted((self._trigrams.get(gram, set()) for gram in grams), key=len)
+                rare, common = postings[:len(grams) - needed + 1], postings[len(grams) - needed + 1:]
+                shared = Counter()
+                for mbids in rare:
+                    shared.update(mbids)
+                for mbid, count in shared.items():
+                    if count + len(common) < needed or mbid in matches:
+                        continue
+                    count += sum(1 for mbids in common if mbid in mbids)
+                    if count >= needed:
+                        matches[mbid] = (TRIGRAMS, count / len(grams))
+
+            names = {mbid: self._names[mbid] for mbid in matches}
+
+        now = time.time()
+
+        def rank(mbid: str) -> tuple:
+            match, similarity = matches[mbid]
+            score = popularity.score(mbid, now) if popularity is not None else 0
+            return match, -similarity, -score, len(names[mbid]), names[mbid]
+
+        return [{"mbid": mbid, "name": names[mbid]} for mbid in heapq.nsmallest(limit, matches, key=rank)]
+
+
+# Shared by the request handlers and Fetchers, like the channels in wss.py
+index = SuggestIndex()
+
+
+def load(db: Database) -> None:
+    """Add every stored artist to the index, in the background."""
+    def run():
+        start = time.perf_counter()
+        index.add_many(db.get_artist_names())
+        logger.info(f"Indexed {len(index)} artist names in {time.perf_counter() - start:.2f} s")
+    Thread(target=run, daemon=True).start()
+
@@ -4,9 +4,17 @@
 from flask import Response, jsonify
 from requests import HTTPError
 from setlistfm_api import SetlistFmAPI
+from circuit_breaker import CircuitOpenError
 from fetcher import Fetcher
-from flask import current_app
+from flask import current_app, request
 from image_api import get_artist_image_url
+from map_layout import cluster_setlists, MAX_ZOOM
+from stats import ArtistStats
+import admission
+import artist_index
+import circuit_breaker
+import math
+import tours
 
 setlistfm = SetlistFmAPI()
 
@@ -16,18 +24,35 @@ def create_error_response(msg: str, code: int) -> tuple[Response, int]:
     return jsonify(error=msg), code
 
 
+def create_unavailable_response(msg: str, retry_after_s: float) -> tuple[Response, int]:
+    response, code = create_error_response(msg, 503)
+    response.headers["Retry-After"] = str(max(1, math.ceil(retry_after_s)))
+    return response, code
+
+
 def query_artist(name: str):
     """Looks up an artist by name.
     Args:
         name: Artist name
     Returns:
         A dictionary with info for a single artist.
+        A 503 if too many lookups are already waiting on upstream APIs for too long, or setlist.fm is down.
     """
+    # Lookups call setlist.fm and Spotify while the user waits, so only so many run at once
+    with admission.upstream_limiter.enqueue() as ticket:
+        if not ticket.wait(admission.UPSTREAM_QUEUE_TIMEOUT_S):
+            return create_unavailable_response("The server is busy. Please try again shortly", ticket.estimated_wait_s)
+        return _query_artist(name)
+
+
+def _query_artist(name: str):
     # Search for artist, get MBID
     try:
         artist_response = setlistfm.search_artist(name)
         # Naively assume the first artist is the one we want
         artist = artist_response["artist"][0]
+    except CircuitOpenError as e:
+        return create_unavailable_response("setlist.fm is unavailable. Please try again later", e.breaker.retry_after_s)
     except HTTPError:
         # woops
         return create_error_response("Error searching for artist. Please try again", 500)
@@ -47,13 +72,50 @@ def query_artist(name: str):
     }
 
 
+def suggest_artists():
+    """Suggests stored artists whose names match what the user has typed so far (the `q` query parameter),
+    from the local artist index (see artist_index.py). Never calls upstream APIs.
+    Returns:
+        dict: The query and the matching artists, best first.
+    """
+    query = request.args.get("q", "")
+    try:
+        limit = int(request.args.get("limit", artist_index.DEFAULT_LIMIT))
+        if not 1 <= limit <= artist_index.MAX_LIMIT:
+            raise ValueError(f"limit must be between 1 and {artist_index.MAX_LIMIT}")
+    except ValueError as e:
+        return create_error_response(f"Invalid query: {e}", 400)
+
+    return {
+        "query": query,
+        "artists": artist_index.index.suggest(query, limit, current_app.popularity)
+    }
+
+
 def get_artist_setlists(mbid: str):
     """Initiates the fetching of setlists for an artist.
     Args:
         mbid: Artist MBID
     Returns:
         dict: A dictionary indicating that the websocket channel is ready.
+        A 503 if setlist.fm is down and the artist has no stored setlists to fall back on.
     """
+    # Count the request, so popular artists can be kept fresh in the background
+    current_app.popularity.record(mbid)
+
+    # While setlist.fm is down, stored artists are served as they are (see Fetcher.stale). Others have to wait
+    if circuit_breaker.setlistfm.is_open and not current_app.db.check_artist(mbid)[0]:
+        return create_unavailable_response(
+            "setlist.fm is unavailable. Please try again later", circuit_breaker.setlistfm.retry_after_s
+        )
+
+    # Fetched moments ago: the client can replay that channel instead
+    if current_app.wss.has_replay(mbid):
+        return {
+            "mbid": mbid,
+            "wssReady": True
+        }
+
     # Create a Fetcher instance for this artist that will fetch and stream setlists.
     # Need to pull the WebSocketServer and Database out of the app context because
     # the Fetcher will run in its own thread, which can't access app context
@@ -67,3 +129,75 @@ def get_artist_setlists(mbid: str):
         "mbid": mbid,
         "wssReady": True
     }
+
+
+def get_artist_stats(mbid: str):
+    """Gets the stats of an artist's stored setlists (see stats.py).
+    Args:
+        mbid: Artist MBID
+    Returns:
+        dict: The stats. While a fetch is running, they cover the setlists stored so far.
+    """
+    stats = current_app.db.get_stats(mbid)
+    if stats is not None:
+        return stats
+
+    exists, in_progress, _ = current_app.db.check_artist(mbid)
+    if not exists:
+        return create_error_response("No setlists stored for this artist", 404)
+
+    # Stored without stats (e.g. bulk-loaded): count them once, and keep the result for next time.
+    # A running fetch saves its own stats soon enough, so those aren't stored
+    stats = ArtistStats.from_setlists(mbid, current_app.db.iter_setlists(mbid)).to_document(complete=not in_progress)
+    if not in_progress:
+        current_app.db.save_stats(mbid, stats)
+    return stats
+
+
+def get_artist_tours(mbid: str):
+    """Gets an artist's tours: runs of shows without long breaks, with the distance travelled (see tours.py).
+    Args:
+        mbid: Artist MBID
+    Returns:
+        dict: The tours, newest first, and the number of shows on none. Each tour lists every move
+              from one city to the next if the `legs` query parameter is true.
+    """
+    exists, in_progress, _ = current_app.db.check_artist(mbid)
+    if not exists:
+        return create_error_response("No setlists stored for this artist", 404)
+
+    # Fetchers keep the cached tracker up to date. It falls behind only if setlists are stored some other
+    # way (e.g. ingest.py), which the stored stats would show
+    tracker = tours.cached(mbid)
+    stats = current_app.db.get_stats(mbid)
+    if tracker is None or (stats is not None and stats["totalSetlists"] != tracker.seen):
+        tracker = tours.build(mbid, current_app.db.iter_setlists(mbid))
+
+    return {
+        "mbid": mbid,
+        "complete": not in_progress,
+        "tourGapDays": tours.TOUR_GAP_DAYS,
+        "oneOffShows": tracker.one_off_shows(),
+        "tours": tracker.tours(with_legs=request.args.get("legs", "false").lower() == "true")
+    }
+
+
+def get_artist_clusters(mbid: str, zoom: int):
+    """Groups an artist's stored setlists into clusters, for drawing them at a low zoom level.
+    Args:
+        mbid: Artist MBID
+        zoom: Map zoom level
+    Returns:
+        dict: The clusters, biggest first.
+    """
+    if not 0 <= zoom <= MAX_ZOOM:
+        return create_error_response(f"zoom must be between 0 and {MAX_ZOOM}", 400)
+    if not current_app.db.check_artist(mbid)[0]:
+        return create_error_response("No setlists stored for this artist", 404)
+
+    # Setlists are read one at a time; only the per-city totals are kept
+    return {
+        "mbid": mbid,
+        "zoom": zoom,
+        "clusters": cluster_setlists(current_app.db.iter_setlists(mbid), zoom)
+    }
@@ -0,0 +1,139 @@
+# asgi.py
+# ASGI deployment: serves the REST API and the setlist WebSocket channels from one event loop, on one port.
+#
+# Run with an ASGI server, e.g. `uvicorn asgi:create_asgi_app --factory --port 8000`
+# Clients then connect to the WebSocket at ws://<host>:8000/ws?mbid=...
+
+import asyncio
+import contextlib
+from a2wsgi import WSGIMiddleware
+from app import create_flask_app, add_openapi_validation, start_cache_warmer
+from wss import WebSocketServer, check_ip, check_mbid
+
+WEBSOCKET_PATH = "/ws"
+
+# Sentinel put in a connection's outbox to ask the writer to close the socket
+_CLOSE = object()
+
+# send() waits for the outbox to empty once it holds more frames than this, the way websockets waits
+# for its send buffer to drain. Frames queued from other threads (broadcasts) never wait
+OUTBOX_HIGH_WATER = 4
+
+
+class AsgiConnection:
+    """A WebSocket accepted by the ASGI server, exposing the parts of
+    websockets.ServerConnection that WebSocketServer relies on."""
+
+    def __init__(self, mbid: str, receive, send, client_ip: str | None = None) -> None:
+        self.mbid = mbid
+        self.client_ip = client_ip
+        self._receive = receive
+        self._send = send
+        self.loop = asyncio.get_running_loop()
+        # All outgoing frames go through one queue so they are written in order,
+        # whether they come from this loop or from a Fetcher thread.
+        self._outbox: asyncio.Queue = asyncio.Queue()
+        self._writer = self.loop.create_task(self._write_outbox())
+        self._closed = asyncio.Event()
+
+    async def _write_outbox(self) -> None:
+        while True:
+            message = await self._outbox.get()
+            if message is _CLOSE:
+                await self._send({"type": "websocket.close", "code": 1000})
+                return
+            await self._send({"type": "websocket.send", "text": message})
+            self._outbox.task_done()
+
+    async def send(self, message: str | bytes, text: bool | None = None) -> None:
+        # Only text frames are sent, and ASGI wants those as str
+        if isinstance(message, bytes):
+            message = message.decode("utf-8")
+        self._outbox.put_nowait(message)
+        if self._outbox.qsize() > OUTBOX_HIGH_WATER:
+            await self.drain()
+
+    async def drain(self) -> None:
+        """Wait until every queued frame is written, or the client disconnects."""
+        if self._closed.is_set():
+            return
+        written = asyncio.ensure_future(self._outbox.join())
+        closed = asyncio.ensure_future(self._closed.wait())
+        await asyncio.wait([written, closed], return_when=asyncio.FIRST_COMPLETED)
+        written.cancel()
+        closed.cancel()
+
+    def send_threadsafe(self, message: str) -> None:
+        """Queue a message from any thread."""
+        if not self._closed.is_set():
+            self.loop.call_soon_threadsafe(self._outbox.put_nowait, message)
+
+    async def close(self) -> None:
+        self._outbox.put_nowait(_CLOSE)
+
+    async def wait_closed(self) -> None:
+        """Consume incoming messages until the client disconnects."""
+        while True:
+            message = await self._receive()
+            if message["type"] == "websocket.disconnect":
+                break
+        self._closed.set()
+        self._writer.cancel()
+
+
+def create_asgi_app():
+    """Application factory for ASGI servers.
+    REST routes still go to the Flask app (its handlers make blocking upstream calls, so they
+    run in a worker thread), but validation and WebSockets run natively on the server's event loop."""
+    flask_app = create_flask_app()
+    wss = WebSocketServer(None, flask_app.db)
+    flask_app.wss = wss
+    start_cache_warmer(flask_app)
+    rest_app = WSGIMiddleware(flask_app.wsgi_app)
+
+    async def handle_websocket(scope, receive, send) -> None:
+        if scope["path"] != WEBSOCKET_PATH:
+            await send({"type": "websocket.close", "code": 1008})
+            return
+
+        # Wait for the handshake to start before deciding whether to accept
+        await receive()
+        client_ip = scope["client"][0] if scope.get("client") else None
+        mbid, error = check_mbid(scope["query_string"].decode())
+        status = 401
+        if error is None:
+            error = check_ip(client_ip)
+            status = 429
+        if error is not None:
+            if "websocket.http.response" in scope.get("extensions", {}):
+                # Match the standalone server, which refuses with HTTP 401 (or 429 for too many connections)
+                await send({"type": "websocket.http.response.start", "status": status,
+                            "headers": [(b"content-type", b"text/plain; charset=utf-8")]})
+                await send({"type": "websocket.http.response.body", "body": error.encode()})
+            else:
+                await send({"type": "websocket.close", "code": 1008})
+            return
+
+        await send({"type": "websocket.accept"})
+        if wss.loop is None:
+            # Not all servers run the lifespan protocol
+            wss.loop = asyncio.get_running_loop()
+            wss.start_reaper()
+        await wss.handle_connection(AsgiConnection(mbid, receive, send, client_ip))
+
+    async def inner_app(scope, receive, send) -> None:
+        if scope["type"] == "websocket":
+            await handle_websocket(scope, receive, send)
+        else:
+            await rest_app(scope, receive, send)
+
+    @contextlib.asynccontextmanager
+    async def lifespan(_app):
+        # Fetcher threads need a handle to this loop to close connections
+        wss.loop = asyncio.get_running_loop()
+        wss.start_reaper()
+        flask_app.logger.info("App started (ASGI)")
+        yield
+        wss.stop_reaper()
+
+    return add_openapi_validation(inner_app, lifespan=lifespan)
@@ -0,0 +1,188 @@
+# cache_warmer.py
+# Keeps popular artists' setlists stored and fresh, so users requesting them don't wait on setlist.fm.
+#
+# PopularityTracker counts setlist requests per artist. During off-peak hours, CacheWarmer goes through
+# the most requested and the trending artists, and fetches any that aren't stored or have gone stale
+# (new artists get a full fetch, stored ones only append new setlists, just like a user request).
+# Warming fetches use at most a share of the setlist.fm API budget.
+#
+# Config:
+#   CACHE_WARM_HOURS: off-peak hours as "start-end", e.g. "2-7" (end exclusive, may wrap past midnight).
+#                     Warming is off unless this is set.
+#   CACHE_WARM_TZ: time zone of those hours (default America/Los_Angeles, same as the logs)
+#   CACHE_WARM_BUDGET_SHARE: share of the API budget warming may use (default 0.25)
+#   CACHE_WARM_STALE_HOURS: refresh stored artists last updated longer ago than this (default 24)
+
+from threading import Event, Lock, Thread
+from datetime import datetime, timedelta, timezone
+from database import Database
+from fetcher import Fetcher
+from setlistfm_api import BudgetedKeyPool, SetlistFmAPI, key_pool
+from wss import WebSocketServer, fetchers
+import logging
+import math
+import os
+import time
+import pytz
+
+logger = logging.getLogger(__name__)
+
+# Requests to an artist count half as much after this long
+POPULAR_HALF_LIFE_S = 7 * 24 * 3600
+TRENDING_HALF_LIFE_S = 6 * 3600
+# Forget the least requested artists beyond this many
+MAX_TRACKED = 10_000
+# Artists considered from each of the popular and trending rankings
+TOP_N = 50
+# How often the warmer checks for work while idle
+CHECK_INTERVAL_S = 60
+
+
+class PopularityTracker:
+    """Counts requests per artist, with older requests counting less.
+    Two scores are kept: a slowly decaying one for the most requested artists, and a
+    quickly decaying one for artists that are trending right now."""
+
+    def __init__(self):
+        # mbid -> [popular score, trending score, time of last update]
+        self._scores: dict[str, list[float]] = {}
+        self._lock = Lock()
+
+    @staticmethod
+    def _decay(score: float, elapsed: float, half_life: float) -> float:
+        return score * math.pow(0.5, elapsed / half_life)
+
+    def record(self, mbid: str, now: float | None = None) -> None:
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self._scores.get(mbid)
+            if entry is None:
+                self._scores[mbid] = [1.0, 1.0, now]
+            else:
+                elapsed = now - entry[2]
+                entry[0] = self._decay(entry[0], elapsed, POPULAR_HALF_LIFE_S) + 1
+                entry[1] = self._decay(entry[1], elapsed, TRENDING_HALF_LIFE_S) + 1
+                entry[2] = now
+
+            if len(self._scores) > MAX_TRACKED * 1.1:
+                # Drop the least popular artists in one go, rather than one by one
+                keep = sorted(self._scores.items(), key=lambda item: self._popular(item[1], now), reverse=True)
+                self._scores = dict(keep[:MAX_TRACKED])
+
+    def _popular(self, entry: list[float], now: float) -> float:
+        return self._decay(entry[0], now - entry[2], POPULAR_HALF_LIFE_S)
+
+    def _trending(self, entry: list[float], now: float) -> float:
+        return self._decay(entry[1], now - entry[2], TRENDING_HALF_LIFE_S)
+
+    def score(self, mbid: str, now: float | None = None) -> float:
+        """How popular an artist is: their decayed request count, or 0 if they aren't tracked."""
+        now = time.time() if now is None else now
+        entry = self._scores.get(mbid)
+        return self._popular(entry, now) if entry is not None else 0.0
+
+    def candidates(self, n: int = TOP_N, now: float | None = None) -> list[str]:
+        """The top `n` popular and top `n` trending artists, alternating between the two rankings."""
+        now = time.time() if now is None else now
+        with self._lock:
+            items = list(self._scores.items())
+        popular = sorted(items, key=lambda item: self._popular(item[1], now), reverse=True)[:n]
+        trending = sorted(items, key=lambda item: self._trending(item[1], now), reverse=True)[:n]
+
+        ranked = []
+        for pair in zip(popular, trending):
+            for mbid, _ in pair:
+                if mbid not in ranked:
+                    ranked.append(mbid)
+        for mbid, _ in popular[len(trending):] + trending[len(popular):]:
+            if mbid not in ranked:
+                ranked.append(mbid)
+        return ranked
+
+
+def parse_hours(hours: str) -> tuple[int, int] | None:
+    """Parse CACHE_WARM_HOURS ("start-end") into a pair of hours, or None if unset."""
+    if not hours:
+        return None
+    start, end = hours.split("-")
+    return int(start) % 24, int(end) % 24
+
+
+class CacheWarmer:
+    def __init__(self, popularity: PopularityTracker, db: Database, wss: WebSocketServer):
+        self.popularity = popularity
+        self.db = db
+        self.wss = wss
+
+        self.hours = parse_hours(os.getenv("CACHE_WARM_HOURS", ""))
+        self.tz = pytz.timezone(os.getenv("CACHE_WARM_TZ", "America/Los_Angeles"))
+        self.stale_after = timedelta(hours=float(os.getenv("CACHE_WARM_STALE_HOURS", 24)))
+        budget_share = float(os.getenv("CACHE_WARM_BUDGET_SHARE", 0.25))
+        # One client for all warming fetches, so they share the budget
+        self.setlistfm = SetlistFmAPI(BudgetedKeyPool(key_pool, budget_share))
+
+        self._stop = Event()
+        self._thread = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.hours is not None
+
+    def start(self) -> None:
+        if not self.enabled:
+            return
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+        logger.info(f"Cache warming enabled for hours {self.hours[0]}-{self.hours[1]} ({self.tz})")
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def is_off_peak(self, now: datetime | None = None) -> bool:
+        if self.hours is None:
+            return False
+        hour = (now or datetime.now(tz=timezone.utc)).astimezone(self.tz).hour
+        start, end = self.hours
+        if start <= end:
+            return start <= hour < end
+        # Wraps past midnight
+        return hour >= start or hour < end
+
+    def needs_warming(self, mbid: str) -> bool:
+        # Users' fetches (or a previous warming fetch) may still be running
+        if mbid in fetchers:
+            return False
+        exists, in_progress, last_updated = self.db.check_artist(mbid)
+        if not exists:
+            return True
+        return not in_progress and datetime.now(tz=timezone.utc) - last_updated > self.stale_after
+
+    def next_artist(self) -> str | None:
+        """The most requested or trending artist that isn't stored or is stale."""
+        for mbid in self.popularity.candidates():
+            if self.needs_warming(mbid):
+                return mbid
+        return None
+
+    def warm(self, mbid: str) -> None:
+        """Fetch an artist's setlists, returning once the fetch is done."""
+        fetcher = Fetcher(mbid, self.wss, self.db, self.setlistfm)
+        fetcher.start_setlists_fetch()
+        if not self.wss.owns_channel(mbid, fetcher):
+            # Someone else's fetch got there first
+            return
+        logger.info(f"Warming setlists for {fetcher}")
+        # One artist at a time
+        while not fetcher.done_fetching and not self._stop.is_set():
+            self._stop.wait(1)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                mbid = self.next_artist() if self.is_off_peak() else None
+                if mbid is not None:
+                    self.warm(mbid)
+                    continue
+            except Exception as e:
+                logger.error(f"Error while warming cache: {e}")
+            self._stop.wait(CHECK_INTERVAL_S)
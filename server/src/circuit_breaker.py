@@ -0,0 +1,117 @@
+# circuit_breaker.py
+# Fails requests to an upstream API fast while it's down, instead of letting each one go through its
+# retries and backoff (holding a thread the whole time).
+#
+# Each upstream has a breaker that watches its recent request outcomes:
+#   closed: requests go out. Once BREAKER_ERROR_RATE of the last BREAKER_WINDOW failed, it opens
+#   open: requests fail right away with CircuitOpenError, for BREAKER_OPEN_S
+#   half-open: one request at a time goes out as a probe. If it works the breaker closes, if not it opens again
+# Failures are timeouts, connection errors and 5xx responses. Rate limits and 404s say nothing about an outage.
+#
+# Config (all optional):
+#   BREAKER_ERROR_RATE (default 0.5)
+#   BREAKER_WINDOW (default 20)
+#   BREAKER_OPEN_S (default 30)
+
+from collections import deque
+from threading import Lock
+from requests import HTTPError
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+
+ERROR_RATE = float(os.getenv("BREAKER_ERROR_RATE", 0.5))
+WINDOW = int(os.getenv("BREAKER_WINDOW", 20))
+OPEN_S = float(os.getenv("BREAKER_OPEN_S", 30))
+# Don't judge an upstream on its first few requests
+MIN_CALLS = 10
+
+
+class CircuitOpenError(HTTPError):
+    """Raised instead of making a request while the upstream's breaker is open.
+    An HTTPError, so callers that handle failed requests handle this one too."""
+
+    def __init__(self, breaker: 'CircuitBreaker'):
+        super().__init__(f"{breaker.name} is unavailable; retry in {breaker.retry_after_s:.0f} s")
+        self.breaker = breaker
+
+
+def is_failure(status_code: int) -> bool:
+    return status_code >= 500
+
+
+class CircuitBreaker:
+    def __init__(self, name: str):
+        self.name = name
+        self.state = CLOSED
+        # True for each recent success, False for each failure
+        self._outcomes: deque[bool] = deque(maxlen=WINDOW)
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = Lock()
+
+    def __repr__(self) -> str:
+        return f"CircuitBreaker('{self.name}', {self.state})"
+
+    @property
+    def is_open(self) -> bool:
+        """Whether requests are being turned away right now. Not while half-open, when a probe may go."""
+        return self.state == OPEN and time.monotonic() - self._opened_at < OPEN_S
+
+    @property
+    def retry_after_s(self) -> float:
+        """Time until the next probe may go out."""
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, OPEN_S - (time.monotonic() - self._opened_at))
+
+    def allow(self) -> bool:
+        """Whether a request may go out now. Each allowed request should be followed by record()."""
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self._opened_at < OPEN_S:
+                    return False
+                self.state = HALF_OPEN
+                logger.info(f"Probing {self.name}")
+            if self.state == HALF_OPEN:
+                if self._probing:
+                    return False
+                self._probing = True
+            return True
+
+    def check(self) -> None:
+        """Like allow(), but raises CircuitOpenError if not allowed."""
+        if not self.allow():
+            raise CircuitOpenError(self)
+
+    def record(self, success: bool) -> None:
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probing = False
+                if success:
+                    logger.info(f"{self.name} is back")
+                    self.state = CLOSED
+                    self._outcomes.clear()
+                else:
+                    self._open()
+                return
+
+            self._outcomes.append(success)
+            failures = self._outcomes.count(False)
+            if self.state == CLOSED and len(self._outcomes) >= MIN_CALLS and failures >= ERROR_RATE * len(self._outcomes):
+                logger.warning(f"{self.name} failed {failures} of the last {len(self._outcomes)} requests")
+                self._open()
+
+    def _open(self) -> None:
+        # Caller holds the lock
+        self.state = OPEN
+        self._opened_at = time.monotonic()
+        logger.warning(f"Failing requests to {self.name} fast for {OPEN_S:.0f} s")
+
+
+setlistfm = CircuitBreaker("setlist.fm")
+spotify = CircuitBreaker("Spotify")
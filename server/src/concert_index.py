@@ -0,0 +1,72 @@
+# concert_index.py
+# Helpers shared by the database engines' concert indexes, which find setlists across all artists
+# by location, venue and city (see Database.find_concerts).
+
+from database import ConcertDocument, ConcertQuery, SetlistDocument
+import math
+
+EARTH_RADIUS_KM = 6371.0
+# Kilometers per degree of latitude
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+def is_indexed(setlist: SetlistDocument) -> bool:
+    """Only setlists with a date and a location go in the index."""
+    return bool(setlist.get("isValid")) and setlist.get("eventDate") is not None \
+        and setlist.get("cityLat") is not None and setlist.get("cityLong") is not None
+
+
+def match_key(name: str | None) -> str | None:
+    """Venue and city names are looked up by this key, so "The  Showbox" finds "the showbox"."""
+    if name is None:
+        return None
+    return " ".join(name.split()).casefold()
+
+
+def distance_km(lat1: float, long1: float, lat2: float, long2: float) -> float:
+    """Great-circle distance (haversine)."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(long2 - long1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bounding_box(lat: float, long: float, radius_km: float) -> tuple[float, float, float, float]:
+    """(min_lat, max_lat, min_long, max_long) of a box containing the circle around (lat, long).
+    Near the poles, or if the circle crosses the antimeridian, the box spans all longitudes."""
+    d_lat = radius_km / KM_PER_DEGREE
+    min_lat, max_lat = max(-90.0, lat - d_lat), min(90.0, lat + d_lat)
+    if min_lat <= -90 or max_lat >= 90:
+        return min_lat, max_lat, -180.0, 180.0
+    # Longitude degrees shrink away from the equator; use the widest point of the circle
+    d_long = d_lat / math.cos(math.radians(max(abs(min_lat), abs(max_lat))))
+    if long - d_long < -180 or long + d_long > 180:
+        return min_lat, max_lat, -180.0, 180.0
+    return min_lat, max_lat, long - d_long, long + d_long
+
+
+def matches(query: ConcertQuery, setlist: SetlistDocument) -> bool:
+    """Whether an indexed setlist passes the query's filters. Engines that can't filter everything
+    in the index itself use this on the candidates it returns."""
+    date = setlist["eventDate"]
+    if query.date_from is not None and date < query.date_from:
+        return False
+    if query.date_to is not None and date > query.date_to:
+        return False
+    if query.venue is not None and match_key(setlist.get("venueName")) != match_key(query.venue):
+        return False
+    if query.city is not None and match_key(setlist.get("cityName")) != match_key(query.city):
+        return False
+    if query.lat is not None:
+        distance = distance_km(query.lat, query.long, setlist["cityLat"], setlist["cityLong"])
+        if distance > query.radius_km:
+            return False
+    return True
+
+
+def make_concert(setlist: SetlistDocument, concert_id, mbid: str, name: str, query: ConcertQuery) -> ConcertDocument:
+    concert = ConcertDocument(**setlist, concertId=str(concert_id), artistMbid=mbid, artistName=name)
+    if query.lat is not None:
+        concert["distanceKm"] = round(distance_km(query.lat, query.long, setlist["cityLat"], setlist["cityLong"]), 2)
+    return concert
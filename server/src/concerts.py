@@ -0,0 +1,82 @@
+# concerts.py
+# Queries across all stored artists' setlists, answered by the database's concert index.
+#
+# Results come a page at a time, newest first. Each page has a `next` cursor; passing it back as `cursor`
+# gets the following page. Cursors point just past the last concert seen, so pages stay cheap however deep
+# they go, and concerts stored in the meantime don't shift later pages.
+
+from flask import current_app, request
+from artists import create_error_response
+from database import ConcertQuery
+
+DEFAULT_RADIUS_KM = 50
+DEFAULT_LIMIT = 50
+
+
+def _parse_cursor(cursor: str | None) -> tuple[str, str] | None:
+    if not cursor:
+        return None
+    event_date, _, concert_id = cursor.partition("_")
+    if not event_date or not concert_id:
+        raise ValueError(f"Invalid cursor '{cursor}'")
+    return event_date, concert_id
+
+
+def _page(query: ConcertQuery):
+    try:
+        concerts = current_app.db.find_concerts(query)
+    except ValueError as e:
+        # The cursor is well-formed, but not one the database could have handed out
+        return create_error_response(f"Invalid query: {e}", 400)
+    # A full page may have more after it
+    next_cursor = None
+    if len(concerts) == query.limit:
+        last = concerts[-1]
+        next_cursor = f"{last['eventDate']}_{last['concertId']}"
+    return {
+        "concerts": concerts,
+        "next": next_cursor
+    }
+
+
+def _base_query() -> ConcertQuery:
+    """The query parameters shared by all concert queries: dates and paging."""
+    return ConcertQuery(
+        date_from=request.args.get("from"),
+        date_to=request.args.get("to"),
+        limit=int(request.args.get("limit", DEFAULT_LIMIT)),
+        after=_parse_cursor(request.args.get("cursor"))
+    )
+
+
+def concerts_near():
+    """Finds concerts by any stored artist within a radius of a point.
+    Returns:
+        A page of concerts, newest first, each with its artist and distance from the point.
+    """
+    try:
+        query = _base_query()
+        query.lat = float(request.args["lat"])
+        query.long = float(request.args["long"])
+        query.radius_km = float(request.args.get("radiusKm", DEFAULT_RADIUS_KM))
+    except (KeyError, ValueError) as e:
+        return create_error_response(f"Invalid query: {e}", 400)
+
+    return _page(query)
+
+
+def concerts_at_venue():
+    """Finds concerts by any stored artist at a venue, in a city, or both.
+    Returns:
+        A page of concerts, newest first, each with its artist.
+    """
+    try:
+        query = _base_query()
+    except ValueError as e:
+        return create_error_response(f"Invalid query: {e}", 400)
+    query.venue = request.args.get("venue")
+    query.city = request.args.get("city")
+    if query.venue is None and query.city is None:
+        return create_error_response("Either venue or city is required", 400)
+
+    return _page(query)
@@ -1,16 +1,16 @@
 # database.py
 # Interface for storing artist setlists in the database and retrieving them.
-
-from pymongo import MongoClient
-from pymongo.collection import Collection
-from typing import TypedDict
-from setlist import Setlist
+# The storage engine is chosen by the DB_BACKEND env variable:
+#   mongo (default): MongoDB server, see mongo_database.py
+#   sqlite: embedded SQLite file, see sqlite_database.py
+#   memory: plain Python objects, lost on restart. See memory_database.py
+
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import Iterator, NotRequired, TypedDict
 import datetime
-import logging
 import os
 
-logger = logging.getLogger(__name__)
-
 
 class SetlistDocument(TypedDict):
     isValid: bool
@@ -23,6 +23,8 @@ class SetlistDocument(TypedDict):
     countryName: str
     setlistUrl: str
     songsPerformed: int
+    # Titles of the songs played, in order. Missing from setlists stored before titles were kept
+    songs: NotRequired[list[str]]
 
 
 class ArtistDocument(TypedDict):
@@ -31,50 +33,106 @@ class ArtistDocument(TypedDict):
     lastUpdated: datetime.datetime
     inProgress: bool
     setlists: list[SetlistDocument]
+    stats: NotRequired['ArtistStatsDocument']
+
+
+class ConcertDocument(SetlistDocument):
+    """A stored setlist found by find_concerts, along with its artist."""
+    # Identifies the setlist within the concert index
+    concertId: str
+    artistMbid: str
+    artistName: str
+    # Only for queries by location
+    distanceKm: NotRequired[float]
+
+
+class SongCount(TypedDict):
+    song: str
+    # Shows the song was played at
+    plays: int
+
+
+class CountryShows(TypedDict):
+    country: str
+    shows: int
+
+
+class ArtistStatsDocument(TypedDict):
+    """Summary of an artist's setlists, see stats.py."""
+    mbid: str
+    # False while setlists are still being fetched
+    complete: bool
+    totalSetlists: int
+    validSetlists: int
+    firstShow: str | None
+    lastShow: str | None
+    # Year -> valid setlists that year
+    showsPerYear: dict[str, int]
+    # Most shows first
+    countries: list[CountryShows]
+    countriesVisited: int
+    songsPerformed: int
+    showsWithSongs: int
+    averageSongsPerShow: float | None
+
+
+@dataclass
+class ConcertQuery:
+    """Filters for Database.find_concerts. Any combination can be used.
+    Only valid setlists (which have a date and a location) are found, newest first."""
+    # Within radius_km of (lat, long)
+    lat: float | None = None
+    long: float | None = None
+    radius_km: float | None = None
+    # Venue and city names, matched ignoring case and extra spaces
+    venue: str | None = None
+    city: str | None = None
+    # ISO dates, inclusive
+    date_from: str | None = None
+    date_to: str | None = None
+    limit: int = 50
+    # (eventDate, concertId) of the last concert on the previous page, to continue after it
+    after: tuple[str, str] | None = None
+
+
+@dataclass
+class PendingWrites:
+    """Writes for one artist that were buffered instead of applied right away (see write_behind.py)."""
+    mbid: str
+    setlists: list[SetlistDocument] = field(default_factory=list)
+    # Status to leave the artist in: True after reinsert_artist, False after mark_artist_complete,
+    # None if unchanged
+    in_progress: bool | None = None
+    # Latest stats from save_stats, if any
+    stats: ArtistStatsDocument | None = None
+
+
+class WriteBatchError(Exception):
+    """Raised by write_batch when some writes couldn't be applied. Those are in `unapplied`; the rest were."""
 
+    def __init__(self, message: str, unapplied: list[PendingWrites]):
+        super().__init__(message)
+        self.unapplied = unapplied
 
-class Database:
-    def __init__(self):
-        # Short timeout for locating server since this is hosted locally
-        self._client = MongoClient(
-            "mongodb://localhost:27017/",
-            serverSelectionTimeoutMS=200,
-            tz_aware=True
-        )
-        # Force connection attempt
-        self._client.server_info()
 
-        # Keep a handle to the database collection
-        db = self._client[os.getenv("MONGO_DB_NAME")]
-        self._artists: Collection[ArtistDocument] = db["artists"]
+class Database(ABC):
+    """Storage for artists and their setlists.
+    Implementations log errors instead of raising them, and return an empty result on failure."""
 
+    @abstractmethod
     def insert_artist(self, mbid: str, name: str) -> None:
         """Add a new artist to the database."""
-        try:
-            self._artists.insert_one(ArtistDocument(
-                mbid=mbid,
-                name=name,
-                lastUpdated=datetime.datetime.now(tz=datetime.timezone.utc),
-                inProgress=True,
-                setlists=[]
-            ))
-        except Exception as e:
-            logger.error(f"Error inserting new artist '{mbid}': {e}")
 
+    @abstractmethod
+    def get_artist_names(self) -> list[tuple[str, str]]:
+        """Get the (mbid, name) of every stored artist."""
+
+    @abstractmethod
     def reinsert_artist(self, mbid: str) -> None:
         """Revive an artist's inProgress fetch status."""
-        try:
-            self._artists.update_one(
-                {"mbid": mbid},
-                {"$set": {
-                    "inProgress": True,
-                    "lastUpdated": datetime.datetime.now(tz=datetime.timezone.utc)
-                }}
-            )
-        except Exception as e:
-            logger.error(f"Error reinserting artist '{mbid}': {e}")
-
-    def check_artist(self, mbid: str) -> tuple[bool, bool, datetime.datetime]:
+
+    @abstractmethod
+    def check_artist(self, mbid: str) -> tuple[bool, bool, datetime.datetime | None]:
         """Check if an artist is already in the database.
         Returns:
             (exists, inProgress, lastUpdated):
@@ -82,92 +140,103 @@ class Database:
             inProgress is True if their setlists are being fetched.
             lastUpdated is when they were last fetched.
         """
-        try:
-            artist = self._artists.find_one({"mbid": mbid})
-        except Exception as e:
-            logger.error(f"Error checking artist '{mbid}': {e}")
-            return False, False, None
-
-        if artist is not None:
-            return (
-                True,
-                artist["inProgress"],
-                artist["lastUpdated"]
-            )
-
-        return False, False, None
-
-    def insert_setlists(self, mbid: str, new_setlists: list[dict]) -> None:
+
+    @abstractmethod
+    def insert_setlists(self, mbid: str, new_setlists: list[SetlistDocument]) -> None:
         """Insert new setlists for an artist."""
-        try:
-            self._artists.update_one(
-                {"mbid": mbid},
-                {
-                    "$set": {"lastUpdated": datetime.datetime.now(tz=datetime.timezone.utc)},
-                    "$push": {"setlists": {"$each": new_setlists}}
-                }
-            )
-        except Exception as e:
-            logger.error(f"Error inserting new setlists for '{mbid}': {e}")
-
-    def get_all_setlists(self, mbid: str) -> list[Setlist]:
-        """Get all setlists stored in the database for an artist."""
-        try:
-            artist = self._artists.find_one({"mbid": mbid})
-        except Exception as e:
-            logger.error(f"Error retrieving all setlists for '{mbid}': {e}")
-            return []
-
-        # hope the artist was found
-        return artist["setlists"] if artist else []
-
-    def get_last_setlist(self, mbid: str) -> Setlist | None:
+
+    @abstractmethod
+    def get_all_setlists(self, mbid: str) -> list[SetlistDocument]:
+        """Get all setlists stored in the database for an artist, in the order they were inserted."""
+
+    @abstractmethod
+    def get_last_setlist(self, mbid: str) -> SetlistDocument | None:
         """Get the most recent setlist stored for an artist. Returns None if no setlists stored."""
-        pipeline = [
-            {"$match": {"mbid": mbid}},
-            {
-                # Write the last setlist into a new field `lastSetlist`
-                "$set": {
-                    "lastSetlist": {
-                        "$arrayElemAt": [
-                            # Sort by descending eventDate, then take first elem
-                            {"$sortArray": {
-                                "input": "$setlists",
-                                "sortBy": {"eventDate": -1}
-                            }},
-                            0
-                        ]
-                    }
-                }
-            },
-            {"$project": {"_id": 0, "lastSetlist": 1}}
-        ]
-
-        try:
-            result = list(self._artists.aggregate(pipeline))
-        except Exception as e:
-            logger.error(f"Error retrieving last setlist for '{mbid}': {e}")
-            return None
-        last_setlist = result[0]["lastSetlist"] if result else None
-        return last_setlist
 
+    def iter_setlists(self, mbid: str) -> Iterator[SetlistDocument]:
+        """Yield the setlists stored for an artist one at a time, in the order they were inserted.
+        Engines override this to read from a cursor, so even the largest artists aren't loaded whole;
+        by default, it goes through get_all_setlists."""
+        yield from self.get_all_setlists(mbid)
+
+    @abstractmethod
+    def save_stats(self, mbid: str, stats: ArtistStatsDocument) -> None:
+        """Store an artist's stats, replacing any stored before. Does nothing for an unknown artist."""
+
+    @abstractmethod
+    def get_stats(self, mbid: str) -> ArtistStatsDocument | None:
+        """Get an artist's stored stats. Returns None if none are stored."""
+
+    @abstractmethod
+    def find_song_plays(self, mbid: str, song: str, limit: int) -> list[SetlistDocument]:
+        """Find an artist's setlists in which a song was played, newest first, using the song index.
+        The song is matched ignoring case and extra spaces."""
+
+    @abstractmethod
+    def top_songs(self, mbid: str, country: str | None, limit: int) -> list[SongCount]:
+        """Get an artist's most played songs, by the number of shows they were played at, from the song index.
+        Counts shows in one country, or in all of them if country is None."""
+
+    @abstractmethod
+    def find_concerts(self, query: ConcertQuery) -> list[ConcertDocument]:
+        """Find stored setlists across all artists, using the engine's concert index.
+        Returns up to query.limit concerts, newest first (ties broken by concertId, highest first).
+        Raises ValueError if query.after has a concertId this engine couldn't have returned."""
+
+    @abstractmethod
     def mark_artist_complete(self, mbid: str) -> None:
-        try:
-            self._artists.update_one(
-                {"mbid": mbid},
-                {"$set": {
-                    "inProgress": False,
-                    "lastUpdated": datetime.datetime.now(tz=datetime.timezone.utc)
-                }}
-            )
-        except Exception as e:
-            logger.error(f"Error marking artist '{mbid}' as complete: {e}")
+        """Clear an artist's inProgress fetch status."""
 
+    @abstractmethod
     def delete_artist(self, mbid: str) -> None:
-        try:
-            self._artists.delete_one({"mbid": mbid})
-        except Exception as e:
-            logger.error(f"Error deleting artist '{mbid}': {e}")
+        """Delete an artist and all their setlists."""
+
+    def write_batch(self, writes: list[PendingWrites]) -> None:
+        """Apply buffered writes for any number of artists.
+        Engines override this to use as few round trips as they can; by default, writes are applied one by one.
+        Engines that override it raise WriteBatchError if any writes failed, so they can be tried again."""
+        for pending in writes:
+            if pending.setlists:
+                self.insert_setlists(pending.mbid, pending.setlists)
+            if pending.stats is not None:
+                self.save_stats(pending.mbid, pending.stats)
+            if pending.in_progress is True:
+                self.reinsert_artist(pending.mbid)
+            elif pending.in_progress is False:
+                self.mark_artist_complete(pending.mbid)
 
     def close(self) -> None:
-        self._client.close()
+        """Release any connections held by the database."""
+
+
+def now() -> datetime.datetime:
+    """Timestamp for lastUpdated fields."""
+    return datetime.datetime.now(tz=datetime.timezone.utc)
+
+
+def create_database(backend: str | None = None, write_behind: bool | None = None) -> Database:
+    """Create the database selected by `backend`, or else the DB_BACKEND env variable.
+    Unless `write_behind` (or DB_WRITE_BEHIND=0) says otherwise, writes to MongoDB and SQLite
+    are buffered and applied in batches; see write_behind.py."""
+    backend = backend or os.getenv("DB_BACKEND", "mongo")
+    if write_behind is None:
+        write_behind = os.getenv("DB_WRITE_BEHIND", "1") != "0"
+
+    # Import only the engine in use, so e.g. pymongo isn't needed with SQLite
+    if backend == "mongo":
+        from mongo_database import MongoDatabase
+        db = MongoDatabase()
+    elif backend == "sqlite":
+        from sqlite_database import SqliteDatabase
+        db = SqliteDatabase(os.getenv("SQLITE_PATH", "cm.sqlite3"))
+    elif backend == "memory":
+        # Writes are already as cheap as they get
+        from memory_database import MemoryDatabase
+        return MemoryDatabase()
+    else:
+        raise ValueError(f"Unknown DB_BACKEND '{backend}'")
+
+    if write_behind:
+        from write_behind import WriteBehindDatabase
+        return WriteBehindDatabase(db)
+    return db
@@ -0,0 +1,110 @@
+# export.py
+# Downloads of an artist's stored setlists, for analysis outside the app.
+#
+# Formats:
+#   ndjson: one setlist document per line
+#   csv: one row per setlist, with a header row
+#   geojson: a FeatureCollection with a Point per valid setlist, at (cityLong, cityLat)
+#
+# Setlists are streamed from a database cursor (Database.iter_setlists) into the response as they're encoded,
+# so memory use stays the same however many setlists an artist has.
+
+from typing import Callable, Iterable, Iterator
+from flask import Response, current_app
+from artists import create_error_response
+from database import SetlistDocument
+import csv
+import json_codec
+
+# Encoded rows are collected into chunks of about this many bytes before being sent,
+# rather than sending each tiny row on its own
+CHUNK_BYTES = 64 * 1024
+
+CSV_COLUMNS = [
+    "isValid", "eventDate", "venueName", "cityName", "cityLat", "cityLong",
+    "stateName", "countryName", "setlistUrl", "songsPerformed"
+]
+
+
+def _chunked(parts: Iterable[bytes]) -> Iterator[bytes]:
+    buffer = []
+    size = 0
+    for part in parts:
+        buffer.append(part)
+        size += len(part)
+        if size >= CHUNK_BYTES:
+            yield b"".join(buffer)
+            buffer = []
+            size = 0
+    if len(buffer) > 0:
+        yield b"".join(buffer)
+
+
+def encode_ndjson(setlists: Iterable[SetlistDocument]) -> Iterator[bytes]:
+    for setlist in setlists:
+        yield json_codec.dumps_bytes(setlist) + b"\n"
+
+
+class _Echo:
+    """File-like object for csv.writer that hands back each row instead of storing it."""
+
+    def write(self, line: str) -> str:
+        return line
+
+
+def encode_csv(setlists: Iterable[SetlistDocument]) -> Iterator[bytes]:
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CSV_COLUMNS).encode()
+    for setlist in setlists:
+        yield writer.writerow([setlist.get(column) for column in CSV_COLUMNS]).encode()
+
+
+def encode_geojson(setlists: Iterable[SetlistDocument]) -> Iterator[bytes]:
+    # Written piece by piece, so the FeatureCollection is never held whole
+    yield b'{"type":"FeatureCollection","features":['
+    separator = b""
+    for setlist in setlists:
+        # Invalid setlists have no location to map
+        if not setlist.get("isValid") or setlist.get("cityLat") is None or setlist.get("cityLong") is None:
+            continue
+        feature = {
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [setlist["cityLong"], setlist["cityLat"]]},
+            "properties": {key: value for key, value in setlist.items() if key not in ("cityLat", "cityLong")}
+        }
+        yield separator + json_codec.dumps_bytes(feature)
+        separator = b","
+    yield b"]}\n"
+
+
+# format -> (encoder, mimetype, file extension)
+FORMATS: dict[str, tuple[Callable[[Iterable[SetlistDocument]], Iterator[bytes]], str, str]] = {
+    "ndjson": (encode_ndjson, "application/x-ndjson", "ndjson"),
+    "csv": (encode_csv, "text/csv", "csv"),
+    "geojson": (encode_geojson, "application/geo+json", "geojson"),
+}
+
+
+def export_setlists(mbid: str, format: str):
+    """Streams all setlists stored for an artist in the given format.
+    Args:
+        mbid: Artist MBID
+        format: One of FORMATS
+    Returns:
+        A streamed response, or a 404 if the artist isn't stored.
+    """
+    if format not in FORMATS:
+        return create_error_response(f"Unknown export format '{format}'", 400)
+    encoder, mimetype, extension = FORMATS[format]
+
+    # The response body is generated after this function returns, outside the app context
+    db = current_app.db
+    exists, in_progress, _ = db.check_artist(mbid)
+    if not exists:
+        return create_error_response("No setlists stored for this artist", 404)
+
+    response = Response(_chunked(encoder(db.iter_setlists(mbid))), mimetype=mimetype)
+    response.headers["Content-Disposition"] = f'attachment; filename="{mbid}.{extension}"'
+    # A fetch that's still running will add more setlists
+    response.headers["X-Export-Complete"] = "false" if in_progress else "true"
+    return response
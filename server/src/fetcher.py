@@ -2,23 +2,41 @@
 # An instance of the Fetcher class handles the lookup and streaming of setlists to the client, for one artist.
 
 import asyncio
-from threading import Thread
+from threading import Event, Thread
 from requests import HTTPError
-from setlist import Setlist
+from circuit_breaker import CircuitOpenError
+from map_layout import ScatterLayout
+from setlist import Setlist, convert_raw_setlists
+from setlist_store import SetlistStore
 from setlistfm_api import SetlistFmAPI
-from wss import WebSocketServer
+from stats import ArtistStats
+from tours import TourTracker
+from wss import WebSocketServer, fetchers
 from database import Database
+import admission
+import artist_index
+import circuit_breaker
+import tours
 import datetime
 import logging
 
 logger = logging.getLogger(__name__)
 
+# While queued, how often to check whether clients' queue position has changed
+QUEUE_UPDATE_INTERVAL_S = 1
+
 
 class Fetcher:
-    def __init__(self, artist_mbid: str, wss: WebSocketServer, db: Database):
+    def __init__(self, artist_mbid: str, wss: WebSocketServer, db: Database, setlistfm: SetlistFmAPI | None = None):
         # Data about the artist or their setlists
         self.artist_mbid = artist_mbid
-        self.fetched_setlists = []
+        self.fetched_setlists = SetlistStore()
+        # Scatter points for the setlists sent to clients, continuing from the stored ones
+        self.scatter_layout = ScatterLayout()
+        # Running stats, saved with every page
+        self.stats = ArtistStats(artist_mbid)
+        # Tours, also brought up to date with every page (see tours.py)
+        self.tour_tracker = TourTracker()
         self.artist_name = None
         # Total expected setlists is known only after the first page is fetched.
         # Until then, use None to convey the unknown state.
@@ -27,18 +45,29 @@ class Fetcher:
         # Track state of the fetch process
         self.done_fetching = False
         self.error = False
+        # Set when setlist.fm is down and an update could not be fetched: clients get the stored setlists as they are
+        self.stale = False
+        # Set once the first page has been handled (or the fetch ended without one)
+        self.first_page_done = Event()
+        # Place in the fetch queue (see admission.py), until the fetch is done
+        self.ticket: admission.Ticket | None = None
+        self.thread: Thread | None = None
 
         # Store some tools
         self.wss = wss
         self.db = db
 
-        self.setlistfm = SetlistFmAPI()
+        # Background fetches bring their own API client, to stay within their share of the rate limit
+        self.setlistfm = setlistfm or SetlistFmAPI()
 
     def _update_metadata(self, setlists_response: dict) -> None:
         if "total" in setlists_response:
             self.total_expected_setlists = int(setlists_response["total"])
 
     def _broadcast_new_setlists(self, new_setlists: list[Setlist]) -> None:
+        # A newer fetch for the same artist may have taken over the channel
+        if not self.wss.owns_channel(self.artist_mbid, self):
+            return
         event = {
             "type": "update",
             "setlists": new_setlists,
@@ -49,6 +78,49 @@ class Fetcher:
     def __repr__(self) -> str:
         return f"'{self.artist_name}' ({self.artist_mbid})"
 
+    @property
+    def is_queued(self) -> bool:
+        return self.ticket is not None and not self.ticket.admitted and not self.ticket.released
+
+    def queue_status(self) -> dict | None:
+        """Where this fetch is in the queue, as sent to clients, or None if it isn't waiting."""
+        if not self.is_queued:
+            return None
+        position = self.ticket.position
+        return {"position": position, "estimatedWaitS": round(self.ticket.estimated_wait_s)}
+
+    def _wait_for_turn(self) -> None:
+        """Block until the fetch queue lets this fetch run, keeping clients posted on their position."""
+        last_status = self.queue_status()
+        if last_status is not None:
+            logger.info(f"Fetch for {self} is queued at position {last_status['position']}")
+        while not self.ticket.wait(QUEUE_UPDATE_INTERVAL_S):
+            status = self.queue_status()
+            if status is not None and status != last_status and self.wss.owns_channel(self.artist_mbid, self):
+                self.wss.broadcast_to_channel(self.artist_mbid, {"type": "queue"} | status)
+            last_status = status
+        if last_status is not None and self.wss.owns_channel(self.artist_mbid, self):
+            # Tell clients the wait is over
+            self.wss.broadcast_to_channel(self.artist_mbid, {"type": "queue", "position": 0, "estimatedWaitS": 0})
+
+    def _run(self, appending: bool) -> None:
+        """Fetch thread: wait for a free slot, then fetch."""
+        try:
+            # An update that can't reach setlist.fm just serves what's stored. No point waiting in line for that
+            if not (appending and circuit_breaker.setlistfm.is_open):
+                self._wait_for_turn()
+            asyncio.run(self._fetch_setlists(appending))
+        except Exception as e:
+            # Don't leave the channel (and its clients) hanging
+            logger.exception(f"Fetch for {self} failed: {e}")
+            self.error = True
+            self.done_fetching = True
+            self.first_page_done.set()
+            if self.wss.owns_channel(self.artist_mbid, self):
+                asyncio.run(self.wss.broadcast_goodbye_to_channel(self.artist_mbid, len(self.fetched_setlists), True))
+        finally:
+            self.ticket.release()
+
     def _obtain_artist_name(self) -> None:
         """Fetch, and store in self, the current artist's name."""
         try:
@@ -71,8 +143,20 @@ class Fetcher:
             setlists_response = None
 
             try:
-                setlists_response = self.setlistfm.get_artist_setlists(self.artist_mbid, page)
+                # Past page 1 the total is known, so cached pages from before new setlists came in aren't used
+                setlists_response = self.setlistfm.get_artist_setlists(
+                    self.artist_mbid, page, self.total_expected_setlists if page > 1 else None
+                )
                 raw_setlists = setlists_response["setlist"]
+            except CircuitOpenError:
+                # Updates can go without the newest setlists for a while. New artists have nothing to fall back on
+                logger.warning(
+                    f"setlist.fm is down; ending fetch for {self} with {len(self.fetched_setlists)} setlists"
+                    f"{', marked stale' if appending else ''}."
+                )
+                self.stale = appending
+                self.error = not appending
+                self.done_fetching = True
             except HTTPError:
                 logger.error(
                     f"Aborting fetch for {self} with {len(self.fetched_setlists)}"
@@ -107,24 +191,33 @@ class Fetcher:
                             fresh_setlists.append(setlist)
                     raw_setlists = fresh_setlists
 
-                # Broadcast a payload of the new setlists to all connected clients
-                new_setlists = Setlist.convert_setlists(raw_setlists)
-                self._broadcast_new_setlists(new_setlists)
+                new_setlists = convert_raw_setlists(raw_setlists)
+
+                # Update the fetched setlists in DB. This comes before the broadcast, so a client that
+                # joins in between finds these setlists in the DB instead of missing them.
+                self.db.insert_setlists(self.artist_mbid, new_setlists)
+                self.stats.add(new_setlists)
+                self.tour_tracker.add(new_setlists)
+                self.db.save_stats(self.artist_mbid, self.stats.to_document(complete=False))
+
+                # Broadcast a payload of the new setlists to all connected clients, with their map positions
+                self._broadcast_new_setlists(self.scatter_layout.place(new_setlists))
 
                 # Update the fetched setlists
                 self.fetched_setlists.extend(new_setlists)
 
-                # Update the fetched setlists in DB
-                self.db.insert_setlists(self.artist_mbid, new_setlists)
+            self.first_page_done.set()
 
             # Check if we can conclude
             if self.done_fetching:
                 count = len(self.fetched_setlists)
                 logger.info(f"Retrieved {count} setlists for {self}")
-                # Mark fetching for this artist as complete in DB
+                # Mark fetching for this artist as complete in DB, final stats included
+                self.db.save_stats(self.artist_mbid, self.stats.to_document(complete=True))
                 self.db.mark_artist_complete(self.artist_mbid)
                 # Broadcast the goodbye message, signaling the end of setlists
-                await self.wss.broadcast_goodbye_to_channel(self.artist_mbid, count, self.error)
+                if self.wss.owns_channel(self.artist_mbid, self):
+                    await self.wss.broadcast_goodbye_to_channel(self.artist_mbid, count, self.error)
                 break
 
             # Increment page for next request
@@ -138,7 +231,9 @@ class Fetcher:
         exists, in_progress, last_updated = self.db.check_artist(self.artist_mbid)
 
         # If artist hasn't been updated in the last 15 seconds, the fetch likely got stuck. Reset it.
-        if exists and in_progress and (
+        # Unless it's still waiting in the fetch queue, which doesn't update anything
+        channel_fetcher = fetchers.get(self.artist_mbid)
+        if exists and in_progress and not (channel_fetcher is not None and channel_fetcher.is_queued) and (
             datetime.datetime.now(tz=datetime.timezone.utc) - last_updated > datetime.timedelta(seconds=15)
         ):
             logger.warning(f"Setlists for {self} were found stuck. Restarting fetch.")
@@ -160,20 +255,41 @@ class Fetcher:
 
                 # Pull database setlists into memory before starting the fetch.
                 self.fetched_setlists.extend(self.db.get_all_setlists(self.artist_mbid))
+                # New setlists get scatter points after the stored ones
+                self.scatter_layout = ScatterLayout(self.fetched_setlists)
+                # Same for stats. Artists stored without stats, or whose stats somehow fell behind, get them counted now
+                stored_stats = self.db.get_stats(self.artist_mbid)
+                if stored_stats is not None and stored_stats["totalSetlists"] == len(self.fetched_setlists):
+                    self.stats = ArtistStats(self.artist_mbid, stored_stats)
+                else:
+                    self.stats = ArtistStats.from_setlists(self.artist_mbid, self.fetched_setlists)
+                # And tours, unless the cached ones are already up to date
+                tour_tracker = tours.cached(self.artist_mbid)
+                if tour_tracker is None or tour_tracker.seen != len(self.fetched_setlists):
+                    tour_tracker = tours.build(self.artist_mbid, self.fetched_setlists)
+                self.tour_tracker = tour_tracker
 
                 # Fetch only new setlists, appending to those already stored.
-                thread = Thread(target=lambda: asyncio.run(self._fetch_setlists(appending=True)))
+                thread = Thread(target=self._run, args=(True,))
             else:
                 # New artist. Start a new fetch process
                 logger.info(f"Starting new setlists fetch for {self}")
 
                 # Add artist to database
                 self.db.insert_artist(self.artist_mbid, self.artist_name)
+                # Suggest them from now on
+                artist_index.index.add(self.artist_mbid, self.artist_name)
+                # Tours from scratch too, in place of any left from setlists since deleted
+                self.tour_tracker = tours.build(self.artist_mbid)
+
+                thread = Thread(target=self._run, args=(False,))
 
-                thread = Thread(target=lambda: asyncio.run(self._fetch_setlists(appending=False)))
+            # Take a place in the fetch queue first, so clients connecting right away can be told where they are
+            self.ticket = admission.fetch_limiter.enqueue()
 
             # Inform our WebSocketServer about new artist fetch, so it can create a virtual channel
             self.wss.add_artist(self.artist_mbid, self)
 
             # Run start_setlists_fetch in a separate thread
+            self.thread = thread
             thread.start()
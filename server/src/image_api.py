@@ -1,21 +1,21 @@
 # image_api.py
 # Interface to get images of artists from external APIs.
+# While Spotify is down (see circuit_breaker.py), artists get the placeholder image straight away.
 
-from dotenv import load_dotenv
 import base64
+import circuit_breaker
 import logging
 import os
 import requests
 import time
 
-load_dotenv()
-
 logger = logging.getLogger(__name__)
 
 SPOTIFY_CLIENT_ID = os.getenv("SPOTIFY_CLIENT_ID")
 SPOTIFY_CLIENT_SECRET = os.getenv("SPOTIFY_CLIENT_SECRET")
 DEFAULT_ARTIST_IMAGE_URL = "https://abs.twimg.com/sticky/default_profile_images/default_profile_200x200.png"
 MAX_ATTEMPTS = 3
+REQUEST_TIMEOUT_S = 10
 access_token = None
 
 HAVE_API_KEY = (SPOTIFY_CLIENT_ID is not None and SPOTIFY_CLIENT_SECRET is not None and
@@ -33,14 +33,19 @@ def _refresh_token() -> bool:
     auth_string = f"{SPOTIFY_CLIENT_ID}:{SPOTIFY_CLIENT_SECRET}"
     # ugly
     auth_encoded = base64.b64encode(auth_string.encode()).decode()
-    response = requests.post(
-        "https://accounts.spotify.com/api/token",
-        data={"grant_type": "client_credentials"},
-        headers={
-            'Content-Type': 'application/x-www-form-urlencoded',
-            'Authorization': f'Basic {auth_encoded}'
-        }
-    )
+    try:
+        response = requests.post(
+            "https://accounts.spotify.com/api/token",
+            data={"grant_type": "client_credentials"},
+            headers={
+                'Content-Type': 'application/x-www-form-urlencoded',
+                'Authorization': f'Basic {auth_encoded}'
+            },
+            timeout=REQUEST_TIMEOUT_S
+        )
+    except requests.exceptions.RequestException as e:
+        logger.error(f"Error fetching Spotify access_token: {e}")
+        return False
     if response.status_code != 200:
         logger.error(f"Error fetching Spotify access_token: {response.status_code}: {response.text}")
         return False
@@ -61,11 +66,21 @@ def get_artist_image_url(name: str) -> str:
         return DEFAULT_ARTIST_IMAGE_URL
 
     for attempt in range(MAX_ATTEMPTS):
-        response = requests.get(
-            "https://api.spotify.com/v1/search",
-            params={"q": name, "type": "artist", "limit": 1},
-            headers={"Authorization": f"Bearer {access_token}"}
-        )
+        if not circuit_breaker.spotify.allow():
+            return DEFAULT_ARTIST_IMAGE_URL
+        try:
+            response = requests.get(
+                "https://api.spotify.com/v1/search",
+                params={"q": name, "type": "artist", "limit": 1},
+                headers={"Authorization": f"Bearer {access_token}"},
+                timeout=REQUEST_TIMEOUT_S
+            )
+        except requests.exceptions.RequestException as e:
+            circuit_breaker.spotify.record(False)
+            logger.error(f"Error fetching artist image for '{name}': {e}")
+            return DEFAULT_ARTIST_IMAGE_URL
+        circuit_breaker.spotify.record(not circuit_breaker.is_failure(response.status_code))
+
         if response.status_code == 401:
             # Expired token; get a new one.
             if not _refresh_token():
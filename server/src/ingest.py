@@ -0,0 +1,301 @@
+# ingest.py
+# Bulk-load archives of raw setlist.fm responses (e.g. recorded crawls) into the database, without the API.
+#
+# Usage (from server/):
+#   python src/ingest.py [--workers N] [--state ingest-state.json] ARCHIVE...
+#
+# Archives can be:
+#   .jsonl (or .jsonl.gz): one JSON value per line. Streamed, so size doesn't matter.
+#   .json (or .json.gz): a single JSON value, read whole.
+#   directories: every .json/.jsonl(.gz) file inside, recursively.
+# Each JSON value is a setlists page as returned by setlist.fm ({"setlist": [...], ...}),
+# a single raw setlist, or a list of either. Lines that aren't valid JSON (e.g. the last line of an interrupted
+# crawl, cut off halfway) are counted and skipped.
+#
+# Setlists are converted across worker processes with the same rules as live fetches, grouped by
+# the artist in each setlist, and stored in batches through Database.write_batch.
+# Artists that were already stored before the ingest started are left alone.
+#
+# Progress is saved to the state file after every batch, so an interrupted ingest can be run again with the
+# same arguments and picks up where it stopped. At worst, the batch being written during a crash is stored twice.
+
+from collections import deque
+from multiprocessing import Pool
+from pathlib import Path
+from typing import Iterator
+import argparse
+import gzip
+import json
+import os
+import sys
+import time
+
+from database import Database, PendingWrites, SetlistDocument, create_database
+from setlist import convert_raw_setlists
+import json_codec
+
+# Bytes of JSONL lines per task sent to a worker
+CHUNK_BYTES = 4 * 2**20
+# Tasks in flight per worker. Bounds memory, since results have to be written in order
+TASKS_PER_WORKER = 2
+PROGRESS_INTERVAL_S = 2
+
+# Per-artist setlists found in a task: mbid -> (artist name, setlists)
+ArtistSetlists = dict[str, tuple[str, list[SetlistDocument]]]
+
+
+def _raw_setlists(value) -> Iterator[dict]:
+    """Find the raw setlists in a parsed JSON value."""
+    if isinstance(value, list):
+        for item in value:
+            yield from _raw_setlists(item)
+    elif isinstance(value, dict):
+        if "setlist" in value:
+            yield from value["setlist"]
+        elif "venue" in value or "artist" in value:
+            yield value
+
+
+def _group_by_artist(raw_setlists: list[dict]) -> tuple[ArtistSetlists, int]:
+    """Convert raw setlists, grouped by artist. Returns the groups and how many setlists had no artist."""
+    groups: ArtistSetlists = {}
+    skipped = 0
+    # Convert in one batch, then match the results back up with their artists
+    for raw_setlist, setlist in zip(raw_setlists, convert_raw_setlists(raw_setlists)):
+        artist = raw_setlist.get("artist") or {}
+        mbid = artist.get("mbid")
+        if not mbid:
+            skipped += 1
+            continue
+        if mbid not in groups:
+            groups[mbid] = (artist.get("name"), [])
+        groups[mbid][1].append(setlist)
+    return groups, skipped
+
+
+def convert_lines(lines: list[bytes]) -> tuple[ArtistSetlists, int, int]:
+    """Worker task: convert a chunk of JSONL lines.
+    Returns:
+        The setlists by artist, how many setlists had no artist, and how many lines weren't valid JSON
+    """
+    raw_setlists = []
+    bad_lines = 0
+    for line in lines:
+        if line.strip():
+            try:
+                value = json_codec.loads(line)
+            except ValueError:
+                # Skipped, or it would stop every run at the same place
+                bad_lines += 1
+                continue
+            raw_setlists.extend(_raw_setlists(value))
+    return *_group_by_artist(raw_setlists), bad_lines
+
+
+def convert_file(path: str) -> tuple[ArtistSetlists, int, int]:
+    """Worker task: convert a whole JSON file. Returns the same as convert_lines."""
+    with _open(Path(path)) as f:
+        return *_group_by_artist(list(_raw_setlists(json_codec.loads(f.read())))), 0
+
+
+def _open(path: Path):
+    return gzip.open(path, "rb") if path.suffix == ".gz" else open(path, "rb")
+
+
+def _is_lines(path: Path) -> bool:
+    return path.name.endswith((".jsonl", ".jsonl.gz", ".ndjson", ".ndjson.gz"))
+
+
+def find_archives(paths: list[str]) -> list[Path]:
+    archives = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            archives.extend(sorted(
+                p for p in path.rglob("*") if p.name.endswith((".json", ".jsonl", ".ndjson", ".json.gz", ".jsonl.gz", ".ndjson.gz"))
+            ))
+        else:
+            archives.append(path)
+    return [archive.resolve() for archive in archives]
+
+
+class Ingest:
+    def __init__(self, db: Database, state_path: str | None = None, workers: int | None = None,
+                 chunk_bytes: int = CHUNK_BYTES, out=sys.stderr):
+        self.db = db
+        self.state_path = Path(state_path) if state_path else None
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_bytes = chunk_bytes
+        self.out = out
+
+        # Resumable state: how far each archive got, and the artists this ingest created
+        self.state = {"files": {}, "artists": [], "setlists": 0}
+        if self.state_path and self.state_path.exists():
+            self.state = json.loads(self.state_path.read_text())
+        self.created_artists = set(self.state["artists"])
+        # Artists stored before the ingest, which are left alone
+        self.existing_artists: set[str] = set()
+        # Artists known to be in the database, ready for setlists
+        self.ready_artists: set[str] = set()
+        self.skipped_setlists = 0
+        self.bad_lines = 0
+
+        # For progress: size of all archives, and how much of each has been stored
+        self.total_bytes = 0
+        self.done_bytes: dict[str, int] = {}
+        self.started = time.perf_counter()
+        self.last_progress = 0
+
+    def _save_state(self) -> None:
+        if self.state_path is None:
+            return
+        self.state["artists"] = sorted(self.created_artists)
+        tmp_path = self.state_path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(self.state))
+        tmp_path.replace(self.state_path)
+
+    def _store(self, groups: ArtistSetlists) -> int:
+        """Store one task's setlists. Returns how many were stored."""
+        writes = []
+        new_artists = []
+        for mbid, (name, setlists) in groups.items():
+            if mbid in self.existing_artists:
+                continue
+            if mbid not in self.ready_artists:
+                exists = self.db.check_artist(mbid)[0]
+                if mbid in self.created_artists:
+                    # Created by an earlier run, which may have stopped before inserting it
+                    if not exists:
+                        new_artists.append((mbid, name))
+                elif exists:
+                    self.existing_artists.add(mbid)
+                    continue
+                else:
+                    self.created_artists.add(mbid)
+                    new_artists.append((mbid, name))
+                self.ready_artists.add(mbid)
+            # Stored artists are complete, so live requests only append newer setlists
+            writes.append(PendingWrites(mbid, setlists, in_progress=False))
+
+        if len(new_artists) > 0:
+            # Note new artists as ours before creating them, so a resumed ingest can't mistake them for
+            # artists that were already stored
+            self._save_state()
+            for mbid, name in new_artists:
+                self.db.insert_artist(mbid, name)
+        if len(writes) > 0:
+            self.db.write_batch(writes)
+        return sum(len(pending.setlists) for pending in writes)
+
+    def _progress(self, final: bool = False) -> None:
+        now = time.perf_counter()
+        if not final and now - self.last_progress < PROGRESS_INTERVAL_S:
+            return
+        self.last_progress = now
+        elapsed = now - self.started
+        share = sum(self.done_bytes.values()) / self.total_bytes if self.total_bytes else 1
+        print(
+            f"[{share:6.1%}] {self.state['setlists']} setlists for {len(self.created_artists)} artists "
+            f"({self.state['setlists'] / max(elapsed, 1e-9):.0f}/s), "
+            f"{len(self.existing_artists)} artists already stored, {self.skipped_setlists} setlists without an artist, "
+            f"{self.bad_lines} malformed lines",
+            file=self.out
+        )
+
+    def _chunks(self, path: Path, offset: int) -> Iterator[tuple[list[bytes], int]]:
+        """Read a JSONL archive in chunks of lines, from a byte offset into its (uncompressed) content.
+        Yields each chunk with the offset after it."""
+        with _open(path) as f:
+            f.seek(offset)
+            lines = []
+            chunk_start = offset
+            for line in f:
+                lines.append(line)
+                offset += len(line)
+                if offset - chunk_start >= self.chunk_bytes:
+                    yield lines, offset
+                    lines = []
+                    chunk_start = offset
+            if len(lines) > 0:
+                yield lines, offset
+
+    def _tasks(self, archives: list[Path]) -> Iterator[tuple[str, tuple, dict]]:
+        """Tasks for the workers: (function name, args, progress to record once the result is stored)."""
+        for path in archives:
+            key = str(path)
+            progress = self.state["files"].setdefault(key, {"offset": 0, "done": False})
+            size = path.stat().st_size
+            if progress["done"]:
+                self.done_bytes[key] = size
+                continue
+
+            if _is_lines(path):
+                for lines, offset in self._chunks(path, progress["offset"]):
+                    yield "convert_lines", (lines,), {"file": key, "offset": offset, "done": False}
+                yield None, (), {"file": key, "offset": None, "done": True, "size": size}
+            else:
+                yield "convert_file", (key,), {"file": key, "offset": None, "done": True, "size": size}
+
+    def _record(self, groups: ArtistSetlists, skipped: int, bad_lines: int, progress: dict) -> None:
+        self.state["setlists"] += self._store(groups)
+        self.skipped_setlists += skipped
+        self.bad_lines += bad_lines
+        file_state = self.state["files"][progress["file"]]
+        if progress["offset"] is not None:
+            file_state["offset"] = progress["offset"]
+            # Offsets into gzipped archives don't compare to their size, so those only count once done
+            if not progress["file"].endswith(".gz"):
+                self.done_bytes[progress["file"]] = progress["offset"]
+        if progress["done"]:
+            file_state["done"] = True
+            self.done_bytes[progress["file"]] = progress["size"]
+        self._save_state()
+        self._progress()
+
+    def run(self, paths: list[str]) -> dict:
+        """Ingest the given archives. Returns the final state."""
+        archives = find_archives(paths)
+        self.total_bytes = sum(path.stat().st_size for path in archives)
+        functions = {"convert_lines": convert_lines, "convert_file": convert_file}
+
+        with Pool(self.workers) as pool:
+            # Results are stored in the order their input was read, so the saved offsets are always safe to resume from
+            in_flight = deque()
+            for name, args, progress in self._tasks(archives):
+                result = pool.apply_async(functions[name], args) if name else None
+                in_flight.append((result, progress))
+                while len(in_flight) > self.workers * TASKS_PER_WORKER:
+                    self._finish(*in_flight.popleft())
+            while in_flight:
+                self._finish(*in_flight.popleft())
+
+        self._progress(final=True)
+        return self.state
+
+    def _finish(self, result, progress: dict) -> None:
+        groups, skipped, bad_lines = result.get() if result is not None else ({}, 0, 0)
+        self._record(groups, skipped, bad_lines, progress)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load archives of raw setlist.fm responses into the database.")
+    parser.add_argument("archives", nargs="+", help=".json/.jsonl files (optionally gzipped), or directories of them")
+    parser.add_argument("--state", default="ingest-state.json",
+                        help="file recording progress, to resume an interrupted ingest (default: %(default)s)")
+    parser.add_argument("--workers", type=int, default=None, help="conversion processes (default: CPU count)")
+    parser.add_argument("--chunk-mib", type=float, default=CHUNK_BYTES / 2**20,
+                        help="MiB of JSONL lines per task (default: %(default)s)")
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    # Batches are already as big as they get, so skip the write-behind buffer
+    db = create_database(write_behind=False)
+    try:
+        Ingest(db, args.state, args.workers, int(args.chunk_mib * 2**20)).run(args.archives)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+# json_codec.py
+# JSON decoding and encoding for the busy paths: setlist.fm responses, setlist broadcasts and API responses.
+#
+# Uses orjson when it's installed, and the standard json module otherwise. Both give the same results;
+# output is compact and UTF-8 (no \u escapes) either way.
+# Set JSON_CODEC=stdlib to use the standard json module even if orjson is installed.
+
+from typing import Any, Callable
+import json
+import os
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+CODEC = "orjson" if orjson is not None and os.getenv("JSON_CODEC", "orjson") != "stdlib" else "stdlib"
+
+
+def loads(data: bytes | str) -> Any:
+    """Parse JSON, preferably straight from the bytes of a response body."""
+    if CODEC == "orjson":
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps_bytes(obj: Any, sort_keys: bool = False, default: Callable[[Any], Any] | None = None) -> bytes:
+    """Serialize to UTF-8 encoded JSON, ready to go into a response body or WebSocket frame.
+    Args:
+        sort_keys: Sort the keys of dicts
+        default: Called for objects JSON can't represent. If given, datetimes and dataclasses
+            go through it as well, like they do with the json module.
+    """
+    if CODEC == "orjson":
+        option = orjson.OPT_NON_STR_KEYS
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if default is not None:
+            option |= orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+        return orjson.dumps(obj, default=default, option=option)
+
+    return json.dumps(
+        obj, sort_keys=sort_keys, default=default, ensure_ascii=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def dumps(obj: Any, sort_keys: bool = False, default: Callable[[Any], Any] | None = None) -> str:
+    """Serialize to a JSON string. See dumps_bytes."""
+    if CODEC == "orjson":
+        return dumps_bytes(obj, sort_keys, default).decode("utf-8")
+    return json.dumps(obj, sort_keys=sort_keys, default=default, ensure_ascii=False, separators=(",", ":"))
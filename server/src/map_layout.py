@@ -0,0 +1,133 @@
+# map_layout.py
+# Where an artist's setlists go on the client's map.
+#
+# Scatter: setlists in the same city would all sit on one spot, so each one gets its own point around
+# the city instead (scatterLat/scatterLong). Points are laid out on a sunflower spiral, in the order the
+# setlists were stored: the nth setlist in a city always gets the nth point, no matter how many follow.
+# So a setlist's point is known as soon as it's stored, and never moves afterwards.
+#
+# Clusters: at low zoom levels, thousands of markers are too many to draw. cluster_setlists groups
+# setlists into grid cells of roughly equal size on screen, for the client to draw one marker per cell.
+
+from typing import Iterable
+from database import SetlistDocument
+import math
+
+# Degrees between neighboring points of a city's spiral
+SCATTER_SPACING = 0.02
+GOLDEN_ANGLE = math.pi * (3 - math.sqrt(5))
+
+# Cells per map tile side when clustering. Tiles are 256 px, so cells are about 64 px wide
+CELLS_PER_TILE_LOG2 = 2
+MAX_ZOOM = 18
+# Web Mercator can't show the poles
+MAX_LAT = 85.05112878
+
+
+def _city_key(setlist: SetlistDocument) -> tuple[float, float]:
+    return setlist["cityLat"], setlist["cityLong"]
+
+
+def scatter_point(lat: float, long: float, slot: int) -> tuple[float, float]:
+    """The point for a city's `slot`th setlist. The first sits on the city itself, the next ones spiral
+    outward, starting from the top and going clockwise."""
+    if slot == 0:
+        return lat, long
+    radius = SCATTER_SPACING * math.sqrt(slot)
+    angle = math.pi / 2 - slot * GOLDEN_ANGLE
+    # latitude is Y, and longitude is X
+    return round(lat + radius * math.sin(angle), 6), round(long + radius * math.cos(angle), 6)
+
+
+class ScatterLayout:
+    """Scatter points for one artist's setlists, kept up to date as setlists are added.
+    Only needs a count per city, so adding setlists costs the same however many came before."""
+
+    def __init__(self, setlists: Iterable[SetlistDocument] = ()):
+        """Start out with `setlists` already placed."""
+        self._city_counts: dict[tuple[float, float], int] = {}
+        for setlist in setlists:
+            self._next_slot(setlist)
+
+    def _next_slot(self, setlist: SetlistDocument) -> int | None:
+        # Setlists without a location have no point
+        if not setlist.get("isValid") or setlist.get("cityLat") is None or setlist.get("cityLong") is None:
+            return None
+        city = _city_key(setlist)
+        slot = self._city_counts.get(city, 0)
+        self._city_counts[city] = slot + 1
+        return slot
+
+    def place(self, setlists: Iterable[SetlistDocument], in_place: bool = False) -> list[SetlistDocument]:
+        """Give the next setlists their scatter points, in the order they were stored.
+        Returns the setlists as sent to clients: valid ones with scatterLat and scatterLong added, and without
+        song titles, which the map doesn't use. Unless `in_place`, those are copies, so e.g. setlists waiting
+        to be written to the database aren't changed."""
+        placed = []
+        for setlist in setlists:
+            slot = self._next_slot(setlist)
+            if slot is not None or "songs" in setlist:
+                if not in_place:
+                    setlist = dict(setlist)
+                setlist.pop("songs", None)
+                if slot is not None:
+                    setlist["scatterLat"], setlist["scatterLong"] = scatter_point(*_city_key(setlist), slot)
+            placed.append(setlist)
+        return placed
+
+
+def _tile_position(lat: float, long: float, zoom: int) -> tuple[float, float]:
+    """Web Mercator position, in tiles at the given zoom."""
+    n = 2 ** zoom
+    lat = max(-MAX_LAT, min(MAX_LAT, lat))
+    x = (long + 180) / 360 * n
+    y = (1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * n
+    return x, y
+
+
+def cluster_setlists(setlists: Iterable[SetlistDocument], zoom: int) -> list[dict]:
+    """Group valid setlists into clusters for the given map zoom level, biggest first.
+    Each cluster has its setlists' average location, how many setlists and cities it has,
+    and its first and last event dates."""
+    # Cities first, so the rest of the work scales with the number of cities rather than setlists
+    cities: dict[tuple[float, float], list] = {}
+    for setlist in setlists:
+        if not setlist.get("isValid") or setlist.get("cityLat") is None or setlist.get("cityLong") is None:
+            continue
+        city = cities.get(_city_key(setlist))
+        date = setlist.get("eventDate")
+        if city is None:
+            cities[_city_key(setlist)] = [1, date, date]
+        else:
+            city[0] += 1
+            if date is not None:
+                city[1] = date if city[1] is None else min(city[1], date)
+                city[2] = date if city[2] is None else max(city[2], date)
+
+    cell_zoom = zoom + CELLS_PER_TILE_LOG2
+    cells: dict[tuple[int, int], dict] = {}
+    for (lat, long), (count, first_date, last_date) in cities.items():
+        x, y = _tile_position(lat, long, cell_zoom)
+        cell = cells.get((int(x), int(y)))
+        if cell is None:
+            cells[(int(x), int(y))] = {
+                "lat": lat * count, "long": long * count, "count": count, "cities": 1,
+                "firstDate": first_date, "lastDate": last_date
+            }
+            continue
+        cell["lat"] += lat * count
+        cell["long"] += long * count
+        cell["count"] += count
+        cell["cities"] += 1
+        if first_date is not None:
+            cell["firstDate"] = first_date if cell["firstDate"] is None else min(cell["firstDate"], first_date)
+        if last_date is not None:
+            cell["lastDate"] = last_date if cell["lastDate"] is None else max(cell["lastDate"], last_date)
+
+    clusters = list(cells.values())
+    for cluster in clusters:
+        # Sums weighted by setlist count, into averages
+        cluster["lat"] = round(cluster["lat"] / cluster["count"], 6)
+        cluster["long"] = round(cluster["long"] / cluster["count"], 6)
+    clusters.sort(key=lambda cluster: cluster["count"], reverse=True)
+    return clusters
@@ -0,0 +1,237 @@
+# memory_database.py
+# Database kept in plain Python objects. Nothing survives a restart, so this suits tests and
+# throwaway deployments.
+# Setlists are kept in a SetlistStore per artist, which takes a fraction of the memory of a list of dicts.
+# The concert index points into those stores: by 1-degree grid cell, and by venue and city.
+# Each artist's song index (see song_index.py) also points into their store.
+
+from threading import Lock
+from database import Database, ArtistDocument, ArtistStatsDocument, ConcertDocument, ConcertQuery, SetlistDocument, SongCount, now
+from setlist_store import SetlistStore
+from typing import Iterable, Iterator
+import concert_index
+import song_index
+import datetime
+import heapq
+import math
+
+
+class MemoryDatabase(Database):
+    def __init__(self):
+        self._artists: dict[str, ArtistDocument] = {}
+        # Concert index. A concert's id is its position in _concerts, which holds (mbid, store, index in store).
+        # Deleting an artist leaves None in place of their concerts, so the ids in cursors stay put.
+        self._concerts: list[tuple[str, SetlistStore, int] | None] = []
+        # mbid -> ids of the artist's concerts, to take them out of the index when the artist is deleted
+        self._artist_concerts: dict[str, list[int]] = {}
+        self._by_cell: dict[tuple[int, int], list[int]] = {}
+        self._by_venue: dict[str, list[int]] = {}
+        self._by_city: dict[str, list[int]] = {}
+        # Song indexes by artist: song key -> indexes of setlists in the artist's store,
+        # and country key -> song key -> [title, shows]
+        self._song_plays: dict[str, dict[str, list[int]]] = {}
+        self._song_counts: dict[str, dict[str, dict[str, list]]] = {}
+        # Fetchers write from their own threads
+        self._lock = Lock()
+
+    def insert_artist(self, mbid: str, name: str) -> None:
+        with self._lock:
+            if mbid in self._artists:
+                return
+            self._artists[mbid] = ArtistDocument(
+                mbid=mbid,
+                name=name,
+                lastUpdated=now(),
+                inProgress=True,
+                setlists=SetlistStore()
+            )
+
+    def get_artist_names(self) -> list[tuple[str, str]]:
+        with self._lock:
+            return [(mbid, artist["name"]) for mbid, artist in self._artists.items()]
+
+    def reinsert_artist(self, mbid: str) -> None:
+        with self._lock:
+            if mbid in self._artists:
+                self._artists[mbid]["inProgress"] = True
+                self._artists[mbid]["lastUpdated"] = now()
+
+    def check_artist(self, mbid: str) -> tuple[bool, bool, datetime.datetime | None]:
+        with self._lock:
+            artist = self._artists.get(mbid)
+            if artist is None:
+                return False, False, None
+            return True, artist["inProgress"], artist["lastUpdated"]
+
+    def insert_setlists(self, mbid: str, new_setlists: list[SetlistDocument]) -> None:
+        with self._lock:
+            if mbid in self._artists:
+                setlists = self._artists[mbid]["setlists"]
+                start = len(setlists)
+                setlists.extend(new_setlists)
+                self._artists[mbid]["lastUpdated"] = now()
+                self._index_concerts(mbid, setlists, start, new_setlists)
+                self._index_songs(mbid, start, new_setlists)
+
+    def _index_songs(self, mbid: str, start: int, setlists: list[SetlistDocument]) -> None:
+        # Call with self._lock held
+        plays = self._song_plays.setdefault(mbid, {})
+        for index, setlist in enumerate(setlists, start):
+            for key in song_index.setlist_songs(setlist):
+                plays.setdefault(key, []).append(index)
+        counts = self._song_counts.setdefault(mbid, {})
+        for (country, key), (title, shows) in song_index.count_plays(setlists).items():
+            count = counts.setdefault(country, {}).get(key)
+            if count is None:
+                counts[country][key] = [title, shows]
+            else:
+                count[1] += shows
+
+    @staticmethod
+    def _concert_keys(setlist: SetlistDocument) -> tuple[tuple[int, int], str | None, str | None]:
+        # Where a concert is found in the index: its grid cell, venue and city
+        return (
+            (math.floor(setlist["cityLat"]), math.floor(setlist["cityLong"])),
+            concert_index.match_key(setlist.get("venueName")),
+            concert_index.match_key(setlist.get("cityName"))
+        )
+
+    def _index_concerts(self, mbid: str, store: SetlistStore, start: int, setlists: Iterable[SetlistDocument]) -> None:
+        # Call with self._lock held
+        artist_concerts = self._artist_concerts.setdefault(mbid, [])
+        for index, setlist in enumerate(setlists, start):
+            if not concert_index.is_indexed(setlist):
+                continue
+            concert_id = len(self._concerts)
+            self._concerts.append((mbid, store, index))
+            artist_concerts.append(concert_id)
+            cell, venue, city = self._concert_keys(setlist)
+            self._by_cell.setdefault(cell, []).append(concert_id)
+            if venue is not None:
+                self._by_venue.setdefault(venue, []).append(concert_id)
+            if city is not None:
+                self._by_city.setdefault(city, []).append(concert_id)
+
+    def _unindex_concerts(self, mbid: str) -> None:
+        # Call with self._lock held
+        concert_ids = self._artist_concerts.pop(mbid, [])
+        # Keys the artist's concerts are found under, to filter only those lists
+        keys = [set(), set(), set()]
+        for concert_id in concert_ids:
+            _, store, index = self._concerts[concert_id]
+            for found, key in zip(keys, self._concert_keys(store[index])):
+                found.add(key)
+            # Lets go of the store
+            self._concerts[concert_id] = None
+        removed = set(concert_ids)
+        for by_key, found in zip((self._by_cell, self._by_venue, self._by_city), keys):
+            for key in found:
+                if key not in by_key:
+                    continue
+                by_key[key] = [concert_id for concert_id in by_key[key] if concert_id not in removed]
+                if len(by_key[key]) == 0:
+                    del by_key[key]
+
+    def _candidates(self, query: ConcertQuery) -> Iterable[int]:
+        # Call with self._lock held. Narrows down by the most selective filter the index has
+        if query.lat is not None:
+            min_lat, max_lat, min_long, max_long = concert_index.bounding_box(query.lat, query.long, query.radius_km)
+            candidates = []
+            for cell_lat in range(math.floor(min_lat), math.floor(max_lat) + 1):
+                for cell_long in range(math.floor(min_long), math.floor(max_long) + 1):
+                    candidates.extend(self._by_cell.get((cell_lat, cell_long), ()))
+            return candidates
+        if query.venue is not None:
+            return self._by_venue.get(concert_index.match_key(query.venue), ())
+        if query.city is not None:
+            return self._by_city.get(concert_index.match_key(query.city), ())
+        return range(len(self._concerts))
+
+    def get_all_setlists(self, mbid: str) -> list[SetlistDocument]:
+        with self._lock:
+            artist = self._artists.get(mbid)
+            return artist["setlists"].to_list() if artist else []
+
+    def iter_setlists(self, mbid: str) -> Iterator[SetlistDocument]:
+        with self._lock:
+            artist = self._artists.get(mbid)
+            if artist is None:
+                return
+            # Stores only grow, so the setlists up to the current length stay put while we read them
+            setlists = artist["setlists"]
+            count = len(setlists)
+        for index in range(count):
+            yield setlists[index]
+
+    def get_last_setlist(self, mbid: str) -> SetlistDocument | None:
+        with self._lock:
+            artist = self._artists.get(mbid)
+            return artist["setlists"].last() if artist else None
+
+    def save_stats(self, mbid: str, stats: ArtistStatsDocument) -> None:
+        with self._lock:
+            if mbid in self._artists:
+                self._artists[mbid]["stats"] = stats
+
+    def get_stats(self, mbid: str) -> ArtistStatsDocument | None:
+        with self._lock:
+            artist = self._artists.get(mbid)
+            return artist.get("stats") if artist else None
+
+    def find_song_plays(self, mbid: str, song: str, limit: int) -> list[SetlistDocument]:
+        with self._lock:
+            artist = self._artists.get(mbid)
+            if artist is None:
+                return []
+            store = artist["setlists"]
+            indexes = self._song_plays.get(mbid, {}).get(concert_index.match_key(song), [])
+            # Newest first; among setlists on the same date, the one stored first
+            newest = heapq.nlargest(limit, indexes, key=lambda index: (store[index]["eventDate"], -index))
+            return [store[index] for index in newest]
+
+    def top_songs(self, mbid: str, country: str | None, limit: int) -> list[SongCount]:
+        with self._lock:
+            counts = self._song_counts.get(mbid, {}).get(song_index.country_key(country), {})
+            top = heapq.nsmallest(limit, counts.items(), key=lambda item: (-item[1][1], item[0]))
+        return [SongCount(song=title, plays=shows) for _, (title, shows) in top]
+
+    def find_concerts(self, query: ConcertQuery) -> list[ConcertDocument]:
+        after = None
+        if query.after is not None:
+            try:
+                after = (query.after[0], int(query.after[1]))
+            except ValueError:
+                raise ValueError(f"Invalid concert id '{query.after[1]}'") from None
+
+        with self._lock:
+            found = []
+            for concert_id in self._candidates(query):
+                concert = self._concerts[concert_id]
+                if concert is None:
+                    continue
+                mbid, store, index = concert
+                artist = self._artists[mbid]
+                setlist = store[index]
+                if after is not None and (setlist["eventDate"], concert_id) >= after:
+                    continue
+                if concert_index.matches(query, setlist):
+                    found.append((setlist["eventDate"], concert_id, setlist, mbid, artist["name"]))
+
+        newest = heapq.nlargest(query.limit, found, key=lambda item: (item[0], item[1]))
+        return [
+            concert_index.make_concert(setlist, concert_id, mbid, name, query)
+            for _, concert_id, setlist, mbid, name in newest
+        ]
+
+    def mark_artist_complete(self, mbid: str) -> None:
+        with self._lock:
+            if mbid in self._artists:
+                self._artists[mbid]["inProgress"] = False
+                self._artists[mbid]["lastUpdated"] = now()
+
+    def delete_artist(self, mbid: str) -> None:
+        with self._lock:
+            self._artists.pop(mbid, None)
+            self._unindex_concerts(mbid)
+            self._song_plays.pop(mbid, None)
+            self._song_counts.pop(mbid, None)
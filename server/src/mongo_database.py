@@ -0,0 +1,575 @@
+# mongo_database.py
+# Database backed by a MongoDB server. Each artist is one document, holding an array of their setlists.
+# The concert index is a second collection with a document per valid setlist, indexed by location (2dsphere),
+# date, venue and city. Setlists stored before it existed are indexed once at startup; a marker in the meta
+# collection says when that's done, so a backfill cut short carries on at the next start.
+# The song index (see song_index.py) is two more: song_plays has a document per song per setlist, holding the
+# setlist without its song list, and song_counts has running totals of shows per song and country.
+#
+# Against a replica set, snapshot and statistics reads (an artist's setlists, stats, song counts, concerts) can
+# go to secondaries, so they don't compete with fetches writing to the primary. Reads follow two rules:
+#   - A secondary further than MONGO_MAX_STALENESS_S behind the primary isn't read from. With none in reach,
+#     reads go to the primary (the driver's maxStalenessSeconds)
+#   - An artist written by this process within that time is read from the primary, so a fetch, and clients
+#     joining it, always see every setlist it stored. A secondary can't miss writes older than that
+# Reads that coordinate fetches (check_artist, get_last_setlist) always go to the primary.
+#
+# Config (all optional):
+#   MONGO_URI (default mongodb://localhost:27017/), e.g. mongodb://localhost:27018/?replicaSet=rs0
+#   MONGO_MAX_POOL_SIZE, MONGO_MIN_POOL_SIZE: connections kept per server (default 100 and 0)
+#   MONGO_WAIT_QUEUE_TIMEOUT_MS: how long a query waits for a free connection (default 5000)
+#   MONGO_SERVER_SELECTION_TIMEOUT_MS (default 200)
+#   MONGO_SECONDARY_READS: 1 to read from secondaries as above (default 0)
+#   MONGO_MAX_STALENESS_S (default and minimum 90, MongoDB's lowest allowed)
+
+from threading import Event, Lock, Thread
+from typing import TYPE_CHECKING, Iterator
+from database import Database, ArtistDocument, ArtistStatsDocument, ConcertDocument, ConcertQuery, PendingWrites, SetlistDocument, SongCount, WriteBatchError, now
+import concert_index
+import song_index
+import datetime
+import logging
+import os
+import time
+
+if TYPE_CHECKING:  # pragma: no cover
+    from pymongo.collection import Collection
+
+logger = logging.getLogger(__name__)
+
+# Setlists per round trip when iterating over an artist's setlists
+ITER_BATCH_SIZE = 500
+# Concerts per insert when indexing setlists that were stored before the concert index existed
+BACKFILL_BATCH_SIZE = 1000
+
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/")
+MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", 100))
+MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", 0))
+WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", 5000))
+# Short by default since the server is usually hosted locally
+SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", 200))
+SECONDARY_READS = os.getenv("MONGO_SECONDARY_READS", "0") == "1"
+MAX_STALENESS_S = max(90, int(os.getenv("MONGO_MAX_STALENESS_S", 90)))
+# Writes newer than this may not have reached a secondary yet. The driver only learns how far behind
+# a secondary is every heartbeat (10 s), so it could be that much further behind than it knows
+READ_YOUR_WRITES_S = MAX_STALENESS_S + 10
+# Artists whose last write is remembered, before the ones written too long ago are forgotten
+MAX_RECENT_WRITES = 10000
+
+
+class MongoDatabase(Database):
+    def __init__(self):
+        # Importing pymongo and connecting happen in the background, so the app can start
+        # serving requests that don't need the database right away.
+        self._client = None
+        self._artists_collection: 'Collection[ArtistDocument] | None' = None
+        self._concerts_collection: 'Collection | None' = None
+        self._song_plays_collection: 'Collection | None' = None
+        self._song_counts_collection: 'Collection | None' = None
+        self._meta_collection: 'Collection | None' = None
+        # Collection name -> the collection, read from secondaries. Empty unless SECONDARY_READS
+        self._secondaries: dict[str, 'Collection'] = {}
+        # mbid -> when this process last wrote the artist
+        self._last_writes: dict[str, float] = {}
+        self._last_writes_lock = Lock()
+        self._ready = Event()
+        Thread(target=self._connect, daemon=True).start()
+
+    def _connect(self) -> None:
+        from pymongo import MongoClient
+
+        self._client = MongoClient(
+            MONGO_URI,
+            serverSelectionTimeoutMS=SERVER_SELECTION_TIMEOUT_MS,
+            maxPoolSize=MAX_POOL_SIZE,
+            minPoolSize=MIN_POOL_SIZE,
+            waitQueueTimeoutMS=WAIT_QUEUE_TIMEOUT_MS,
+            tz_aware=True
+        )
+        # Keep a handle to the database collection
+        db = self._client[os.getenv("MONGO_DB_NAME")]
+        self._artists_collection = db["artists"]
+        self._concerts_collection = db["concerts"]
+        self._song_plays_collection = db["song_plays"]
+        self._song_counts_collection = db["song_counts"]
+        self._meta_collection = db["meta"]
+        if SECONDARY_READS:
+            from pymongo.read_preferences import SecondaryPreferred
+            preference = SecondaryPreferred(max_staleness=MAX_STALENESS_S)
+            self._secondaries = {
+                collection.name: collection.with_options(read_preference=preference)
+                for collection in (self._artists_collection, self._concerts_collection,
+                                   self._song_plays_collection, self._song_counts_collection)
+            }
+        self._ready.set()
+
+        # Warm up the connection pool before the first query needs it
+        try:
+            self._client.server_info()
+        except Exception as e:
+            logger.error(f"Could not connect to the database: {e}")
+            return
+
+        try:
+            self._prepare_concert_index()
+        except Exception as e:
+            logger.error(f"Error preparing the concert index: {e}")
+
+        try:
+            from pymongo import ASCENDING, DESCENDING
+            self._song_plays_collection.create_index(
+                [("artistMbid", ASCENDING), ("songKey", ASCENDING), ("eventDate", DESCENDING), ("_id", ASCENDING)]
+            )
+            self._song_counts_collection.create_index(
+                [("artistMbid", ASCENDING), ("countryKey", ASCENDING), ("songKey", ASCENDING)], unique=True
+            )
+            self._song_counts_collection.create_index(
+                [("artistMbid", ASCENDING), ("countryKey", ASCENDING), ("plays", DESCENDING), ("songKey", ASCENDING)]
+            )
+        except Exception as e:
+            logger.error(f"Error preparing the song index: {e}")
+
+    def _prepare_concert_index(self) -> None:
+        from pymongo import ASCENDING, DESCENDING, GEOSPHERE
+
+        # Each index ends in the sort order of find_concerts, so pages come straight off the index
+        self._concerts_collection.create_index([("location", GEOSPHERE), ("eventDate", DESCENDING)])
+        self._concerts_collection.create_index([("eventDate", DESCENDING), ("_id", DESCENDING)])
+        self._concerts_collection.create_index([("venueKey", ASCENDING), ("eventDate", DESCENDING), ("_id", DESCENDING)])
+        self._concerts_collection.create_index([("cityKey", ASCENDING), ("eventDate", DESCENDING), ("_id", DESCENDING)])
+        # Also finds an artist's concert by date, for the backfill below
+        self._concerts_collection.create_index([("artistMbid", ASCENDING), ("eventDate", DESCENDING)])
+
+        # Setlists stored before the concert index existed get indexed once. The index may already have some
+        # concerts: from fetches since, or a backfill that was cut short. So each one is upserted, and the
+        # backfill only counts as done once the last batch is in
+        if self._meta_collection.find_one({"_id": "concertBackfill", "complete": True}) is not None:
+            return
+        pipeline = [
+            {"$unwind": "$setlists"},
+            {"$project": {"_id": 0, "mbid": 1, "setlist": "$setlists"}}
+        ]
+        batch = []
+        for row in self._artists_collection.aggregate(pipeline, batchSize=BACKFILL_BATCH_SIZE):
+            batch += self._concert_upserts(row["mbid"], [row["setlist"]])
+            if len(batch) >= BACKFILL_BATCH_SIZE:
+                self._concerts_collection.bulk_write(batch, ordered=False)
+                batch = []
+        if len(batch) > 0:
+            self._concerts_collection.bulk_write(batch, ordered=False)
+        self._meta_collection.update_one({"_id": "concertBackfill"}, {"$set": {"complete": True}}, upsert=True)
+        logger.info("Concert index backfill complete")
+
+    @staticmethod
+    def _concert_docs(mbid: str, setlists: list[SetlistDocument]) -> list[dict]:
+        return [
+            {
+                "artistMbid": mbid,
+                "eventDate": setlist["eventDate"],
+                "venueKey": concert_index.match_key(setlist.get("venueName")),
+                "cityKey": concert_index.match_key(setlist.get("cityName")),
+                "location": {"type": "Point", "coordinates": [setlist["cityLong"], setlist["cityLat"]]},
+                "setlist": setlist
+            }
+            for setlist in setlists if concert_index.is_indexed(setlist)
+        ]
+
+    @classmethod
+    def _concert_upserts(cls, mbid: str, setlists: list[SetlistDocument]) -> list:
+        from pymongo import UpdateOne
+
+        # A setlist's URL holds its setlist.fm id, so it tells the artist's concerts on the same date apart
+        return [
+            UpdateOne(
+                {"artistMbid": mbid, "eventDate": doc["eventDate"], "setlist.setlistUrl": doc["setlist"].get("setlistUrl")},
+                {"$setOnInsert": doc},
+                upsert=True
+            )
+            for doc in cls._concert_docs(mbid, setlists)
+        ]
+
+    def _index_concerts(self, mbid: str, setlists: list[SetlistDocument]) -> None:
+        docs = self._concert_docs(mbid, setlists)
+        if len(docs) > 0:
+            self._concerts.insert_many(docs, ordered=False)
+
+    @staticmethod
+    def _song_play_docs(mbid: str, setlists: list[SetlistDocument]) -> list[dict]:
+        docs = []
+        for setlist in setlists:
+            songs = song_index.setlist_songs(setlist)
+            if len(songs) == 0:
+                continue
+            # Without its song list, or each setlist would be stored once per song
+            bare = {key: value for key, value in setlist.items() if key != "songs"}
+            docs += [
+                {"artistMbid": mbid, "songKey": key, "eventDate": setlist.get("eventDate"), "setlist": bare}
+                for key in songs
+            ]
+        return docs
+
+    @staticmethod
+    def _song_count_updates(mbid: str, setlists: list[SetlistDocument]) -> list:
+        from pymongo import UpdateOne
+
+        return [
+            UpdateOne(
+                {"artistMbid": mbid, "countryKey": country, "songKey": key},
+                {"$inc": {"plays": shows}, "$setOnInsert": {"title": title}},
+                upsert=True
+            )
+            for (country, key), (title, shows) in song_index.count_plays(setlists).items()
+        ]
+
+    def _index_songs(self, writes: list[tuple[str, list[SetlistDocument]]]) -> None:
+        plays = [doc for mbid, setlists in writes for doc in self._song_play_docs(mbid, setlists)]
+        if len(plays) > 0:
+            self._song_plays.insert_many(plays, ordered=False)
+        counts = [update for mbid, setlists in writes for update in self._song_count_updates(mbid, setlists)]
+        if len(counts) > 0:
+            self._song_counts.bulk_write(counts, ordered=False)
+
+    @property
+    def _artists(self) -> 'Collection[ArtistDocument]':
+        # Queries made before the client exists wait for it
+        self._ready.wait()
+        return self._artists_collection
+
+    @property
+    def _concerts(self) -> 'Collection':
+        self._ready.wait()
+        return self._concerts_collection
+
+    @property
+    def _song_plays(self) -> 'Collection':
+        self._ready.wait()
+        return self._song_plays_collection
+
+    @property
+    def _song_counts(self) -> 'Collection':
+        self._ready.wait()
+        return self._song_counts_collection
+
+    def _for_reads(self, collection: 'Collection', mbid: str | None = None) -> 'Collection':
+        """Where a snapshot or statistics read goes: a secondary, unless they're off or the artist
+        was written lately (see the top of this file)."""
+        secondary = self._secondaries.get(collection.name)
+        if secondary is None:
+            return collection
+        if mbid is not None:
+            with self._last_writes_lock:
+                last_write = self._last_writes.get(mbid)
+            if last_write is not None and time.monotonic() - last_write < READ_YOUR_WRITES_S:
+                return collection
+        return secondary
+
+    def _wrote(self, *mbids: str) -> None:
+        # Not _secondaries, which may not be set up yet: writes made while connecting count too
+        if not SECONDARY_READS:
+            return
+        current_time = time.monotonic()
+        with self._last_writes_lock:
+            for mbid in mbids:
+                # Moved to the end, so the dict stays in order of last write
+                self._last_writes.pop(mbid, None)
+                self._last_writes[mbid] = current_time
+            if len(self._last_writes) > MAX_RECENT_WRITES:
+                for mbid, last_write in list(self._last_writes.items()):
+                    if current_time - last_write < READ_YOUR_WRITES_S:
+                        break
+                    del self._last_writes[mbid]
+
+    def insert_artist(self, mbid: str, name: str) -> None:
+        self._wrote(mbid)
+        try:
+            self._artists.insert_one(ArtistDocument(
+                mbid=mbid,
+                name=name,
+                lastUpdated=now(),
+                inProgress=True,
+                setlists=[]
+            ))
+        except Exception as e:
+            logger.error(f"Error inserting new artist '{mbid}': {e}")
+
+    def get_artist_names(self) -> list[tuple[str, str]]:
+        try:
+            # Leave the setlists on the server
+            return [
+                (artist["mbid"], artist.get("name"))
+                for artist in self._for_reads(self._artists).find({}, {"_id": 0, "mbid": 1, "name": 1})
+            ]
+        except Exception as e:
+            logger.error(f"Error retrieving artist names: {e}")
+            return []
+
+    def reinsert_artist(self, mbid: str) -> None:
+        self._wrote(mbid)
+        try:
+            self._artists.update_one(
+                {"mbid": mbid},
+                {"$set": {
+                    "inProgress": True,
+                    "lastUpdated": now()
+                }}
+            )
+        except Exception as e:
+            logger.error(f"Error reinserting artist '{mbid}': {e}")
+
+    def check_artist(self, mbid: str) -> tuple[bool, bool, datetime.datetime | None]:
+        try:
+            artist = self._artists.find_one({"mbid": mbid})
+        except Exception as e:
+            logger.error(f"Error checking artist '{mbid}': {e}")
+            return False, False, None
+
+        if artist is not None:
+            return (
+                True,
+                artist["inProgress"],
+                artist["lastUpdated"]
+            )
+
+        return False, False, None
+
+    def insert_setlists(self, mbid: str, new_setlists: list[SetlistDocument]) -> None:
+        self._wrote(mbid)
+        try:
+            result = self._artists.update_one(
+                {"mbid": mbid},
+                {
+                    "$set": {"lastUpdated": now()},
+                    "$push": {"setlists": {"$each": new_setlists}}
+                }
+            )
+            if result.matched_count > 0:
+                self._index_concerts(mbid, new_setlists)
+                self._index_songs([(mbid, new_setlists)])
+        except Exception as e:
+            logger.error(f"Error inserting new setlists for '{mbid}': {e}")
+
+    def get_all_setlists(self, mbid: str) -> list[SetlistDocument]:
+        try:
+            artist = self._for_reads(self._artists, mbid).find_one({"mbid": mbid})
+        except Exception as e:
+            logger.error(f"Error retrieving all setlists for '{mbid}': {e}")
+            return []
+
+        # hope the artist was found
+        return artist["setlists"] if artist else []
+
+    def iter_setlists(self, mbid: str) -> Iterator[SetlistDocument]:
+        # Unwind the artist's setlists array on the server, so they come back a batch at a time
+        # instead of in one document
+        pipeline = [
+            {"$match": {"mbid": mbid}},
+            {"$unwind": "$setlists"},
+            {"$replaceRoot": {"newRoot": "$setlists"}}
+        ]
+
+        try:
+            with self._for_reads(self._artists, mbid).aggregate(pipeline, batchSize=ITER_BATCH_SIZE) as cursor:
+                yield from cursor
+        except Exception as e:
+            logger.error(f"Error retrieving setlists for '{mbid}': {e}")
+
+    def get_last_setlist(self, mbid: str) -> SetlistDocument | None:
+        pipeline = [
+            {"$match": {"mbid": mbid}},
+            {
+                # Write the last setlist into a new field `lastSetlist`
+                "$set": {
+                    "lastSetlist": {
+                        "$arrayElemAt": [
+                            # Sort by descending eventDate, then take first elem
+                            {"$sortArray": {
+                                "input": "$setlists",
+                                "sortBy": {"eventDate": -1}
+                            }},
+                            0
+                        ]
+                    }
+                }
+            },
+            {"$project": {"_id": 0, "lastSetlist": 1}}
+        ]
+
+        try:
+            result = list(self._artists.aggregate(pipeline))
+        except Exception as e:
+            logger.error(f"Error retrieving last setlist for '{mbid}': {e}")
+            return None
+        last_setlist = result[0].get("lastSetlist") if result else None
+        return last_setlist
+
+    def save_stats(self, mbid: str, stats: ArtistStatsDocument) -> None:
+        self._wrote(mbid)
+        try:
+            self._artists.update_one({"mbid": mbid}, {"$set": {"stats": stats}})
+        except Exception as e:
+            logger.error(f"Error saving stats for '{mbid}': {e}")
+
+    def get_stats(self, mbid: str) -> ArtistStatsDocument | None:
+        try:
+            # Leave the setlists on the server
+            artist = self._for_reads(self._artists, mbid).find_one({"mbid": mbid}, {"_id": 0, "stats": 1})
+        except Exception as e:
+            logger.error(f"Error retrieving stats for '{mbid}': {e}")
+            return None
+
+        return artist.get("stats") if artist else None
+
+    def find_song_plays(self, mbid: str, song: str, limit: int) -> list[SetlistDocument]:
+        from pymongo import ASCENDING, DESCENDING
+
+        try:
+            docs = list(
+                self._for_reads(self._song_plays, mbid).find({"artistMbid": mbid, "songKey": concert_index.match_key(song)}, {"setlist": 1})
+                .sort([("eventDate", DESCENDING), ("_id", ASCENDING)])
+                .limit(limit)
+            )
+        except Exception as e:
+            logger.error(f"Error finding plays of '{song}' for '{mbid}': {e}")
+            return []
+
+        return [doc["setlist"] for doc in docs]
+
+    def top_songs(self, mbid: str, country: str | None, limit: int) -> list[SongCount]:
+        from pymongo import ASCENDING, DESCENDING
+
+        try:
+            docs = list(
+                self._for_reads(self._song_counts, mbid).find({"artistMbid": mbid, "countryKey": song_index.country_key(country)})
+                .sort([("plays", DESCENDING), ("songKey", ASCENDING)])
+                .limit(limit)
+            )
+        except Exception as e:
+            logger.error(f"Error retrieving top songs for '{mbid}': {e}")
+            return []
+
+        return [SongCount(song=doc["title"], plays=doc["plays"]) for doc in docs]
+
+    def find_concerts(self, query: ConcertQuery) -> list[ConcertDocument]:
+        conditions = []
+        if query.lat is not None:
+            conditions.append({"location": {"$geoWithin": {
+                "$centerSphere": [[query.long, query.lat], query.radius_km / concert_index.EARTH_RADIUS_KM]
+            }}})
+        if query.venue is not None:
+            conditions.append({"venueKey": concert_index.match_key(query.venue)})
+        if query.city is not None:
+            conditions.append({"cityKey": concert_index.match_key(query.city)})
+        if query.date_from is not None:
+            conditions.append({"eventDate": {"$gte": query.date_from}})
+        if query.date_to is not None:
+            conditions.append({"eventDate": {"$lte": query.date_to}})
+        if query.after is not None:
+            from bson import ObjectId
+            from bson.errors import InvalidId
+            try:
+                after_date, after_id = query.after[0], ObjectId(query.after[1])
+            except InvalidId:
+                raise ValueError(f"Invalid concert id '{query.after[1]}'") from None
+            conditions.append({"$or": [
+                {"eventDate": {"$lt": after_date}},
+                {"eventDate": after_date, "_id": {"$lt": after_id}}
+            ]})
+
+        try:
+            docs = list(
+                self._for_reads(self._concerts).find({"$and": conditions} if conditions else {})
+                .sort([("eventDate", -1), ("_id", -1)])
+                .limit(query.limit)
+            )
+            # Names only, without the artists' setlists
+            mbids = list({doc["artistMbid"] for doc in docs})
+            names = {
+                artist["mbid"]: artist.get("name")
+                for artist in self._for_reads(self._artists).find({"mbid": {"$in": mbids}}, {"_id": 0, "mbid": 1, "name": 1})
+            }
+        except Exception as e:
+            logger.error(f"Error finding concerts for {query}: {e}")
+            return []
+
+        return [
+            concert_index.make_concert(doc["setlist"], doc["_id"], doc["artistMbid"], names.get(doc["artistMbid"]), query)
+            for doc in docs
+        ]
+
+    def mark_artist_complete(self, mbid: str) -> None:
+        self._wrote(mbid)
+        try:
+            self._artists.update_one(
+                {"mbid": mbid},
+                {"$set": {
+                    "inProgress": False,
+                    "lastUpdated": now()
+                }}
+            )
+        except Exception as e:
+            logger.error(f"Error marking artist '{mbid}' as complete: {e}")
+
+    def delete_artist(self, mbid: str) -> None:
+        self._wrote(mbid)
+        try:
+            self._artists.delete_one({"mbid": mbid})
+            self._concerts.delete_many({"artistMbid": mbid})
+            self._song_plays.delete_many({"artistMbid": mbid})
+            self._song_counts.delete_many({"artistMbid": mbid})
+        except Exception as e:
+            logger.error(f"Error deleting artist '{mbid}': {e}")
+
+    def write_batch(self, writes: list[PendingWrites]) -> None:
+        from pymongo import UpdateOne
+        from pymongo.errors import BulkWriteError
+
+        # One update per artist, all sent in a single round trip
+        operations = []
+        for pending in writes:
+            update = {"$set": {"lastUpdated": now()}}
+            if pending.in_progress is not None:
+                update["$set"]["inProgress"] = pending.in_progress
+            if pending.stats is not None:
+                update["$set"]["stats"] = pending.stats
+            if pending.setlists:
+                update["$push"] = {"setlists": {"$each": pending.setlists}}
+            operations.append(UpdateOne({"mbid": pending.mbid}, update))
+        if len(operations) == 0:
+            return
+
+        self._wrote(*(pending.mbid for pending in writes))
+        # Updates that failed, by position. There's one per artist, in the order of `writes`
+        failed: set[int] = set()
+        try:
+            self._artists.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            failed = {error["index"] for error in e.details.get("writeErrors", [])}
+        except Exception as e:
+            logger.error(f"Error writing batch for {len(operations)} artists: {e}")
+            raise WriteBatchError(str(e), writes) from e
+        applied = [pending for i, pending in enumerate(writes) if i not in failed]
+
+        try:
+            # An update that matched no artist (deleted, or never inserted) stored nothing, so
+            # there's nothing to index, as in insert_setlists
+            mbids = [pending.mbid for pending in applied if pending.setlists]
+            if len(mbids) > 0:
+                stored = {artist["mbid"] for artist in self._artists.find({"mbid": {"$in": mbids}}, {"_id": 0, "mbid": 1})}
+            else:
+                stored = set()
+            applied = [pending for pending in applied if pending.mbid in stored]
+            concerts = [doc for pending in applied for doc in self._concert_docs(pending.mbid, pending.setlists)]
+            if len(concerts) > 0:
+                self._concerts.insert_many(concerts, ordered=False)
+            self._index_songs([(pending.mbid, pending.setlists) for pending in applied])
+        except Exception as e:
+            # The setlists themselves are stored, so trying again would store them twice
+            logger.error(f"Error indexing batch for {len(applied)} artists: {e}")
+
+        if len(failed) > 0:
+            logger.error(f"Error writing batch: {len(failed)} of {len(operations)} artists failed")
+            raise WriteBatchError(f"{len(failed)} artists failed", [writes[i] for i in sorted(failed)])
+
+    def close(self) -> None:
+        self._ready.wait()
+        self._client.close()
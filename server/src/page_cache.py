@@ -0,0 +1,137 @@
+# page_cache.py
+# On-disk cache of raw setlist.fm responses, so pages that haven't changed aren't downloaded again.
+#
+# Responses are stored zlib-compressed in an SQLite file, keyed by request path and query params, along
+# with the validators upstream sent (ETag, Last-Modified). Until an entry expires it's used as is, without
+# a request. After that, it's revalidated with a conditional request: a 304 costs a request, but no body.
+# How long an entry stays fresh is up to the caller (see SetlistFmAPI), e.g. long for pages of old setlists.
+#
+# Config:
+#   SETLISTFM_CACHE_PATH: file to keep the cache in. Unset, nothing is cached
+
+from dataclasses import dataclass
+from threading import Lock
+from urllib.parse import urlencode
+import logging
+import os
+import sqlite3
+import time
+import zlib
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    key TEXT PRIMARY KEY,
+    body BLOB NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    fetched_at REAL NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS pages_by_expiry ON pages (expires_at);
+"""
+
+# Expired entries are still worth keeping a while for their validators, then they go
+KEEP_EXPIRED_S = 30 * 24 * 3600
+COMPRESSION_LEVEL = 6
+
+
+@dataclass
+class CachedPage:
+    body: bytes
+    etag: str | None
+    last_modified: str | None
+    fetched_at: float
+    expires_at: float
+
+    @property
+    def is_fresh(self) -> bool:
+        return self.expires_at > time.time()
+
+    def conditional_headers(self) -> dict:
+        """Headers asking upstream to send the page only if it changed since it was cached."""
+        headers = {}
+        if self.etag is not None:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified is not None:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+def cache_key(path: str, params: dict) -> str:
+    # Sorted, so the order params were given in doesn't matter
+    return f"{path}?{urlencode(sorted((key, str(value)) for key, value in params.items()))}"
+
+
+class PageCache:
+    def __init__(self, path: str):
+        # One connection shared by every thread. Requests are far slower than the queries, so a lock is enough
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._lock = Lock()
+        # Usage counts
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self._prune()
+
+    @classmethod
+    def from_env(cls) -> 'PageCache | None':
+        path = os.getenv("SETLISTFM_CACHE_PATH")
+        if not path:
+            return None
+        try:
+            return cls(path)
+        except sqlite3.Error as e:
+            # Requests work just as well without the cache
+            logger.error(f"Could not open setlist.fm cache at {path}: {e}")
+            return None
+
+    def get(self, path: str, params: dict) -> CachedPage | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT body, etag, last_modified, fetched_at, expires_at FROM pages WHERE key = ?",
+                (cache_key(path, params),)
+            ).fetchone()
+        if row is None:
+            return None
+        body, etag, last_modified, fetched_at, expires_at = row
+        return CachedPage(zlib.decompress(body), etag, last_modified, fetched_at, expires_at)
+
+    def put(self, path: str, params: dict, body: bytes, etag: str | None, last_modified: str | None,
+            ttl_s: float) -> None:
+        """Store a response, fresh for `ttl_s`."""
+        current_time = time.time()
+        compressed = zlib.compress(body, COMPRESSION_LEVEL)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pages (key, body, etag, last_modified, fetched_at, expires_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (cache_key(path, params), compressed, etag, last_modified, current_time, current_time + ttl_s)
+            )
+
+    def refresh(self, path: str, params: dict, ttl_s: float) -> None:
+        """Upstream confirmed the cached page is current (HTTP 304): it's fresh for another `ttl_s`."""
+        current_time = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE pages SET fetched_at = ?, expires_at = ? WHERE key = ?",
+                (current_time, current_time + ttl_s, cache_key(path, params))
+            )
+
+    def usage(self) -> dict:
+        return {"hits": self.hits, "revalidated": self.revalidated, "misses": self.misses}
+
+    def _prune(self) -> None:
+        with self._lock, self._conn:
+            deleted = self._conn.execute(
+                "DELETE FROM pages WHERE expires_at < ?", (time.time() - KEEP_EXPIRED_S,)
+            ).rowcount
+        if deleted > 0:
+            logger.info(f"Pruned {deleted} long expired pages from the setlist.fm cache")
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -2,7 +2,15 @@
 # Define a custom data type to represent a setlist.
 # Stores a subset of the data returned by setlist.fm API, keeping only relevant info
 
+from database import SetlistDocument
+
 class Setlist:
+    # Instances are made for every setlist fetched, so skip the per-instance __dict__
+    __slots__ = (
+        "event_date", "city_lat", "city_long", "is_valid", "venue_name", "city_name",
+        "state_name", "country_name", "setlist_url", "songs_performed", "songs"
+    )
+
     # raw_setlist: dict containing raw data from setlist.fm API
     def __init__(self, raw_setlist: dict):
         # Essential fields: if any are missing, mark the setlist as invalid for this app.
@@ -25,6 +33,7 @@ class Setlist:
         # Count songs performed in all sets. Treat 0 count as missing data.
         song_count = sum(len(set["song"]) for set in raw_setlist["sets"]["set"])
         self.songs_performed = song_count if song_count > 0 else None
+        self.songs = song_titles(raw_setlist["sets"]["set"])
 
     # Convert Setlist object to a dictionary cause Flask needs it
     def to_dict(self) -> dict:
@@ -39,7 +48,8 @@ class Setlist:
                 "stateName": self.state_name,
                 "countryName": self.country_name,
                 "setlistUrl": self.setlist_url,
-                "songsPerformed": self.songs_performed
+                "songsPerformed": self.songs_performed,
+                "songs": self.songs
             }
         else:
             return {"isValid": False}
@@ -57,3 +67,53 @@ class Setlist:
     def convert_date_to_ISO(date: str) -> str:
         """Convert a date from DD-MM-YYYY to YYYY-MM-DD."""
         return "-".join(date.split("-")[::-1])
+
+
+def song_titles(sets: list[dict]) -> list[str]:
+    """Titles of the songs played in a setlist's sets, in order.
+    Tapes (intros and outros played from a recording) aren't counted as songs played."""
+    return [
+        song["name"]
+        for set in sets
+        for song in set.get("song", ())
+        if song.get("name") and not song.get("tape")
+    ]
+
+
+def convert_raw_setlists(raw_setlists: list[dict]) -> list[SetlistDocument]:
+    """Convert a page of raw setlists to dicts, the same way as Setlist.convert_setlists,
+    but without a Setlist object in between.
+    Unlike Setlist, a setlist missing its venue or sets comes out invalid or with no song count, instead of raising."""
+    converted_setlists = []
+    append = converted_setlists.append
+    for raw_setlist in raw_setlists:
+        city = raw_setlist.get("venue", {}).get("city", {})
+        # Essential fields: if any are missing, the setlist is invalid for this app.
+        try:
+            event_date = raw_setlist["eventDate"]
+            coords = city["coords"]
+            city_lat = coords["lat"]
+            city_long = coords["long"]
+        except KeyError:
+            append({"isValid": False})
+            continue
+
+        sets = raw_setlist.get("sets", {}).get("set", ())
+        song_count = 0
+        for set in sets:
+            song_count += len(set.get("song", ()))
+
+        append({
+            "isValid": True,
+            "eventDate": "-".join(event_date.split("-")[::-1]),
+            "venueName": raw_setlist["venue"].get("name", None),
+            "cityName": city.get("name", None),
+            "cityLat": city_lat,
+            "cityLong": city_long,
+            "stateName": city.get("state", None),
+            "countryName": city.get("country", {}).get("name", None),
+            "setlistUrl": raw_setlist.get("url", None),
+            "songsPerformed": song_count if song_count > 0 else None,
+            "songs": song_titles(sets)
+        })
+    return converted_setlists
@@ -0,0 +1,147 @@
+# setlist_store.py
+# Compact storage for an artist's setlists, for keeping thousands of them in memory.
+#
+# Setlists are stored column by column instead of as one dict each: coordinates in float arrays,
+# and repeated strings (dates, venues, cities, states, countries, song titles) once per store, referenced by index.
+# Setlist dicts are rebuilt on the way out, identical to the ones that went in.
+
+from array import array
+from typing import Iterable, Iterator
+from database import SetlistDocument
+import sys
+
+# Most setlist URLs start with this, so only the rest is stored
+URL_PREFIX = "https://www.setlist.fm/setlist/"
+
+# String columns, stored as indexes into the string table
+STRING_FIELDS = ("eventDate", "venueName", "cityName", "stateName", "countryName")
+
+
+class SetlistStore:
+    __slots__ = (
+        "_valid", "_lat", "_long", "_songs", "_urls", "_string_ids", "_strings", "_string_index",
+        "_has_titles", "_title_ids", "_title_ends"
+    )
+
+    def __init__(self, setlists: Iterable[SetlistDocument] = ()):
+        self._valid = bytearray()
+        self._lat = array("d")
+        self._long = array("d")
+        # -1 stands for None
+        self._songs = array("i")
+        self._urls: list[str | None] = []
+        self._string_ids = {field: array("I") for field in STRING_FIELDS}
+        # Song titles of all setlists, one after another, as indexes into the string table.
+        # A setlist's titles end at its entry in _title_ends, and start where the previous setlist's end.
+        # _has_titles tells an empty list of titles apart from none at all
+        self._has_titles = bytearray()
+        self._title_ids = array("I")
+        self._title_ends = array("I")
+        # Index 0 stands for None
+        self._strings: list[str | None] = [None]
+        self._string_index: dict[str, int] = {}
+        self.extend(setlists)
+
+    def _string_id(self, value: str | None) -> int:
+        if value is None:
+            return 0
+        string_id = self._string_index.get(value)
+        if string_id is None:
+            string_id = self._string_index[value] = len(self._strings)
+            self._strings.append(sys.intern(value))
+        return string_id
+
+    def append(self, setlist: SetlistDocument) -> None:
+        # Invalid setlists are stored as {"isValid": False}, so their columns are just placeholders
+        is_valid = setlist.get("isValid", False)
+        self._valid.append(is_valid)
+        self._lat.append(setlist["cityLat"] if is_valid else 0.0)
+        self._long.append(setlist["cityLong"] if is_valid else 0.0)
+        songs = setlist.get("songsPerformed")
+        self._songs.append(-1 if songs is None else songs)
+
+        url = setlist.get("setlistUrl")
+        if url is not None and url.startswith(URL_PREFIX):
+            url = url[len(URL_PREFIX):]
+        self._urls.append(url)
+
+        for field in STRING_FIELDS:
+            self._string_ids[field].append(self._string_id(setlist.get(field)))
+
+        titles = setlist.get("songs")
+        self._has_titles.append(titles is not None)
+        if titles:
+            self._title_ids.extend(self._string_id(title) for title in titles)
+        self._title_ends.append(len(self._title_ids))
+
+    def extend(self, setlists: Iterable[SetlistDocument]) -> None:
+        for setlist in setlists:
+            self.append(setlist)
+
+    def __len__(self) -> int:
+        return len(self._valid)
+
+    def __getitem__(self, index: int) -> SetlistDocument:
+        if index < 0:
+            # Song titles are found from the previous setlist's end, so negative indexes need resolving
+            index += len(self._valid)
+        if not self._valid[index]:
+            return {"isValid": False}
+
+        strings = self._strings
+        url = self._urls[index]
+        if url is not None and not url.startswith("http"):
+            url = URL_PREFIX + url
+        songs = self._songs[index]
+        # Same keys, in the same order, as Setlist.to_dict
+        setlist = {
+            "isValid": True,
+            "eventDate": strings[self._string_ids["eventDate"][index]],
+            "venueName": strings[self._string_ids["venueName"][index]],
+            "cityName": strings[self._string_ids["cityName"][index]],
+            "cityLat": self._lat[index],
+            "cityLong": self._long[index],
+            "stateName": strings[self._string_ids["stateName"][index]],
+            "countryName": strings[self._string_ids["countryName"][index]],
+            "setlistUrl": url,
+            "songsPerformed": None if songs == -1 else songs
+        }
+        if self._has_titles[index]:
+            start = self._title_ends[index - 1] if index > 0 else 0
+            setlist["songs"] = [strings[title_id] for title_id in self._title_ids[start:self._title_ends[index]]]
+        return setlist
+
+    def __iter__(self) -> Iterator[SetlistDocument]:
+        for index in range(len(self)):
+            yield self[index]
+
+    def to_list(self) -> list[SetlistDocument]:
+        return list(self)
+
+    def event_dates(self) -> list[str]:
+        """Each setlist's eventDate, without rebuilding the setlists. Invalid setlists have none, and get "",
+        so dates compare as strings with those coming last."""
+        strings = self._strings
+        return [strings[string_id] or "" for string_id in self._string_ids["eventDate"]]
+
+    def last(self) -> SetlistDocument | None:
+        """The setlist with the latest eventDate, or the first such setlist if there's a tie
+        (like a stable sort by descending date). Invalid setlists have no date and come last."""
+        if len(self) == 0:
+            return None
+        dates = self.event_dates()
+        best = 0
+        for index in range(1, len(dates)):
+            if dates[index] > dates[best]:
+                best = index
+        return self[best]
+
+    def nbytes(self) -> int:
+        """Approximate memory held by the store, in bytes."""
+        columns = (self._valid, self._lat, self._long, self._songs, self._has_titles, self._title_ids, self._title_ends)
+        size = sum(sys.getsizeof(column) for column in columns)
+        size += sum(sys.getsizeof(ids) for ids in self._string_ids.values())
+        size += sys.getsizeof(self._urls) + sum(sys.getsizeof(url) for url in self._urls if url is not None)
+        size += sys.getsizeof(self._strings) + sys.getsizeof(self._string_index)
+        size += sum(sys.getsizeof(string) for string in self._strings if string is not None)
+        return size
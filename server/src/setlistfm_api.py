@@ -1,20 +1,40 @@
 # setlistfm_api.py
 # Interface for the setlist.fm API. Defines several functions to interact with the API.
-
+#
+# Requests are spread across all API keys in SETLISTFM_API_KEYS (comma-separated), or the single
+# SETLISTFM_API_KEY. Each key has its own rate limit, shared by every request in the process.
+#
+# Setlist pages and artist info are cached on disk when SETLISTFM_CACHE_PATH is set (see page_cache.py).
+# Pages of old setlists rarely change, so they stay fresh for long; page 1, where new setlists show up,
+# is always checked with upstream, but with a conditional request.
+#
+# Timeouts follow each endpoint's observed latency (see LatencyTracker), instead of a fixed 15 s. A request
+# still going when most of its kind would have finished is hedged: a duplicate goes out, with its own key
+# and rate limit slot, and whichever answers first is used. Hedges are limited to a share of requests.
+# Time spent waiting for a rate limit slot doesn't count as latency, so requests aren't hedged for it.
+#
+# While setlist.fm is down, requests fail fast with CircuitOpenError (see circuit_breaker.py), or are answered
+# from the cache if it has the page, however old.
+
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+import datetime
+import math
+import re
 import time
 import requests
-import json
+import json_codec
 import os
-from dotenv import load_dotenv
 import logging
 from threading import Lock
-
-load_dotenv()
+from typing import Callable
+from circuit_breaker import CircuitOpenError
+from page_cache import PageCache
+import circuit_breaker
 
 logger = logging.getLogger(__name__)
 
 API_URL = "https://api.setlist.fm/rest/1.0"
-API_KEY = os.getenv("SETLISTFM_API_KEY")
 
 # Max number of times to attempt an API request before giving up
 MAX_ATTEMPTS = 5
@@ -23,73 +43,331 @@ MAX_ATTEMPTS = 5
 # a speedy turnaround for recently searched artists
 RATE_LIMIT_MS = 250
 
+# A key that gets this many 429s in a row is set aside for QUARANTINE_MS
+QUARANTINE_AFTER_429S = 3
+QUARANTINE_MS = 60_000
+# A key that is rejected (401/403) is set aside for longer
+AUTH_QUARANTINE_MS = 15 * 60_000
+# How often to log per-key usage
+USAGE_LOG_INTERVAL_MS = 60 * 60_000
+
+# How long cached responses are used without asking upstream.
+# Pages whose newest setlist is older than OLD_PAGE_AFTER_DAYS are only edited now and then
+OLD_PAGE_AFTER_DAYS = 365
+OLD_PAGE_TTL_S = 30 * 24 * 3600
+RECENT_PAGE_TTL_S = 24 * 3600
+ARTIST_INFO_TTL_S = 7 * 24 * 3600
+
+# Timeouts: until an endpoint has MIN_LATENCY_SAMPLES, requests wait up to MAX_TIMEOUT_S.
+# After that, TIMEOUT_FACTOR times its p99 latency (within MIN_TIMEOUT_S..MAX_TIMEOUT_S)
+LATENCY_WINDOW = 200
+MIN_LATENCY_SAMPLES = 20
+TIMEOUT_FACTOR = 3
+MIN_TIMEOUT_S = 2.0
+MAX_TIMEOUT_S = 15.0
+# Hedging: a duplicate goes out once a request takes longer than the endpoint's HEDGE_PERCENTILE latency
+# (at least MIN_HEDGE_AFTER_S). Each request earns HEDGE_SHARE of a hedge, so hedges stay a small share
+HEDGE_PERCENTILE = 95
+MIN_HEDGE_AFTER_S = 0.5
+HEDGE_SHARE = 0.05
+MAX_SAVED_HEDGES = 5
+
+
+def _now_ms() -> int:
+    # Store times in milliseconds (python seems to hate this)
+    return time.time_ns() // 1_000_000
+
+
+class ApiKey:
+    """An API key with its own rate limit and usage counts."""
+
+    def __init__(self, key: str):
+        self.key = key
+        # Time the next request may go out with this key
+        self.next_request_time = 0
+        self.quarantined_until = 0
+        self.consecutive_429s = 0
+        # Usage counts
+        self.requests = 0
+        self.rate_limited = 0
+        self.auth_errors = 0
+
+    def __repr__(self) -> str:
+        # Never log a whole key
+        return f"key ...{self.key[-4:]}"
+
+
+class KeyPool:
+    """Spreads requests across API keys, sending each request with the key that can go soonest."""
+
+    def __init__(self, keys: list[str]):
+        if len(keys) == 0:
+            logger.warning("SETLISTFM_API_KEY has not been set")
+            # Requests still go out (and fail), like they always have
+            keys = [""]
+        self.keys = [ApiKey(key) for key in keys]
+        self.lock = Lock()
+        self.last_usage_log = _now_ms()
+
+    @classmethod
+    def from_env(cls) -> "KeyPool":
+        keys = os.getenv("SETLISTFM_API_KEYS") or os.getenv("SETLISTFM_API_KEY") or ""
+        return cls([key.strip() for key in keys.split(",") if key.strip()])
+
+    def acquire(self) -> ApiKey:
+        """Pick a key and reserve its next request slot. Returns once the request may be sent."""
+        with self.lock:
+            current_time = _now_ms()
+            available = [key for key in self.keys if key.quarantined_until <= current_time]
+            if len(available) == 0:
+                # Everything is quarantined: better to try the key that's been out longest than to stall
+                available = [min(self.keys, key=lambda key: key.quarantined_until)]
+
+            key = min(available, key=lambda key: key.next_request_time)
+            send_time = max(current_time, key.next_request_time)
+            key.next_request_time = send_time + RATE_LIMIT_MS
+            key.requests += 1
+
+            if current_time - self.last_usage_log >= USAGE_LOG_INTERVAL_MS:
+                self.last_usage_log = current_time
+                logger.info(f"setlist.fm API key usage: {self.usage()}")
+
+        # Wait for our slot outside the lock, so other keys can be handed out meanwhile
+        if send_time > current_time:
+            time.sleep((send_time - current_time) / 1000)
+        return key
+
+    def report(self, key: ApiKey, status_code: int) -> None:
+        """Record the response a key got, quarantining it if it keeps failing."""
+        with self.lock:
+            if status_code == 429:
+                key.rate_limited += 1
+                key.consecutive_429s += 1
+                if key.consecutive_429s >= QUARANTINE_AFTER_429S:
+                    self._quarantine(key, QUARANTINE_MS, f"{key.consecutive_429s} rate limits in a row")
+                    key.consecutive_429s = 0
+            elif status_code in (401, 403):
+                key.auth_errors += 1
+                self._quarantine(key, AUTH_QUARANTINE_MS, f"HTTP {status_code}")
+            else:
+                key.consecutive_429s = 0
+
+    def has_other_key(self, key: ApiKey) -> bool:
+        """Check if any key besides this one is out of quarantine."""
+        current_time = _now_ms()
+        return any(other is not key and other.quarantined_until <= current_time for other in self.keys)
+
+    def _quarantine(self, key: ApiKey, duration_ms: int, reason: str) -> None:
+        key.quarantined_until = _now_ms() + duration_ms
+        if len(self.keys) > 1:
+            logger.warning(f"Quarantining setlist.fm API {key} for {duration_ms // 1000} s after {reason}")
+
+    def usage(self) -> list[dict]:
+        """Request counts for each key."""
+        current_time = _now_ms()
+        return [{
+            "key": repr(key),
+            "requests": key.requests,
+            "rateLimited": key.rate_limited,
+            "authErrors": key.auth_errors,
+            "quarantined": key.quarantined_until > current_time
+        } for key in self.keys]
+
+
+class BudgetedKeyPool:
+    """Draws keys from a KeyPool, but no more than a share of the pool's capacity.
+    For background work that shouldn't crowd out users' requests."""
+
+    def __init__(self, pool: KeyPool, share: float):
+        self.pool = pool
+        self.share = share
+        self.next_request_time = 0
+        self.lock = Lock()
+
+    def acquire(self) -> ApiKey:
+        with self.lock:
+            current_time = _now_ms()
+            interval = RATE_LIMIT_MS / (len(self.pool.keys) * self.share)
+            send_time = max(current_time, self.next_request_time)
+            self.next_request_time = send_time + interval
+        if send_time > current_time:
+            time.sleep((send_time - current_time) / 1000)
+        return self.pool.acquire()
+
+    def report(self, key: ApiKey, status_code: int) -> None:
+        self.pool.report(key, status_code)
+
+    def has_other_key(self, key: ApiKey) -> bool:
+        return self.pool.has_other_key(key)
+
+
+def _setlist_page_ttl(page: int, response: dict) -> float:
+    if page == 1:
+        # New setlists land on page 1
+        return 0
+    dates = [setlist.get("eventDate", "") for setlist in response.get("setlist", [])]
+    # DD-MM-YYYY
+    newest = max((date[6:] + date[3:5] + date[:2] for date in dates if len(date) == 10), default=None)
+    cutoff = (datetime.date.today() - datetime.timedelta(days=OLD_PAGE_AFTER_DAYS)).strftime("%Y%m%d")
+    return OLD_PAGE_TTL_S if newest is not None and newest < cutoff else RECENT_PAGE_TTL_S
+
+
+class LatencyTracker:
+    """Recent latencies of one kind of request, for its timeout and when to hedge it."""
 
-class SetlistFmAPI:
     def __init__(self):
-        # Time of the last request
-        self.last_request_time = 0
-        # Lock for making requests
-        self.rate_limit_lock = Lock()
+        self._samples: deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self._lock = Lock()
 
-        if API_KEY is None or len(API_KEY) == 0:
-            logger.warning("SETLISTFM_API_KEY has not been set")
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, p: float) -> float | None:
+        """Latency under which p% of the recent requests finished. None while there are too few samples."""
+        with self._lock:
+            if len(self._samples) < MIN_LATENCY_SAMPLES:
+                return None
+            samples = sorted(self._samples)
+        return samples[min(len(samples) - 1, math.ceil(len(samples) * p / 100) - 1)]
+
+    def timeout_s(self) -> float:
+        p99 = self.percentile(99)
+        if p99 is None:
+            return MAX_TIMEOUT_S
+        return min(MAX_TIMEOUT_S, max(MIN_TIMEOUT_S, p99 * TIMEOUT_FACTOR))
+
+    def hedge_after_s(self) -> float | None:
+        tail = self.percentile(HEDGE_PERCENTILE)
+        return None if tail is None else max(MIN_HEDGE_AFTER_S, tail)
 
 
-    def _wait_for_rate_limit(self) -> None:
-        """Utility function that returns after a certain amount of time
-        has passed since the last request."""
-        with self.rate_limit_lock:
-            # Store times in milliseconds (python seems to hate this)
-            current_time = time.time_ns() // 1_000_000
-            elapsed_time = current_time - self.last_request_time
+class HedgeBudget:
+    """Lets hedges make up at most HEDGE_SHARE of requests, with a few saved up for bursts of slow ones."""
+
+    def __init__(self):
+        self._saved = 0.0
+        self._lock = Lock()
+        self.hedges = 0
+
+    def earn(self) -> None:
+        with self._lock:
+            self._saved = min(MAX_SAVED_HEDGES, self._saved + HEDGE_SHARE)
+
+    def spend(self) -> bool:
+        with self._lock:
+            if self._saved < 1:
+                return False
+            self._saved -= 1
+            self.hedges += 1
+            return True
 
-            if elapsed_time < RATE_LIMIT_MS:
-                time.sleep((RATE_LIMIT_MS - elapsed_time) / 1000)
-            self.last_request_time = time.time_ns() // 1_000_000
 
+def _endpoint_kind(path: str) -> str:
+    # Latency depends on the endpoint, not the artist
+    return re.sub(r"^/artist/[^/]+", "/artist/{mbid}", path)
 
-    def _perform_request(self, path: str, params: dict, log_info: str) -> dict:
+
+# Shared by all SetlistFmAPI instances, since rate limits apply per key
+key_pool = KeyPool.from_env()
+# Latency by endpoint kind, and the hedges they may send
+latencies: dict[str, LatencyTracker] = {}
+hedge_budget = HedgeBudget()
+# Requests run here, so a hedge can go out while the first request is still waiting
+_request_pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix="setlistfm")
+# Shared too, to keep one connection to the cache file
+page_cache = PageCache.from_env()
+
+
+class SetlistFmAPI:
+    def __init__(self, keys: KeyPool | BudgetedKeyPool | None = None, cache: PageCache | None = None):
+        self.keys = keys or key_pool
+        self.cache = cache or page_cache
+
+
+    def _perform_request(self, path: str, params: dict, log_info: str,
+                         ttl_s: Callable[[dict], float] | None = None,
+                         still_valid: Callable[[dict], bool] | None = None) -> dict:
         """Make an API request, respecting rate limits and trying multiple attempts.
         Args:
             path: Endpoint path, relative to base URL
             params: Query params
             log_info: A string to include in the log msg if an error happens
+            ttl_s: How long a response may be used from the cache, given the response. None to not cache it
+            still_valid: Checks a fresh cached response can still be used. If not, it's revalidated upstream
         Returns:
             The JSON response as a dictionary
         Raises:
             HTTPError: if the response code of the final attempt is not 200 or 404.
+            CircuitOpenError: (an HTTPError) if setlist.fm is down, and the response isn't cached.
         """
 
-        headers = {
-            "x-api-key": API_KEY,
-            "Accept": "application/json"
-        }
         endpoint = API_URL + path
         response = None
 
+        cached = None
+        if self.cache is not None and ttl_s is not None:
+            cached = self.cache.get(path, params)
+            if cached is not None and cached.is_fresh:
+                data = json_codec.loads(cached.body)
+                if still_valid is None or still_valid(data):
+                    self.cache.hits += 1
+                    return data
+
+        latency = latencies.setdefault(_endpoint_kind(path), LatencyTracker())
+        extra_headers = cached.conditional_headers() if cached is not None else {}
+
         for attempts in range(MAX_ATTEMPTS):
-            # Wait to go. This aims to respect setlist.fm rate limit, but won't stop all 429s
-            self._wait_for_rate_limit()
+            # Don't bother while setlist.fm is down. An old copy beats nothing
+            try:
+                circuit_breaker.setlistfm.check()
+            except CircuitOpenError:
+                if cached is not None:
+                    return json_codec.loads(cached.body)
+                raise
 
             # Request
             try:
-                response = requests.get(endpoint, params=params, headers=headers, timeout=15)
+                key, response = self._send(endpoint, params, extra_headers, latency, log_info)
             except requests.exceptions.ReadTimeout:
+                circuit_breaker.setlistfm.record(False)
                 logger.warning(f"Request timed out in {path} for '{log_info}'.")
                 continue
             except requests.exceptions.RequestException as e:
+                circuit_breaker.setlistfm.record(False)
                 logger.error(f"Request failed in {path} for '{log_info}': {e}")
                 continue
 
+            circuit_breaker.setlistfm.record(not circuit_breaker.is_failure(response.status_code))
+            self.keys.report(key, response.status_code)
+
+            # Unchanged since it was cached
+            if response.status_code == 304 and cached is not None:
+                data = json_codec.loads(cached.body)
+                self.cache.refresh(path, params, ttl_s(data))
+                self.cache.revalidated += 1
+                return data
+
             # Handle success. 404 means no results.
             if response.status_code == 200 or response.status_code == 404:
-                return json.loads(response.text)
+                # Parse the raw bytes; decoding to a str first would only slow things down
+                data = json_codec.loads(response.content)
+                if response.status_code == 200 and self.cache is not None and ttl_s is not None:
+                    self.cache.put(
+                        path, params, response.content,
+                        response.headers.get("ETag"), response.headers.get("Last-Modified"), ttl_s(data)
+                    )
+                    self.cache.misses += 1
+                return data
 
             # Begin error land.
             # Exponential backoff, capped at 15 seconds
             delay = min((2 ** attempts) * RATE_LIMIT_MS, 15000)
             match response.status_code:
-                # Rate limited
+                # Rate limited. If another key can take over, retry with it straight away
+                case 429 if self.keys.has_other_key(key):
+                    delay = 0
+                    logger.info(f"Rate limited in {path} for '{log_info}' with {key}. Retrying with another key.")
                 case 429:
                     logger.info(f"Rate limited in {path} for '{log_info}'. Waiting {delay} ms.")
                 # Unknown error.
@@ -108,6 +386,60 @@ class SetlistFmAPI:
             raise requests.HTTPError
 
 
+    def _send(self, endpoint: str, params: dict, extra_headers: dict, latency: LatencyTracker,
+              log_info: str) -> tuple[ApiKey, requests.Response]:
+        """Send one attempt at a request, hedging it if it's slow.
+        Returns:
+            The key the first response came with, and the response
+        Raises:
+            RequestException: if every request that went out failed
+        """
+        timeout = latency.timeout_s()
+        hedge_after = latency.hedge_after_s()
+        hedge_budget.earn()
+
+        def request(key: ApiKey) -> tuple[ApiKey, requests.Response]:
+            headers = {
+                "x-api-key": key.key,
+                "Accept": "application/json",
+                **extra_headers
+            }
+            start = time.perf_counter()
+            try:
+                response = requests.get(endpoint, params=params, headers=headers, timeout=timeout)
+            except requests.exceptions.Timeout:
+                # Took at least this long. Counting it keeps timeouts from shrinking while upstream struggles
+                latency.record(timeout)
+                raise
+            latency.record(time.perf_counter() - start)
+            return key, response
+
+        # Wait to go. This aims to respect setlist.fm rate limit, but won't stop all 429s.
+        # The request only goes to the pool once it's going out, so time spent waiting for a slot
+        # doesn't count towards hedge_after: it would say nothing about how slow upstream is
+        key = self.keys.acquire()
+        if hedge_after is None:
+            return request(key)
+
+        first = _request_pool.submit(request, key)
+        done, _ = wait([first], timeout=hedge_after)
+        if done or not hedge_budget.spend():
+            return first.result()
+
+        logger.info(f"Hedging request to {endpoint} for '{log_info}' after {hedge_after:.2f} s")
+        # The first request really is slow, so the hedge may wait for a slot of its own
+        pending: set[Future] = {first, _request_pool.submit(lambda: request(self.keys.acquire()))}
+        while True:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                # The first to answer wins. The other one is left to finish on its own
+                if future.exception() is None:
+                    return future.result()
+            if len(pending) == 0:
+                # Both failed
+                return done.pop().result()
+
+
     def search_artist(self, artist_name: str) -> dict:
         """Search for an artist by name.
 
@@ -125,9 +457,12 @@ class SetlistFmAPI:
         return self._perform_request(path, params, artist_name)
 
 
-    def get_artist_setlists(self, artist_mbid: str, page: int) -> dict:
+    def get_artist_setlists(self, artist_mbid: str, page: int, total: int | None = None) -> dict:
         """Get setlists for an artist by their MusicBrainz ID.
 
+        `total` is the artist's current number of setlists, if known (from page 1). A cached page from
+        when the total was different is out of date, since each new setlist moves the rest along a place.
+
         Raises HTTPError: if the response code is not 200 or 404.
         """
 
@@ -136,7 +471,11 @@ class SetlistFmAPI:
             "p": page
         }
 
-        return self._perform_request(url, params, f"page {page}")
+        return self._perform_request(
+            url, params, f"page {page}",
+            ttl_s=lambda response: _setlist_page_ttl(page, response),
+            still_valid=lambda response: total is None or response.get("total") == total
+        )
 
 
     def get_artist_info(self, mbid: str) -> dict:
@@ -147,4 +486,4 @@ class SetlistFmAPI:
 
         path = f"/artist/{mbid}"
 
-        return self._perform_request(path, {}, "")
+        return self._perform_request(path, {}, "", ttl_s=lambda response: ARTIST_INFO_TTL_S)
@@ -0,0 +1,46 @@
+# song_index.py
+# Helpers shared by the database engines' song indexes, which answer song questions about an artist
+# ("where and when did they play X", "their most played songs in Japan") without going through their setlists:
+#   plays: for each song, the setlists it was played in
+#   counts: for each song, how many shows it was played at, in each country and overall
+# Both are brought up to date as setlists are inserted.
+#
+# Songs are matched by key (see concert_index.match_key), so "Song  title" and "song title" are one song.
+# A song played twice in one show counts once.
+
+from typing import Iterable
+from concert_index import match_key
+from database import SetlistDocument
+
+# Country key of the counts over all countries
+ALL_COUNTRIES = ""
+
+
+def country_key(country: str | None) -> str:
+    return (match_key(country) or ALL_COUNTRIES) if country else ALL_COUNTRIES
+
+
+def setlist_songs(setlist: SetlistDocument) -> dict[str, str]:
+    """The songs played in a setlist, each once: song key -> title as first listed."""
+    songs = {}
+    for title in setlist.get("songs") or ():
+        key = match_key(title)
+        if key and key not in songs:
+            songs[key] = title
+    return songs
+
+
+def count_plays(setlists: Iterable[SetlistDocument]) -> dict[tuple[str, str], list]:
+    """Shows each song was played at: (country key, song key) -> [title, shows].
+    Every show counts towards its country and towards ALL_COUNTRIES."""
+    counts: dict[tuple[str, str], list] = {}
+    for setlist in setlists:
+        country = country_key(setlist.get("countryName"))
+        for key, title in setlist_songs(setlist).items():
+            for count_key in {(ALL_COUNTRIES, key), (country, key)}:
+                count = counts.get(count_key)
+                if count is None:
+                    counts[count_key] = [title, 1]
+                else:
+                    count[1] += 1
+    return counts
@@ -0,0 +1,67 @@
+# songs.py
+# Song questions about an artist's stored setlists, answered by the database's song index (see song_index.py):
+# their most played songs (overall or in one country), and the shows where they played a given song.
+
+from flask import current_app, request
+from artists import create_error_response
+
+DEFAULT_TOP_LIMIT = 20
+DEFAULT_PLAYS_LIMIT = 50
+
+
+def _limit(default: int) -> int:
+    limit = int(request.args.get("limit", default))
+    if limit < 1:
+        raise ValueError("limit must be at least 1")
+    return limit
+
+
+def top_songs(mbid: str):
+    """Gets an artist's most played songs.
+    Args:
+        mbid: Artist MBID
+    Returns:
+        dict: Songs with the number of shows they were played at, most played first.
+              Only counts shows in the `country` query parameter, if given.
+    """
+    try:
+        limit = _limit(DEFAULT_TOP_LIMIT)
+    except ValueError as e:
+        return create_error_response(f"Invalid query: {e}", 400)
+
+    if not current_app.db.check_artist(mbid)[0]:
+        return create_error_response("No setlists stored for this artist", 404)
+
+    country = request.args.get("country") or None
+    return {
+        "mbid": mbid,
+        "country": country,
+        "songs": current_app.db.top_songs(mbid, country, limit)
+    }
+
+
+def song_plays(mbid: str):
+    """Finds the shows where an artist played a song (the `song` query parameter).
+    Args:
+        mbid: Artist MBID
+    Returns:
+        dict: The setlists, newest first.
+    """
+    song = request.args.get("song", "").strip()
+    try:
+        if not song:
+            raise ValueError("song is required")
+        limit = _limit(DEFAULT_PLAYS_LIMIT)
+    except ValueError as e:
+        return create_error_response(f"Invalid query: {e}", 400)
+
+    if not current_app.db.check_artist(mbid)[0]:
+        return create_error_response("No setlists stored for this artist", 404)
+
+    setlists = current_app.db.find_song_plays(mbid, song, limit)
+    return {
+        "mbid": mbid,
+        "song": song,
+        # Every engine's setlists look the same: song lists are left out, as in websocket updates
+        "plays": [{key: value for key, value in setlist.items() if key != "songs"} for setlist in setlists]
+    }
@@ -0,0 +1,408 @@
+# sqlite_database.py
+# Database stored in an embedded SQLite file, for small deployments that don't want to run MongoDB.
+# Setlists live in their own table, one row per setlist, indexed by artist.
+# The concert index is a second table with a row per valid setlist (indexed by date, venue and city),
+# plus an R*Tree of their locations.
+# The song index (see song_index.py) is two more tables: song_plays points to setlists by song,
+# and song_counts holds running totals of shows per song and country.
+
+from threading import Lock, local
+from typing import Iterator
+from database import Database, ArtistStatsDocument, ConcertDocument, ConcertQuery, PendingWrites, SetlistDocument, SongCount, WriteBatchError, now
+import concert_index
+import song_index
+import datetime
+import json
+import logging
+import sqlite3
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS artists (
+    mbid TEXT PRIMARY KEY,
+    name TEXT,
+    last_updated TEXT NOT NULL,
+    in_progress INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS setlists (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    artist_mbid TEXT NOT NULL,
+    event_date TEXT,
+    doc TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS setlists_by_artist ON setlists (artist_mbid, id);
+CREATE INDEX IF NOT EXISTS setlists_by_artist_date ON setlists (artist_mbid, event_date);
+CREATE TABLE IF NOT EXISTS artist_stats (
+    mbid TEXT PRIMARY KEY,
+    doc TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS concerts (
+    setlist_id INTEGER PRIMARY KEY,
+    artist_mbid TEXT NOT NULL,
+    event_date TEXT NOT NULL,
+    venue_key TEXT,
+    city_key TEXT,
+    lat REAL NOT NULL,
+    long REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS concerts_by_date ON concerts (event_date, setlist_id);
+CREATE INDEX IF NOT EXISTS concerts_by_venue ON concerts (venue_key, event_date, setlist_id);
+CREATE INDEX IF NOT EXISTS concerts_by_city ON concerts (city_key, event_date, setlist_id);
+CREATE INDEX IF NOT EXISTS concerts_by_artist ON concerts (artist_mbid);
+CREATE VIRTUAL TABLE IF NOT EXISTS concerts_geo USING rtree(setlist_id, min_lat, max_lat, min_long, max_long);
+CREATE TABLE IF NOT EXISTS song_plays (
+    artist_mbid TEXT NOT NULL,
+    song_key TEXT NOT NULL,
+    setlist_id INTEGER NOT NULL,
+    event_date TEXT,
+    PRIMARY KEY (artist_mbid, song_key, setlist_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS song_plays_by_date ON song_plays (artist_mbid, song_key, event_date);
+CREATE TABLE IF NOT EXISTS song_counts (
+    artist_mbid TEXT NOT NULL,
+    country_key TEXT NOT NULL,
+    song_key TEXT NOT NULL,
+    title TEXT NOT NULL,
+    plays INTEGER NOT NULL,
+    PRIMARY KEY (artist_mbid, country_key, song_key)
+);
+CREATE INDEX IF NOT EXISTS song_counts_by_plays ON song_counts (artist_mbid, country_key, plays);
+"""
+
+# Add setlists inserted after a given id to the concert index
+INDEX_CONCERTS = """
+INSERT INTO concerts (setlist_id, artist_mbid, event_date, venue_key, city_key, lat, long)
+SELECT id, artist_mbid, event_date,
+    match_key(json_extract(doc, '$.venueName')), match_key(json_extract(doc, '$.cityName')),
+    json_extract(doc, '$.cityLat'), json_extract(doc, '$.cityLong')
+FROM setlists
+WHERE id > ? AND event_date IS NOT NULL AND json_extract(doc, '$.isValid')
+    AND json_extract(doc, '$.cityLat') IS NOT NULL AND json_extract(doc, '$.cityLong') IS NOT NULL
+"""
+INDEX_CONCERT_LOCATIONS = """
+INSERT INTO concerts_geo (setlist_id, min_lat, max_lat, min_long, max_long)
+SELECT setlist_id, lat, lat, long, long FROM concerts WHERE setlist_id > ?
+"""
+# Add the songs of setlists inserted after a given id to the song index.
+# Songs repeated within a setlist hit the primary key and are ignored
+INDEX_SONG_PLAYS = """
+INSERT OR IGNORE INTO song_plays (artist_mbid, song_key, setlist_id, event_date)
+SELECT s.artist_mbid, match_key(song.value), s.id, s.event_date
+FROM setlists s, json_each(s.doc, '$.songs') song
+WHERE s.id > ? AND match_key(song.value) != ''
+"""
+COUNT_SONG_PLAYS = """
+INSERT INTO song_counts (artist_mbid, country_key, song_key, title, plays) VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (artist_mbid, country_key, song_key) DO UPDATE SET plays = plays + excluded.plays
+"""
+
+
+class SqliteDatabase(Database):
+    def __init__(self, path: str):
+        self._path = path
+        # One connection per thread, since Fetchers write from their own threads.
+        # WAL mode lets those connections read while another one writes.
+        self._local = local()
+        self._connections: list[sqlite3.Connection] = []
+        self._connections_lock = Lock()
+
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        has_concert_index = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'concerts'").fetchone()
+        conn.executescript(SCHEMA)
+        if not has_concert_index:
+            # Files from before the concert index get their stored setlists indexed once
+            with conn:
+                self._index_setlists(conn, 0)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # check_same_thread is off only so close() can close every thread's connection
+            conn = sqlite3.connect(self._path, timeout=10, check_same_thread=False)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.create_function("match_key", 1, concert_index.match_key, deterministic=True)
+            conn.create_function("distance_km", 4, concert_index.distance_km, deterministic=True)
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    @staticmethod
+    def _last_setlist_id(conn: sqlite3.Connection) -> int:
+        return conn.execute("SELECT COALESCE(MAX(id), 0) FROM setlists").fetchone()[0]
+
+    @staticmethod
+    def _index_setlists(conn: sqlite3.Connection, after_id: int) -> None:
+        # Ids only go up, so setlists inserted since after_id are exactly the ones with a greater id
+        conn.execute(INDEX_CONCERTS, (after_id,))
+        conn.execute(INDEX_CONCERT_LOCATIONS, (after_id,))
+        conn.execute(INDEX_SONG_PLAYS, (after_id,))
+
+    @staticmethod
+    def _count_songs(conn: sqlite3.Connection, mbid: str, setlists: list[SetlistDocument]) -> None:
+        conn.executemany(COUNT_SONG_PLAYS, [
+            (mbid, country, key, title, shows)
+            for (country, key), (title, shows) in song_index.count_plays(setlists).items()
+        ])
+
+    def insert_artist(self, mbid: str, name: str) -> None:
+        try:
+            with self._conn() as conn:
+                conn.execute(
+                    "INSERT INTO artists (mbid, name, last_updated, in_progress) VALUES (?, ?, ?, 1)",
+                    (mbid, name, now().isoformat())
+                )
+        except Exception as e:
+            logger.error(f"Error inserting new artist '{mbid}': {e}")
+
+    def get_artist_names(self) -> list[tuple[str, str]]:
+        try:
+            return self._conn().execute("SELECT mbid, name FROM artists").fetchall()
+        except Exception as e:
+            logger.error(f"Error retrieving artist names: {e}")
+            return []
+
+    def _set_status(self, mbid: str, in_progress: bool) -> None:
+        with self._conn() as conn:
+            conn.execute(
+                "UPDATE artists SET in_progress = ?, last_updated = ? WHERE mbid = ?",
+                (int(in_progress), now().isoformat(), mbid)
+            )
+
+    def reinsert_artist(self, mbid: str) -> None:
+        try:
+            self._set_status(mbid, True)
+        except Exception as e:
+            logger.error(f"Error reinserting artist '{mbid}': {e}")
+
+    def check_artist(self, mbid: str) -> tuple[bool, bool, datetime.datetime | None]:
+        try:
+            row = self._conn().execute(
+                "SELECT in_progress, last_updated FROM artists WHERE mbid = ?", (mbid,)
+            ).fetchone()
+        except Exception as e:
+            logger.error(f"Error checking artist '{mbid}': {e}")
+            return False, False, None
+
+        if row is not None:
+            return True, bool(row[0]), datetime.datetime.fromisoformat(row[1])
+
+        return False, False, None
+
+    def insert_setlists(self, mbid: str, new_setlists: list[SetlistDocument]) -> None:
+        try:
+            with self._conn() as conn:
+                cursor = conn.execute(
+                    "UPDATE artists SET last_updated = ? WHERE mbid = ?", (now().isoformat(), mbid)
+                )
+                # Like Mongo's update_one, do nothing for an unknown artist
+                if cursor.rowcount == 0:
+                    return
+                last_id = self._last_setlist_id(conn)
+                conn.executemany(
+                    "INSERT INTO setlists (artist_mbid, event_date, doc) VALUES (?, ?, ?)",
+                    [(mbid, setlist.get("eventDate"), json.dumps(setlist)) for setlist in new_setlists]
+                )
+                self._index_setlists(conn, last_id)
+                self._count_songs(conn, mbid, new_setlists)
+        except Exception as e:
+            logger.error(f"Error inserting new setlists for '{mbid}': {e}")
+
+    def get_all_setlists(self, mbid: str) -> list[SetlistDocument]:
+        try:
+            rows = self._conn().execute(
+                "SELECT doc FROM setlists WHERE artist_mbid = ? ORDER BY id", (mbid,)
+            ).fetchall()
+        except Exception as e:
+            logger.error(f"Error retrieving all setlists for '{mbid}': {e}")
+            return []
+
+        return [json.loads(row[0]) for row in rows]
+
+    def iter_setlists(self, mbid: str) -> Iterator[SetlistDocument]:
+        # A connection of its own: the caller may be slow to take rows (e.g. streaming them to a client),
+        # possibly from different threads, and shouldn't hold up this thread's other queries meanwhile
+        try:
+            conn = sqlite3.connect(self._path, timeout=10, check_same_thread=False)
+        except Exception as e:
+            logger.error(f"Error retrieving setlists for '{mbid}': {e}")
+            return
+
+        try:
+            # Rows are read from the file as the cursor advances
+            cursor = conn.execute("SELECT doc FROM setlists WHERE artist_mbid = ? ORDER BY id", (mbid,))
+            for row in cursor:
+                yield json.loads(row[0])
+        except Exception as e:
+            logger.error(f"Error retrieving setlists for '{mbid}': {e}")
+        finally:
+            conn.close()
+
+    def get_last_setlist(self, mbid: str) -> SetlistDocument | None:
+        try:
+            # NULL dates (invalid setlists) sort last
+            row = self._conn().execute(
+                "SELECT doc FROM setlists WHERE artist_mbid = ? ORDER BY event_date DESC, id LIMIT 1", (mbid,)
+            ).fetchone()
+        except Exception as e:
+            logger.error(f"Error retrieving last setlist for '{mbid}': {e}")
+            return None
+
+        return json.loads(row[0]) if row else None
+
+    @staticmethod
+    def _save_stats(conn: sqlite3.Connection, mbid: str, stats: ArtistStatsDocument) -> None:
+        # Like Mongo's update_one, do nothing for an unknown artist
+        conn.execute(
+            "INSERT OR REPLACE INTO artist_stats (mbid, doc) SELECT mbid, ? FROM artists WHERE mbid = ?",
+            (json.dumps(stats), mbid)
+        )
+
+    def save_stats(self, mbid: str, stats: ArtistStatsDocument) -> None:
+        try:
+            with self._conn() as conn:
+                self._save_stats(conn, mbid, stats)
+        except Exception as e:
+            logger.error(f"Error saving stats for '{mbid}': {e}")
+
+    def get_stats(self, mbid: str) -> ArtistStatsDocument | None:
+        try:
+            row = self._conn().execute("SELECT doc FROM artist_stats WHERE mbid = ?", (mbid,)).fetchone()
+        except Exception as e:
+            logger.error(f"Error retrieving stats for '{mbid}': {e}")
+            return None
+
+        return json.loads(row[0]) if row else None
+
+    def find_song_plays(self, mbid: str, song: str, limit: int) -> list[SetlistDocument]:
+        try:
+            rows = self._conn().execute(
+                "SELECT s.doc FROM song_plays p JOIN setlists s ON s.id = p.setlist_id "
+                "WHERE p.artist_mbid = ? AND p.song_key = ? ORDER BY p.event_date DESC, p.setlist_id LIMIT ?",
+                (mbid, concert_index.match_key(song), limit)
+            ).fetchall()
+        except Exception as e:
+            logger.error(f"Error finding plays of '{song}' for '{mbid}': {e}")
+            return []
+
+        return [json.loads(row[0]) for row in rows]
+
+    def top_songs(self, mbid: str, country: str | None, limit: int) -> list[SongCount]:
+        try:
+            rows = self._conn().execute(
+                "SELECT title, plays FROM song_counts WHERE artist_mbid = ? AND country_key = ? "
+                "ORDER BY plays DESC, song_key LIMIT ?",
+                (mbid, song_index.country_key(country), limit)
+            ).fetchall()
+        except Exception as e:
+            logger.error(f"Error retrieving top songs for '{mbid}': {e}")
+            return []
+
+        return [SongCount(song=title, plays=plays) for title, plays in rows]
+
+    def find_concerts(self, query: ConcertQuery) -> list[ConcertDocument]:
+        conditions = []
+        params = []
+        if query.lat is not None:
+            min_lat, max_lat, min_long, max_long = concert_index.bounding_box(query.lat, query.long, query.radius_km)
+            # The R*Tree narrows down to the bounding box, then the exact distance decides
+            conditions.append(
+                "c.setlist_id IN (SELECT setlist_id FROM concerts_geo "
+                "WHERE max_lat >= ? AND min_lat <= ? AND max_long >= ? AND min_long <= ?)"
+            )
+            params += [min_lat, max_lat, min_long, max_long]
+            conditions.append("distance_km(?, ?, c.lat, c.long) <= ?")
+            params += [query.lat, query.long, query.radius_km]
+        if query.venue is not None:
+            conditions.append("c.venue_key = ?")
+            params.append(concert_index.match_key(query.venue))
+        if query.city is not None:
+            conditions.append("c.city_key = ?")
+            params.append(concert_index.match_key(query.city))
+        if query.date_from is not None:
+            conditions.append("c.event_date >= ?")
+            params.append(query.date_from)
+        if query.date_to is not None:
+            conditions.append("c.event_date <= ?")
+            params.append(query.date_to)
+        if query.after is not None:
+            try:
+                after_id = int(query.after[1])
+            except ValueError:
+                raise ValueError(f"Invalid concert id '{query.after[1]}'") from None
+            conditions.append("(c.event_date, c.setlist_id) < (?, ?)")
+            params += [query.after[0], after_id]
+
+        sql = (
+            "SELECT c.setlist_id, c.artist_mbid, a.name, s.doc FROM concerts c "
+            "JOIN setlists s ON s.id = c.setlist_id LEFT JOIN artists a ON a.mbid = c.artist_mbid "
+            f"WHERE {' AND '.join(conditions) or '1'} "
+            "ORDER BY c.event_date DESC, c.setlist_id DESC LIMIT ?"
+        )
+        try:
+            rows = self._conn().execute(sql, params + [query.limit]).fetchall()
+        except Exception as e:
+            logger.error(f"Error finding concerts for {query}: {e}")
+            return []
+
+        return [
+            concert_index.make_concert(json.loads(doc), setlist_id, mbid, name, query)
+            for setlist_id, mbid, name, doc in rows
+        ]
+
+    def mark_artist_complete(self, mbid: str) -> None:
+        try:
+            self._set_status(mbid, False)
+        except Exception as e:
+            logger.error(f"Error marking artist '{mbid}' as complete: {e}")
+
+    def delete_artist(self, mbid: str) -> None:
+        try:
+            with self._conn() as conn:
+                conn.execute(
+                    "DELETE FROM concerts_geo WHERE setlist_id IN (SELECT setlist_id FROM concerts WHERE artist_mbid = ?)",
+                    (mbid,)
+                )
+                conn.execute("DELETE FROM concerts WHERE artist_mbid = ?", (mbid,))
+                conn.execute("DELETE FROM setlists WHERE artist_mbid = ?", (mbid,))
+                conn.execute("DELETE FROM artist_stats WHERE mbid = ?", (mbid,))
+                conn.execute("DELETE FROM song_plays WHERE artist_mbid = ?", (mbid,))
+                conn.execute("DELETE FROM song_counts WHERE artist_mbid = ?", (mbid,))
+                conn.execute("DELETE FROM artists WHERE mbid = ?", (mbid,))
+        except Exception as e:
+            logger.error(f"Error deleting artist '{mbid}': {e}")
+
+    def write_batch(self, writes: list[PendingWrites]) -> None:
+        try:
+            # All artists in one transaction
+            with self._conn() as conn:
+                timestamp = now().isoformat()
+                last_id = self._last_setlist_id(conn)
+                for pending in writes:
+                    in_progress = None if pending.in_progress is None else int(pending.in_progress)
+                    cursor = conn.execute(
+                        "UPDATE artists SET last_updated = ?, in_progress = COALESCE(?, in_progress) WHERE mbid = ?",
+                        (timestamp, in_progress, pending.mbid)
+                    )
+                    if cursor.rowcount == 0:
+                        continue
+                    conn.executemany(
+                        "INSERT INTO setlists (artist_mbid, event_date, doc) VALUES (?, ?, ?)",
+                        [(pending.mbid, setlist.get("eventDate"), json.dumps(setlist)) for setlist in pending.setlists]
+                    )
+                    self._count_songs(conn, pending.mbid, pending.setlists)
+                    if pending.stats is not None:
+                        self._save_stats(conn, pending.mbid, pending.stats)
+                self._index_setlists(conn, last_id)
+        except Exception as e:
+            logger.error(f"Error writing batch for {len(writes)} artists: {e}")
+            # One transaction, so none of it was applied
+            raise WriteBatchError(str(e), writes) from e
+
+    def close(self) -> None:
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
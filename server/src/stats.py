@@ -0,0 +1,78 @@
+# stats.py
+# Summary statistics of an artist's setlists (shows per year, countries visited, songs per show...).
+#
+# Stats are kept as running totals, so they can be brought up to date one page of setlists at a time
+# instead of being recomputed from every setlist. The Fetcher adds each page it stores and saves the
+# result alongside the setlists; the stats endpoint then only reads one stored document.
+
+from typing import Iterable
+from database import ArtistStatsDocument, SetlistDocument
+
+
+class ArtistStats:
+    def __init__(self, mbid: str, stats: ArtistStatsDocument | None = None):
+        """Start from previously saved stats, or from nothing."""
+        self.mbid = mbid
+        stats = stats or {}
+        self.total_setlists = stats.get("totalSetlists", 0)
+        self.valid_setlists = stats.get("validSetlists", 0)
+        self.first_show = stats.get("firstShow")
+        self.last_show = stats.get("lastShow")
+        self.shows_per_year: dict[str, int] = dict(stats.get("showsPerYear", {}))
+        self.countries: dict[str, int] = {entry["country"]: entry["shows"] for entry in stats.get("countries", [])}
+        self.songs_performed = stats.get("songsPerformed", 0)
+        self.shows_with_songs = stats.get("showsWithSongs", 0)
+
+    @classmethod
+    def from_setlists(cls, mbid: str, setlists: Iterable[SetlistDocument]) -> 'ArtistStats':
+        stats = cls(mbid)
+        stats.add(setlists)
+        return stats
+
+    def add(self, setlists: Iterable[SetlistDocument]) -> None:
+        """Count some more setlists."""
+        for setlist in setlists:
+            self.total_setlists += 1
+            if not setlist.get("isValid"):
+                continue
+            self.valid_setlists += 1
+
+            date = setlist.get("eventDate")
+            if date is not None:
+                if self.first_show is None or date < self.first_show:
+                    self.first_show = date
+                if self.last_show is None or date > self.last_show:
+                    self.last_show = date
+                year = date[:4]
+                self.shows_per_year[year] = self.shows_per_year.get(year, 0) + 1
+
+            country = setlist.get("countryName")
+            if country is not None:
+                self.countries[country] = self.countries.get(country, 0) + 1
+
+            songs = setlist.get("songsPerformed")
+            if songs:
+                self.songs_performed += songs
+                self.shows_with_songs += 1
+
+    def to_document(self, complete: bool) -> ArtistStatsDocument:
+        """The stats as stored and served. `complete` is False while the artist's setlists are still being fetched."""
+        return ArtistStatsDocument(
+            mbid=self.mbid,
+            complete=complete,
+            totalSetlists=self.total_setlists,
+            validSetlists=self.valid_setlists,
+            firstShow=self.first_show,
+            lastShow=self.last_show,
+            showsPerYear=dict(sorted(self.shows_per_year.items())),
+            # A list rather than a mapping, since country names aren't always valid MongoDB field names
+            countries=[
+                {"country": country, "shows": shows}
+                for country, shows in sorted(self.countries.items(), key=lambda item: item[1], reverse=True)
+            ],
+            countriesVisited=len(self.countries),
+            songsPerformed=self.songs_performed,
+            showsWithSongs=self.shows_with_songs,
+            # Only shows with a known setlist count towards the average
+            averageSongsPerShow=round(self.songs_performed / self.shows_with_songs, 2) if self.shows_with_songs else None
+        )
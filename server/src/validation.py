@@ -0,0 +1,145 @@
+# validation.py
+# Configures how Connexion validates requests and responses against the OpenAPI spec.
+#
+# Out of the box, Connexion builds a new JSON Schema validator for every parameter and response it checks.
+# The validators here compile each schema once and reuse it. The compiled validators are kept per app, since
+# Connexion gives each app its own copy of the spec's schemas: they go away along with the app.
+#
+# OPENAPI_VALIDATION selects the mode:
+#   strict (default): validate every request and every response. Use this in development and tests.
+#   production: validate every request, but only a sample of responses (OPENAPI_RESPONSE_SAMPLE_RATE).
+
+import hashlib
+import json
+import logging
+import os
+import random
+import tempfile
+from pathlib import Path
+import yaml
+from jsonschema import Draft4Validator, ValidationError
+from connexion.json_schema import Draft4ResponseValidator
+from connexion.datastructures import MediaTypeDict
+from connexion.utils import is_null, is_nullable
+from connexion.validators import VALIDATOR_MAP, JSONResponseBodyValidator, ParameterValidator
+
+logger = logging.getLogger(__name__)
+
+SPEC_PATH = "api/openapi.yaml"
+DEFAULT_RESPONSE_SAMPLE_RATE = 0.01
+
+# Compiled validators, keyed by (validator class, id of schema).
+# The schema is stored alongside so its id can't be reused by another object.
+CompiledValidators = dict[tuple[type, int], tuple[dict, Draft4Validator]]
+
+
+def _compile(compiled: CompiledValidators, schema: dict, validator_cls: type) -> Draft4Validator:
+    """Get a validator for a schema from the spec, building it only the first time."""
+    key = (validator_cls, id(schema))
+    entry = compiled.get(key)
+    if entry is None:
+        entry = (schema, validator_cls(schema, format_checker=Draft4Validator.FORMAT_CHECKER))
+        compiled[key] = entry
+    return entry[1]
+
+
+class CompiledParameterValidator(ParameterValidator):
+    """Same checks as Connexion's ParameterValidator, minus the per-request deepcopy and validator build."""
+    # Replaced by each app's own in api_options
+    compiled: CompiledValidators = {}
+
+    @classmethod
+    def validate_parameter(cls, parameter_type, value, param, param_name=None):
+        if is_nullable(param) and is_null(value):
+            return None
+
+        if value is not None:
+            try:
+                _compile(cls.compiled, param.get("schema", param), Draft4Validator).validate(value)
+            except ValidationError as exception:
+                return str(exception)
+        elif param.get("required"):
+            return f"Missing {parameter_type} parameter '{param['name']}'"
+
+        return None
+
+
+class SampledJSONResponseValidator(JSONResponseBodyValidator):
+    """Validates JSON response bodies with compiled validators, for a fraction of responses."""
+    sample_rate = 1.0
+    compiled: CompiledValidators = {}
+
+    @property
+    def validator(self) -> Draft4Validator:
+        return _compile(self.compiled, self._schema, Draft4ResponseValidator)
+
+    def wrap_send(self, send):
+        # Responses without a schema (e.g. streamed exports) have nothing to check, so don't buffer them
+        if not self._schema:
+            return send
+        # Skipped responses aren't even buffered
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return send
+        return super().wrap_send(send)
+
+
+def load_spec(path: str = SPEC_PATH) -> dict:
+    """Load the OpenAPI spec as a dict.
+    The parsed spec is cached as JSON next to other temp files, keyed by a hash of the YAML,
+    so restarted workers skip the YAML parse."""
+    raw = Path(path).read_bytes()
+    digest = hashlib.sha256(raw).hexdigest()[:16]
+    cache_dir = Path(os.getenv("OPENAPI_CACHE_DIR", tempfile.gettempdir()))
+    cache_file = cache_dir / f"cm-openapi-{digest}.json"
+
+    try:
+        return json.loads(cache_file.read_bytes())
+    except (OSError, ValueError):
+        pass
+
+    # Round trip through JSON so the result is the same as a cache hit (e.g. status codes become str keys)
+    spec_json = json.dumps(yaml.safe_load(raw))
+    try:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        # Write then rename, so a concurrently starting worker never reads half a file
+        tmp_file = cache_file.with_suffix(f".{os.getpid()}.tmp")
+        tmp_file.write_text(spec_json, encoding="utf-8")
+        tmp_file.replace(cache_file)
+    except OSError as e:
+        logger.warning(f"Could not cache OpenAPI spec in {cache_dir}: {e}")
+    return json.loads(spec_json)
+
+
+def api_options() -> dict:
+    """Keyword args for ConnexionMiddleware.add_api, according to OPENAPI_VALIDATION."""
+    mode = os.getenv("OPENAPI_VALIDATION", "strict")
+    if mode == "production":
+        sample_rate = float(os.getenv("OPENAPI_RESPONSE_SAMPLE_RATE", DEFAULT_RESPONSE_SAMPLE_RATE))
+    else:
+        if mode != "strict":
+            logger.warning(f"Unknown OPENAPI_VALIDATION mode '{mode}'; using strict")
+        sample_rate = 1.0
+
+    # A cache for this app only. The app's validator classes hold the only reference to it
+    compiled: CompiledValidators = {}
+    parameter_validator = type(
+        "CompiledParameterValidator",
+        (CompiledParameterValidator,),
+        {"compiled": compiled}
+    )
+    response_validator = type(
+        "SampledJSONResponseValidator",
+        (SampledJSONResponseValidator,),
+        {"sample_rate": sample_rate, "compiled": compiled}
+    )
+    response_validators = MediaTypeDict(VALIDATOR_MAP["response"])
+    response_validators["*/*json"] = response_validator
+
+    return {
+        "strict_validation": True,
+        "validate_responses": sample_rate > 0,
+        "validator_map": {
+            "parameter": parameter_validator,
+            "response": response_validators,
+        },
+    }
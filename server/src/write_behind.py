@@ -0,0 +1,214 @@
+# write_behind.py
+# Buffers the writes a fetch makes and applies them in batches, so the fetch doesn't wait on the database
+# between pages of setlists.
+#
+# insert_setlists and reinsert_artist return right away. A background thread applies whatever is buffered
+# once DB_FLUSH_SIZE setlists are waiting, or every DB_FLUSH_INTERVAL seconds, whichever comes first.
+# Reading an artist first applies that artist's buffered writes, so reads never see stale data.
+# mark_artist_complete applies everything buffered for the artist before it returns, so a finished fetch
+# is always stored.
+# Writes that fail go back in the buffer, ahead of anything buffered since, and are tried again with the next
+# flush. If they still can't be applied when the fetch completes, mark_artist_complete raises and the artist
+# is left in progress, instead of complete with setlists missing.
+
+from threading import Condition, Lock, Thread
+from typing import Iterator
+from database import ArtistStatsDocument, ConcertDocument, ConcertQuery, Database, PendingWrites, SetlistDocument, SongCount, WriteBatchError
+import atexit
+import datetime
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+FLUSH_SIZE = int(os.getenv("DB_FLUSH_SIZE", 200))
+FLUSH_INTERVAL = float(os.getenv("DB_FLUSH_INTERVAL", 1.0))
+
+
+class WriteBehindDatabase(Database):
+    def __init__(self, db: Database, flush_size: int = FLUSH_SIZE, flush_interval: float = FLUSH_INTERVAL):
+        self.db = db
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+
+        # Buffered writes by artist, and how many setlists they hold in total
+        self._pending: dict[str, PendingWrites] = {}
+        self._pending_setlists = 0
+        self._lock = Lock()
+        self._wake = Condition(self._lock)
+        # Held while applying writes, so a read can't slip in between
+        # writes leaving the buffer and reaching the database
+        self._flush_lock = Lock()
+
+        self._closed = False
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+        # Don't lose buffered writes when the process exits normally
+        atexit.register(self.close)
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                self._wake.wait_for(
+                    lambda: self._closed or self._pending_setlists >= self.flush_size,
+                    timeout=self.flush_interval
+                )
+                if self._closed:
+                    return
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error flushing buffered writes: {e}")
+                # The writes are back in the buffer. Give the database a moment before trying them again
+                with self._lock:
+                    self._wake.wait_for(lambda: self._closed, timeout=self.flush_interval)
+
+    def _buffer(self, mbid: str) -> PendingWrites:
+        # Call with self._lock held
+        pending = self._pending.get(mbid)
+        if pending is None:
+            pending = self._pending[mbid] = PendingWrites(mbid)
+        return pending
+
+    def _take(self, mbid: str | None) -> list[PendingWrites]:
+        with self._lock:
+            if mbid is None:
+                writes = list(self._pending.values())
+                self._pending.clear()
+            else:
+                pending = self._pending.pop(mbid, None)
+                writes = [] if pending is None else [pending]
+            self._pending_setlists -= sum(len(pending.setlists) for pending in writes)
+        return writes
+
+    def _put_back(self, writes: list[PendingWrites]) -> None:
+        """Return writes that failed to the buffer, merged with anything buffered for their artists since."""
+        with self._lock:
+            for pending in writes:
+                newer = self._pending.get(pending.mbid)
+                if newer is not None:
+                    pending.setlists.extend(newer.setlists)
+                    self._pending_setlists -= len(newer.setlists)
+                    if newer.in_progress is not None:
+                        pending.in_progress = newer.in_progress
+                    if newer.stats is not None:
+                        pending.stats = newer.stats
+                self._pending[pending.mbid] = pending
+                self._pending_setlists += len(pending.setlists)
+
+    def flush(self, mbid: str | None = None) -> None:
+        """Apply buffered writes now, for one artist or for all of them.
+        If some fail, they stay buffered, and the error is raised."""
+        with self._flush_lock:
+            writes = self._take(mbid)
+            if len(writes) == 0:
+                return
+            try:
+                self.db.write_batch(writes)
+            except WriteBatchError as e:
+                self._put_back(e.unapplied)
+                raise
+            except Exception:
+                self._put_back(writes)
+                raise
+
+    def _flush_for_read(self, mbid: str | None = None) -> None:
+        # Reads go ahead even if the writes can't be applied yet. They stay buffered for the next try
+        try:
+            self.flush(mbid)
+        except Exception as e:
+            logger.error(f"Error flushing buffered writes for '{mbid}' before reading: {e}")
+
+    def insert_artist(self, mbid: str, name: str) -> None:
+        # Later writes need the artist to exist, so this one isn't buffered
+        self._flush_for_read(mbid)
+        self.db.insert_artist(mbid, name)
+
+    def get_artist_names(self) -> list[tuple[str, str]]:
+        # Buffered writes never add artists
+        return self.db.get_artist_names()
+
+    def reinsert_artist(self, mbid: str) -> None:
+        with self._lock:
+            self._buffer(mbid).in_progress = True
+
+    def check_artist(self, mbid: str) -> tuple[bool, bool, datetime.datetime | None]:
+        self._flush_for_read(mbid)
+        return self.db.check_artist(mbid)
+
+    def insert_setlists(self, mbid: str, new_setlists: list[SetlistDocument]) -> None:
+        with self._lock:
+            self._buffer(mbid).setlists.extend(new_setlists)
+            self._pending_setlists += len(new_setlists)
+            if self._pending_setlists >= self.flush_size:
+                self._wake.notify()
+
+    def get_all_setlists(self, mbid: str) -> list[SetlistDocument]:
+        self._flush_for_read(mbid)
+        return self.db.get_all_setlists(mbid)
+
+    def iter_setlists(self, mbid: str) -> Iterator[SetlistDocument]:
+        self._flush_for_read(mbid)
+        yield from self.db.iter_setlists(mbid)
+
+    def get_last_setlist(self, mbid: str) -> SetlistDocument | None:
+        self._flush_for_read(mbid)
+        return self.db.get_last_setlist(mbid)
+
+    def save_stats(self, mbid: str, stats: ArtistStatsDocument) -> None:
+        # Only the latest stats matter
+        with self._lock:
+            self._buffer(mbid).stats = stats
+
+    def get_stats(self, mbid: str) -> ArtistStatsDocument | None:
+        self._flush_for_read(mbid)
+        return self.db.get_stats(mbid)
+
+    def find_song_plays(self, mbid: str, song: str, limit: int) -> list[SetlistDocument]:
+        self._flush_for_read(mbid)
+        return self.db.find_song_plays(mbid, song, limit)
+
+    def top_songs(self, mbid: str, country: str | None, limit: int) -> list[SongCount]:
+        self._flush_for_read(mbid)
+        return self.db.top_songs(mbid, country, limit)
+
+    def find_concerts(self, query: ConcertQuery) -> list[ConcertDocument]:
+        # Could match any artist's buffered setlists
+        self._flush_for_read()
+        return self.db.find_concerts(query)
+
+    def mark_artist_complete(self, mbid: str) -> None:
+        # The remaining setlists and the status change go out together
+        with self._lock:
+            self._buffer(mbid).in_progress = False
+        try:
+            self.flush(mbid)
+        except Exception:
+            # Some setlists aren't stored. Until they are, the artist isn't complete
+            with self._lock:
+                pending = self._pending.get(mbid)
+                if pending is not None:
+                    pending.in_progress = True
+            raise
+
+    def delete_artist(self, mbid: str) -> None:
+        # Buffered writes for the artist would be deleted anyway
+        with self._flush_lock:
+            self._take(mbid)
+            self.db.delete_artist(mbid)
+
+    def write_batch(self, writes: list[PendingWrites]) -> None:
+        self.db.write_batch(writes)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._wake.notify()
+        self._thread.join()
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error(f"Error flushing buffered writes on close: {e}")
+        self.db.close()
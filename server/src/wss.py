@@ -1,100 +1,323 @@
 import asyncio
 import http
-import json
+import math
+import json_codec
 import websockets
 import logging
+import os
+import time
 import urllib.parse
-from typing import Dict
+from array import array
+from collections import OrderedDict
+from typing import Dict, Iterable, Iterator
 from typing import TYPE_CHECKING
-from database import Database
+from admission import Limiter, Ticket, MAX_CONNECTIONS_PER_CHANNEL, ip_connections
+from database import Database, SetlistDocument
+from map_layout import ScatterLayout
+from setlist_store import SetlistStore
 
 if TYPE_CHECKING:  # pragma: no cover
     from fetcher import Fetcher
+    from asgi import AsgiConnection
 
 logger = logging.getLogger(__name__)
 
 PORT = 5001
 
-# If no clients have connected for an artist by the time their fetch process ends,
-# wait this many seconds for someone (hopefully the user who requested it) to connect,
-# then close the channel.
-GOODBYE_WAIT = 10
+# Channel lifecycle: a channel opens when a fetch starts. When the fetch completes, clients get a goodbye,
+# and the channel stays open as a replay buffer: clients that connect later (e.g. the user who requested it,
+# if the fetch beat them to it) are sent everything at once from the Fetcher's setlists, and new requests
+# for the artist reuse it instead of starting another fetch. Completed channels close after CHANNEL_LINGER_S,
+# or sooner, oldest first, when their setlists take more than CHANNEL_BUFFER_MAX_MB.
+# A reaper closes those, and channels whose fetch died without saying goodbye.
+CHANNEL_LINGER_S = float(os.getenv("CHANNEL_LINGER_S", 60))
+CHANNEL_BUFFER_MAX_BYTES = int(float(os.getenv("CHANNEL_BUFFER_MAX_MB", 128)) * 2**20)
+REAP_INTERVAL_S = 5
+
+# Clients hang up on their own after the goodbye. Ones still connected after this many seconds are closed
+GOODBYE_CLOSE_WAIT = 1
+
+# When a client connects before the first page of setlists has been fetched,
+# wait up to this many seconds for it, so the hello message can include the expected total.
+FIRST_PAGE_WAIT = 2
+
+# While a client waits for a place in a full channel, how often to check its queue position
+CHANNEL_QUEUE_POLL = 0.5
+
+# A joining client's snapshot (the channel's setlists so far) goes out as update events of about this size,
+# newest setlists first. The client draws each as it arrives instead of waiting for all of it. The server reads
+# the setlists into a compact store (see Snapshot), and only one frame's worth are dicts or encoded at a time.
+# Each send waits for the connection's send buffer to drain, so a slow client holds back its own snapshot
+# instead of piling it up in memory.
+SNAPSHOT_FRAME_BYTES = 64 * 1024
 
 # Disable propagation of websockets logs to the root logger
 logging.getLogger("websockets").propagate = False
 
 # Mapping of artist mbids to WebSocket connections.
 # Artist mbids may persist even after fetching completes
-mbids_to_connections: Dict[str, set[websockets.ServerConnection]] = {}
+mbids_to_connections: Dict[str, set['websockets.ServerConnection | AsgiConnection']] = {}
 
 # Mapping of artist mbids to Fetcher instances.
 # Used to access fetched setlists for newly connected clients
 # Any new connections for mbids not in this dict will be refused.
 fetchers: Dict[str, 'Fetcher'] = {}
 
+# Mapping of artist mbids to the limit on their channel's connections (see admission.py).
+# Clients past the limit wait in its queue
+channel_limiters: Dict[str, Limiter] = {}
+
+# Completed channels, oldest first: mbid -> (time completed, bytes held by its setlists).
+# Their Fetcher stays in `fetchers`, holding the setlists to replay
+completed_channels: 'OrderedDict[str, tuple[float, int]]' = OrderedDict()
+
 async def process_request(
-    connection: websockets.ServerConnection,
-    request: websockets.http11.Request
-) -> websockets.http11.Response | None:
+    connection: 'websockets.ServerConnection',
+    request: 'websockets.http11.Request'
+) -> 'websockets.http11.Response | None':
     """
     Intercept incoming HTTP requests to handle query parameter `mbid` before accepting the connection.
     """
     query = urllib.parse.urlparse(request.path).query
+    mbid, error = check_mbid(query)
+    if error is not None:
+        return connection.respond(http.HTTPStatus.UNAUTHORIZED, error)
+
+    ip = connection.remote_address[0] if connection.remote_address else None
+    error = check_ip(ip)
+    if error is not None:
+        return connection.respond(http.HTTPStatus.TOO_MANY_REQUESTS, error)
+
+    # Store the mbid on this connection instance
+    connection.mbid = mbid
+    connection.client_ip = ip
+    return None
+
+
+class Snapshot:
+    """A channel's setlists as sent to a client as it joins: laid out, sorted newest first, and encoded a frame
+    at a time. The setlists are kept compact (see setlist_store.py); only a frame's worth are ever dicts.
+    Building one reads all of the setlists and lays them out, so it belongs off the event loop."""
+
+    def __init__(self, setlists: Iterable[SetlistDocument], total_expected: int | None):
+        """
+        Args:
+            setlists: In the order they were stored, so they get the same map positions as from the Fetcher.
+                Streamed in, unless they're a SetlistStore already (e.g. a Fetcher's)
+            total_expected: Sent in each event, as in the Fetcher's
+        """
+        self.total_expected = total_expected
+        # Map positions go by the stored order, so they're worked out as setlists come in. NaN for setlists without one
+        layout = ScatterLayout()
+        self._lats = array("d")
+        self._longs = array("d")
+        if isinstance(setlists, SetlistStore):
+            self._store = setlists
+        else:
+            self._store = SetlistStore()
+        for setlist in setlists:
+            placed = layout.place([setlist], in_place=True)[0]
+            self._lats.append(placed.get("scatterLat", math.nan))
+            self._longs.append(placed.get("scatterLong", math.nan))
+            if setlists is not self._store:
+                # Placing took out the song titles, which clients aren't sent, so they aren't stored either
+                self._store.append(placed)
+        # Stable, so setlists of the same day keep their order
+        dates = self._store.event_dates()
+        self._order = sorted(range(len(self._store)), key=dates.__getitem__, reverse=True)
+
+    def __len__(self) -> int:
+        return len(self._store)
+
+    def frames(self) -> Iterator[bytes]:
+        """Update events of about SNAPSHOT_FRAME_BYTES each, newest setlists first.
+        Always at least one, which is empty if there are no setlists."""
+        head = b'{"type":"update","setlists":['
+        tail = b'],"totalExpected":' + json_codec.dumps_bytes(self.total_expected) + b"}"
+        frame: list[bytes] = []
+        size = 0
+        for index in self._order:
+            # As ScatterLayout.place gives them: without song titles, plus the map position
+            setlist = self._store[index]
+            setlist.pop("songs", None)
+            if not math.isnan(self._lats[index]):
+                setlist["scatterLat"], setlist["scatterLong"] = self._lats[index], self._longs[index]
+            encoded = json_codec.dumps_bytes(setlist)
+            if len(frame) > 0 and size + len(encoded) > SNAPSHOT_FRAME_BYTES:
+                yield head + b",".join(frame) + tail
+                frame = []
+                size = 0
+            frame.append(encoded)
+            size += len(encoded) + 1
+        yield head + b",".join(frame) + tail
+
+
+def check_mbid(query: str) -> tuple[str | None, str | None]:
+    """Find the channel requested in a connection's query string.
+    Returns:
+        (mbid, error): error is a message explaining why the connection should be refused, or None.
+    """
     params = urllib.parse.parse_qs(query)
 
-    if "mbid" in params:
-        mbid = params["mbid"][0]
-    else:
-        return connection.respond(http.HTTPStatus.UNAUTHORIZED, "Missing mbid\n")
+    if "mbid" not in params:
+        return None, "Missing mbid\n"
 
+    mbid = params["mbid"][0]
     if mbid not in fetchers:
-        return connection.respond(http.HTTPStatus.UNAUTHORIZED, "Invalid mbid\n")
+        return mbid, "Invalid mbid\n"
 
-    # Store the mbid on this connection instance
-    connection.mbid = mbid
+    return mbid, None
+
+
+def check_ip(ip: str | None) -> str | None:
+    """Check that a client may open another connection.
+    Returns:
+        A message explaining why the connection should be refused, or None.
+    """
+    if ip is not None and ip_connections.count(ip) >= ip_connections.limit:
+        return "Too many connections\n"
     return None
 
 
 class WebSocketServer:
-    def __init__(self, loop: asyncio.AbstractEventLoop, db: Database) -> None:
+    def __init__(self, loop: asyncio.AbstractEventLoop | None, db: Database) -> None:
         self.db = db
         self.server = None
         # needed so we can force-close connections in the same event loop
-        # that they started in, or something
+        # that they started in, or something.
+        # When mounted in an ASGI app, this is None until the ASGI server starts its loop.
         self.loop = loop
+        self._reaper: asyncio.Task | None = None
 
-    async def handle_connection(self, websocket: websockets.ServerConnection) -> None:
+    async def handle_connection(self, websocket: 'websockets.ServerConnection | AsgiConnection') -> None:
+        # Count the client against its IP's limit for as long as it's connected
+        ip = websocket.client_ip
+        if ip is not None and not ip_connections.add(ip):
+            # Others from the same IP got in after process_request checked
+            await websocket.close()
+            return
+        try:
+            await self._serve_connection(websocket)
+        finally:
+            if ip is not None:
+                ip_connections.remove(ip)
+
+    async def _wait_for_place(self, websocket: 'websockets.ServerConnection | AsgiConnection', fetcher: 'Fetcher',
+                              ticket: Ticket, closed: asyncio.Future) -> bool:
+        """Keep a client that's queued for a full channel posted on its position, until it gets in.
+        Returns False if it disconnected first."""
+        last_position = None
+        while not ticket.admitted:
+            position = ticket.position
+            if position != last_position:
+                event = {"type": "queue", "position": position, "estimatedWaitS": round(ticket.estimated_wait_s)}
+                if last_position is None:
+                    # The first message is the hello, as for any other client
+                    event = {
+                        "type": "hello",
+                        "artistMbid": fetcher.artist_mbid,
+                        "totalExpected": fetcher.total_expected_setlists,
+                        "queue": {"position": position, "estimatedWaitS": event["estimatedWaitS"]},
+                        "stale": fetcher.stale
+                    }
+                await websocket.send(json_codec.dumps(event))
+                last_position = position
+            await asyncio.wait([closed], timeout=CHANNEL_QUEUE_POLL)
+            if closed.done():
+                return False
+        await websocket.send(json_codec.dumps({"type": "queue", "position": 0, "estimatedWaitS": 0}))
+        return True
+
+    async def _serve_connection(self, websocket: 'websockets.ServerConnection | AsgiConnection') -> None:
         # In case the fetch process finished between process_request and now...
         if websocket.mbid not in mbids_to_connections or websocket.mbid not in fetchers:
             await websocket.close()
             return
 
-        # Track the client so we can broadcast updates for this artist
-        mbids_to_connections[websocket.mbid].add(websocket)
-
         fetcher = fetchers[websocket.mbid]
+        # Watch for the client leaving, including while it waits in a queue
+        closed = asyncio.ensure_future(websocket.wait_closed())
+        websocket.disconnected = closed
+        if websocket.mbid in completed_channels:
+            await self._replay_channel(websocket, fetcher, closed)
+            return
 
-        # Send a hello message to the client (not really necessary, but nice to have)
-        event = {
-            "type": "hello",
-            "artistMbid": fetcher.artist_mbid,
-            "totalExpected": fetcher.total_expected_setlists
-        }
-        await websocket.send(json.dumps(event))
+        limiter = channel_limiters.get(websocket.mbid)
+        ticket = limiter.enqueue() if limiter is not None else None
+        try:
+            if ticket is not None and not ticket.admitted:
+                if not await self._wait_for_place(websocket, fetcher, ticket, closed):
+                    return
+                greeted = True
+            else:
+                greeted = False
+            await self._stream_channel(websocket, fetcher, closed, greeted)
+        finally:
+            if ticket is not None:
+                ticket.release()
+
+    async def _stream_channel(self, websocket: 'websockets.ServerConnection | AsgiConnection', fetcher: 'Fetcher',
+                              closed: asyncio.Future, greeted: bool) -> None:
+        # The channel may have closed while the client was queued
+        if fetchers.get(websocket.mbid) is not fetcher:
+            await websocket.close()
+            return
 
-        # Send all currently fetched setlists to the client
-        fetched_setlists = self.db.get_all_setlists(fetcher.artist_mbid)
-        event = {
-            "type": "update",
-            "setlists": fetched_setlists,
-            "totalExpected": fetcher.total_expected_setlists
-        }
-        await websocket.send(json.dumps(event))
+        # Queued fetches won't have a first page for a while, so don't hold the hello back for them
+        if not fetcher.first_page_done.is_set() and not fetcher.is_queued:
+            await asyncio.get_running_loop().run_in_executor(
+                None, fetcher.first_page_done.wait, FIRST_PAGE_WAIT
+            )
+            # The channel may have closed in the meantime
+            if fetchers.get(websocket.mbid) is not fetcher:
+                await websocket.close()
+                return
+
+        # Or the fetch completed: then the client gets everything at once
+        if websocket.mbid in completed_channels:
+            await self._replay_channel(websocket, fetcher, closed, greeted)
+            return
+
+        # Track the client so we can broadcast updates for this artist
+        mbids_to_connections[websocket.mbid].add(websocket)
+
+        # Send a hello message to the client (not really necessary, but nice to have).
+        # If the fetch is waiting for its turn, it says where in the queue it is
+        if not greeted:
+            event = {
+                "type": "hello",
+                "artistMbid": fetcher.artist_mbid,
+                "totalExpected": fetcher.total_expected_setlists,
+                "queue": fetcher.queue_status(),
+                # setlist.fm is down, so these are the stored setlists, as they were (see circuit_breaker.py)
+                "stale": fetcher.stale
+            }
+            await websocket.send(json_codec.dumps(event))
+
+        # Send all currently fetched setlists to the client, with their map positions.
+        # These are the same as the fetcher gives them, since both lay out setlists in the order they were stored.
+        # Pages the Fetcher broadcasts in the meantime may arrive in between, and so may its goodbye
+        websocket.sending_snapshot = True
+        try:
+            # Streamed from the database into a compact store, off the event loop: reading may also
+            # write out the fetch's buffered setlists first (see write_behind.py)
+            snapshot = await asyncio.get_running_loop().run_in_executor(
+                None, Snapshot, self.db.iter_setlists(fetcher.artist_mbid), fetcher.total_expected_setlists
+            )
+            sent = await self._send_snapshot(websocket, snapshot, closed)
+        finally:
+            websocket.sending_snapshot = False
+        if sent and websocket.mbid in completed_channels:
+            # The fetch completed while the snapshot was going out. The goodbye left this client
+            # open to finish it, so close it now, the same way
+            await asyncio.wait([closed], timeout=GOODBYE_CLOSE_WAIT)
+            if not closed.done():
+                await websocket.close()
 
         # Now, the client should receive updates as they are broadcasted by the Fetcher instance.
 
         # Later when they disconnect, update the set of connections
-        await websocket.wait_closed()
+        await closed
 
         try:
             conn_set = mbids_to_connections[websocket.mbid]
@@ -104,7 +327,52 @@ class WebSocketServer:
         else:
             # Remove client to excuse them from forced cleanup.
             # If i understand Python right, I don't have to worry about conn_set being deleted
-            conn_set.remove(websocket)
+            conn_set.discard(websocket)
+
+    async def _replay_channel(self, websocket: 'websockets.ServerConnection | AsgiConnection', fetcher: 'Fetcher',
+                              closed: asyncio.Future, greeted: bool = False) -> None:
+        """Send a completed channel's hello, setlists and goodbye to a client in one go."""
+        if not greeted:
+            event = {
+                "type": "hello",
+                "artistMbid": fetcher.artist_mbid,
+                "totalExpected": fetcher.total_expected_setlists,
+                "queue": None,
+                "stale": fetcher.stale
+            }
+            await websocket.send(json_codec.dumps(event))
+
+        # Straight from the Fetcher's memory. Laid out from scratch, same as the snapshot of a running fetch
+        snapshot = await asyncio.get_running_loop().run_in_executor(
+            None, Snapshot, fetcher.fetched_setlists, fetcher.total_expected_setlists
+        )
+        if not await self._send_snapshot(websocket, snapshot, closed):
+            return
+        event = {
+            "type": "goodbye",
+            "totalSetlists": len(fetcher.fetched_setlists),
+            "hadError": False,
+            "stale": fetcher.stale
+        }
+        await websocket.send(json_codec.dumps(event))
+
+        await asyncio.wait([closed], timeout=GOODBYE_CLOSE_WAIT)
+        if not closed.done():
+            await websocket.close()
+
+    async def _send_snapshot(self, websocket: 'websockets.ServerConnection | AsgiConnection', snapshot: Snapshot,
+                             closed: asyncio.Future) -> bool:
+        """Send a snapshot a frame at a time.
+        Returns False if the client disconnected before it was all sent."""
+        for frame in snapshot.frames():
+            if closed.done():
+                return False
+            try:
+                # Already bytes, so no round trip through str. Waits while the send buffer is full
+                await websocket.send(frame, text=True)
+            except websockets.ConnectionClosed:
+                return False
+        return True
 
     async def start_server(self) -> None:
         self.server = await websockets.serve(
@@ -113,55 +381,147 @@ class WebSocketServer:
             port=PORT,
             process_request=process_request,
         )
+        self.start_reaper()
         logger.info(f"WebSocket server started on port {PORT}")
 
+    def start_reaper(self) -> None:
+        """Start closing expired and orphaned channels, on the running loop."""
+        if self._reaper is None:
+            self._reaper = asyncio.get_running_loop().create_task(self._reap_forever())
+
+    def stop_reaper(self) -> None:
+        if self._reaper is not None:
+            self._reaper.cancel()
+            self._reaper = None
+
+    async def _reap_forever(self) -> None:
+        while True:
+            await asyncio.sleep(REAP_INTERVAL_S)
+            try:
+                await self.reap()
+            except Exception as e:
+                logger.error(f"Error reaping channels: {e}")
+
+    async def reap(self) -> None:
+        """Close completed channels that have lingered long enough, and channels nobody will ever finish."""
+        now = time.monotonic()
+        for mbid, (completed_at, _) in list(completed_channels.items()):
+            if now - completed_at >= CHANNEL_LINGER_S:
+                await self._close_channel(mbid, fetchers.get(mbid))
+
+        for mbid, fetcher in list(fetchers.items()):
+            # A fetch thread that ended without completing its channel died along the way
+            thread = getattr(fetcher, "thread", None)
+            if mbid not in completed_channels and thread is not None and not thread.is_alive():
+                logger.warning(f"Reaping orphaned channel for {fetcher}")
+                await self._finish_channel(mbid, fetcher, len(fetcher.fetched_setlists), error=True)
+
+        for mbid in list(mbids_to_connections):
+            # Connections left behind by a channel that's gone
+            if mbid not in fetchers:
+                await self._close_channel(mbid, None)
+
+    def has_replay(self, mbid: str) -> bool:
+        """Check if an artist has a completed channel that new clients can still connect to.
+        Channels of stale setlists are only kept for the clients already on their way to them:
+        new requests should try setlist.fm again."""
+        entry = completed_channels.get(mbid)
+        return (
+            entry is not None and mbid in fetchers and not fetchers[mbid].stale and
+            time.monotonic() - entry[0] < CHANNEL_LINGER_S
+        )
+
     def broadcast_to_channel(self, mbid: str, event: dict) -> int:
         """Broadcast an event to all clients connected to a specific artist's channel.
         Returns the number of clients broadcasted to."""
-        websockets.broadcast(mbids_to_connections[mbid], json.dumps(event))
-        return len(mbids_to_connections[mbid])
+        return self._broadcast(mbids_to_connections.get(mbid, set()), event)
+
+    def _broadcast(self, connections: set['websockets.ServerConnection | AsgiConnection'], event: dict) -> int:
+        # A str is encoded once for all of websockets' connections, and is what ASGI connections take
+        message = json_codec.dumps(event)
+
+        # Connections from our own server can all be written in one go.
+        # Connections accepted by an ASGI server need to hop onto its event loop.
+        websockets.broadcast(
+            [conn for conn in connections if isinstance(conn, websockets.ServerConnection)],
+            message
+        )
+        for conn in connections:
+            if not isinstance(conn, websockets.ServerConnection):
+                conn.send_threadsafe(message)
+
+        return len(connections)
 
     async def broadcast_goodbye_to_channel(self, mbid: str, total_setlists: int, error: bool) -> None:
-        """Broadcast a goodbye message to a channel, and close all its connections."""
-        # Part 1: Goodbye message
+        """Broadcast a goodbye message to a channel. If the fetch completed, the channel is kept as a replay
+        buffer; if it failed, the channel is closed, so the next request starts over.
+        Called from the Fetcher's thread; the work happens on the server's loop, with the connections."""
+        fetcher = fetchers.get(mbid)
+        finish = self._finish_channel(mbid, fetcher, total_setlists, error)
+        if self.loop is None or not self.loop.is_running():
+            # Nothing has connected yet (ASGI server without a loop so far)
+            await finish
+        else:
+            await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(finish, self.loop))
 
+    async def _finish_channel(self, mbid: str, fetcher: 'Fetcher | None', total_setlists: int, error: bool) -> None:
         # Include actual number of setlists fetched.
         goodbye_event = {
             "type": "goodbye",
             "totalSetlists": total_setlists,
-            "hadError": error
+            "hadError": error,
+            "stale": fetcher is not None and fetcher.stale
         }
+        connections = mbids_to_connections.get(mbid, set())
+        self._broadcast(connections, goodbye_event)
+
+        if fetcher is not None and fetchers.get(mbid) is fetcher:
+            if error:
+                await self._close_channel(mbid, fetcher)
+                return
+            # Keep it for clients yet to come
+            completed_channels[mbid] = (time.monotonic(), fetcher.fetched_setlists.nbytes())
+            completed_channels.move_to_end(mbid)
+            await self._evict_buffers()
+
+        # Clients hang up once they have the goodbye. Close any that haven't after a moment
+        waiting = [conn.disconnected for conn in connections if hasattr(conn, "disconnected")]
+        if len(waiting) > 0:
+            await asyncio.wait(waiting, timeout=GOODBYE_CLOSE_WAIT)
+        for conn in list(connections):
+            # Clients still being sent their snapshot are closed once it's sent (see _stream_channel)
+            if not getattr(conn, "sending_snapshot", False):
+                await conn.close()
+
+    async def _evict_buffers(self) -> None:
+        """Close the oldest completed channels until their setlists fit in CHANNEL_BUFFER_MAX_BYTES."""
+        total = sum(nbytes for _, nbytes in completed_channels.values())
+        while total > CHANNEL_BUFFER_MAX_BYTES and completed_channels:
+            mbid, (_, nbytes) = next(iter(completed_channels.items()))
+            total -= nbytes
+            await self._close_channel(mbid, fetchers.get(mbid))
+
+    async def _close_channel(self, mbid: str, fetcher: 'Fetcher | None') -> None:
+        """Remove a channel and close its connections. A newer channel for the same artist is left alone."""
+        if fetcher is not None and fetchers.get(mbid) is not fetcher:
+            return
+        fetchers.pop(mbid, None)
+        completed_channels.pop(mbid, None)
+        channel_limiters.pop(mbid, None)
+        for conn in list(mbids_to_connections.pop(mbid, ())):
+            await conn.close()
 
-        # If there are no clients in this channel, wait for at least one to connect
-        # before closing the server. Prevents the server from closing too early
-        # if the fetch process concludes before any clients connect.
-        elapsed = 0
-        while len(mbids_to_connections[mbid]) == 0 and elapsed < GOODBYE_WAIT:
-            await asyncio.sleep(0.5)
-            elapsed += 0.5
-
-        if len(mbids_to_connections[mbid]) == 0:
-            logger.warning(f"No clients connected for artist '{mbid}' :(")
-
-        self.broadcast_to_channel(mbid, goodbye_event)
-
-        # Part 2: Shut down the channel
-
-        # Stop any new connections.
-        del fetchers[mbid]
-
-        # For any clients that linger around for more than 1 second after
-        # the goodbye message, close them.
-        await asyncio.sleep(1)
-        for conn in mbids_to_connections[mbid]:
-            self.loop.create_task(conn.close())
-
-        del mbids_to_connections[mbid]
+    def owns_channel(self, mbid: str, fetcher: 'Fetcher') -> bool:
+        """Check that a fetcher's channel hasn't been taken over by a newer fetch of the same artist."""
+        return fetchers.get(mbid) is fetcher
 
     def add_artist(self, mbid: str, fetcher: 'Fetcher') -> None:
         """Add a new artist, opening a channel for it."""
         mbids_to_connections[mbid] = set()
         fetchers[mbid] = fetcher
+        # Replaces any completed channel for the artist
+        completed_channels.pop(mbid, None)
+        channel_limiters[mbid] = Limiter(f"connections to {mbid}", MAX_CONNECTIONS_PER_CHANNEL)
 
     # Below: a bunch of weird functions that are used by pytest to stop the server between tests
 
@@ -174,6 +534,7 @@ class WebSocketServer:
         self.loop.create_task(self._shutdown())
 
     async def _shutdown(self):
+        self.stop_reaper()
         await self.server.wait_closed()
         self.server = None
         logger.info("WebSocket server stopped")
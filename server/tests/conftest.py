@@ -1,31 +1,54 @@
 import pytest
 import pytest_asyncio
 import os
+import tempfile
+from pathlib import Path
 from flask import Flask
 from flask.testing import FlaskClient, FlaskCliRunner
-from pymongo import MongoClient
+from starlette.testclient import TestClient
 from app import create_app
+from asgi import create_asgi_app
+import circuit_breaker
+import tours
+import wss
 
 
 def pytest_configure():
-    # Set app to use test database
+    # Set app to use test database. Tests run against the in-memory backend
+    # unless DB_BACKEND says otherwise.
+    os.environ.setdefault("DB_BACKEND", "memory")
     os.environ["MONGO_DB_NAME"] = "test"
+    os.environ["SQLITE_PATH"] = str(Path(tempfile.gettempdir()) / "cm-test.sqlite3")
     # Overwrite API key. Tests should not contact setlist.fm API
     os.environ["SETLISTFM_API_KEY"] = "mango"
 
 
-@pytest_asyncio.fixture()
-async def app() -> Flask:
-    app = create_app()
+def reset_database() -> None:
+    # Cached tours are worked out from the database, so they go with it
+    tours._trackers.clear()
+    # The in-memory backend starts out empty anyway
+    backend = os.getenv("DB_BACKEND")
+    if backend == "mongo":
+        from pymongo import MongoClient
+        mongo_client = MongoClient(os.getenv("MONGO_URI", "mongodb://localhost:27017/"))
+        db = mongo_client[os.getenv("MONGO_DB_NAME")]
+        db.drop_collection("artists")
+        mongo_client.close()
+    elif backend == "sqlite":
+        for suffix in ["", "-wal", "-shm"]:
+            Path(os.getenv("SQLITE_PATH") + suffix).unlink(missing_ok=True)
 
-    # Reset database
-    mongo_client = MongoClient("mongodb://localhost:27017/")
-    db = mongo_client[os.getenv("MONGO_DB_NAME")]
-    db.drop_collection("artists")
-    mongo_client.close()
 
-    yield app
+def close_channels() -> None:
+    # Channels are module-level state, so they would outlive the app under test.
+    # Fetches that are still running find their channel gone and stay quiet.
+    wss.fetchers.clear()
+    wss.mbids_to_connections.clear()
+    wss.channel_limiters.clear()
+    wss.completed_channels.clear()
+
 
+def remove_log_handlers() -> None:
     # Remove handlers from all loggers
     # This also silences logs after the first test...
     # https://github.com/pytest-dev/pytest/issues/5502#issuecomment-1190557648
@@ -34,9 +57,39 @@ async def app() -> Flask:
     for logger in loggers:
         logger.handlers = []
 
+
+@pytest.fixture(autouse=True)
+def reset_circuit_breakers(monkeypatch) -> None:
+    # Breakers are module-level state too. Upstream errors mocked in one test shouldn't fail the next ones fast
+    monkeypatch.setattr(circuit_breaker, "setlistfm", circuit_breaker.CircuitBreaker("setlist.fm"))
+    monkeypatch.setattr(circuit_breaker, "spotify", circuit_breaker.CircuitBreaker("Spotify"))
+
+
+@pytest_asyncio.fixture()
+async def app() -> Flask:
+    reset_database()
+    app = create_app()
+
+    yield app
+
+    remove_log_handlers()
+    close_channels()
     app.wss.stop_server()
 
 
 @pytest.fixture()
 def client(app: Flask) -> FlaskClient:
     return app.test_client()
+
+
+@pytest.fixture()
+def asgi_client() -> TestClient:
+    """Client for the ASGI deployment, where HTTP and WebSockets share one app."""
+    reset_database()
+    asgi_app = create_asgi_app()
+
+    with TestClient(asgi_app) as client:
+        yield client
+
+    remove_log_handlers()
+    close_channels()
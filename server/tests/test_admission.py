@@ -0,0 +1,133 @@
+import json
+import threading
+import requests_mock
+from websockets.sync.client import connect
+import admission
+import wss
+from admission import CountLimiter, Limiter
+from test_setlist import JUPITER_MBID, jupiter_setlists
+
+
+def test_limiter_queue():
+    limiter = Limiter("test", 2)
+    first, second, third, fourth = (limiter.enqueue() for _ in range(4))
+    assert first.admitted and second.admitted
+    assert (third.position, fourth.position) == (1, 2)
+    assert not third.wait(timeout=0.01)
+
+    # Leaving the queue moves everyone behind up
+    third.release()
+    assert fourth.position == 1
+    # Slots go first come, first served
+    first.release()
+    assert fourth.wait(timeout=1)
+    assert fourth.position == 0
+    assert limiter.running == 2 and limiter.queued == 0
+
+    # Releasing twice doesn't free a second slot
+    first.release()
+    assert limiter.running == 2
+
+
+def test_limiter_wait_estimate():
+    limiter = Limiter("test", 2)
+    limiter.average_hold_s = 5
+    assert limiter.estimated_wait_s(0) == 0
+    assert limiter.estimated_wait_s(1) == limiter.estimated_wait_s(2) == 5
+    assert limiter.estimated_wait_s(3) == 10
+
+
+def test_limiter_blocks_until_released():
+    limiter = Limiter("test", 1)
+    running = limiter.enqueue()
+    queued = limiter.enqueue()
+    threading.Timer(0.05, running.release).start()
+    assert queued.wait(timeout=2)
+
+
+def test_count_limiter():
+    limiter = CountLimiter(2)
+    assert limiter.add("a") and limiter.add("a")
+    assert not limiter.add("a")
+    assert limiter.add("b")
+    limiter.remove("a")
+    assert limiter.count("a") == 1
+    assert limiter.add("a")
+
+
+def test_artist_lookup_busy(client, monkeypatch):
+    monkeypatch.setattr(admission, "upstream_limiter", Limiter("upstream", 1))
+    monkeypatch.setattr(admission, "UPSTREAM_QUEUE_TIMEOUT_S", 0.05)
+    with admission.upstream_limiter.enqueue():
+        response = client.get("/api/artists/mxmtoon")
+    assert response.status_code == 503
+    assert int(response.headers["Retry-After"]) >= 1
+
+
+def test_queued_fetch(client, monkeypatch):
+    monkeypatch.setattr(admission, "fetch_limiter", Limiter("fetches", 1))
+    # Another fetch is running
+    other = admission.fetch_limiter.enqueue()
+
+    with requests_mock.Mocker() as m:
+        m.get("https://api.spotify.com/v1/search", status_code=404, json={})
+        m.get(f"https://api.setlist.fm/rest/1.0/artist/{JUPITER_MBID}", json={"name": "Boys Go To Jupiter"})
+        for i, page in enumerate(jupiter_setlists):
+            m.get(f"https://api.setlist.fm/rest/1.0/artist/{JUPITER_MBID}/setlists?p={i+1}", json=page)
+
+        response = client.get(f"/api/setlists/{JUPITER_MBID}")
+        assert response.status_code == 200
+
+        with connect(f"ws://localhost:5001?mbid={JUPITER_MBID}") as websocket:
+            # Told where the fetch is in the queue right away
+            hello = json.loads(websocket.recv())
+            assert hello["type"] == "hello"
+            assert hello["queue"]["position"] == 1
+            assert hello["queue"]["estimatedWaitS"] > 0
+            # Nothing stored yet
+            assert json.loads(websocket.recv())["setlists"] == []
+
+            other.release()
+            assert json.loads(websocket.recv()) == {"type": "queue", "position": 0, "estimatedWaitS": 0}
+            while (event := json.loads(websocket.recv()))["type"] == "update":
+                pass
+            assert event["type"] == "goodbye"
+            assert event["totalSetlists"] == 4
+
+
+def test_channel_connection_queue(client, monkeypatch):
+    monkeypatch.setattr(wss, "MAX_CONNECTIONS_PER_CHANNEL", 1)
+    with requests_mock.Mocker() as m:
+        m.get("https://api.spotify.com/v1/search", status_code=404, json={})
+        m.get(f"https://api.setlist.fm/rest/1.0/artist/{JUPITER_MBID}", json={"name": "Boys Go To Jupiter"})
+        # Keep the fetch going until the test is done
+        m.get(f"https://api.setlist.fm/rest/1.0/artist/{JUPITER_MBID}/setlists?p=1", json=jupiter_setlists[0])
+        m.get(f"https://api.setlist.fm/rest/1.0/artist/{JUPITER_MBID}/setlists?p=2", status_code=500)
+
+        client.get(f"/api/setlists/{JUPITER_MBID}")
+        first = connect(f"ws://localhost:5001?mbid={JUPITER_MBID}")
+        assert json.loads(first.recv())["type"] == "hello"
+
+        with connect(f"ws://localhost:5001?mbid={JUPITER_MBID}") as second:
+            hello = json.loads(second.recv())
+            assert hello["queue"]["position"] == 1
+
+            # A place opens up when the first client leaves
+            first.close()
+            assert json.loads(second.recv()) == {"type": "queue", "position": 0, "estimatedWaitS": 0}
+            assert json.loads(second.recv())["type"] == "update"
+
+
+def test_connections_per_ip(client, monkeypatch):
+    monkeypatch.setattr(wss, "ip_connections", CountLimiter(0))
+    with requests_mock.Mocker() as m:
+        m.get("https://api.spotify.com/v1/search", status_code=404, json={})
+        m.get(f"https://api.setlist.fm/rest/1.0/artist/{JUPITER_MBID}", json={"name": "Boys Go To Jupiter"})
+        m.get(f"https://api.setlist.fm/rest/1.0/artist/{JUPITER_MBID}/setlists", json={})
+        client.get(f"/api/setlists/{JUPITER_MBID}")
+
+        try:
+            connect(f"ws://localhost:5001?mbid={JUPITER_MBID}")
+            assert False, "Connection should have been refused"
+        except Exception as e:
+            assert "429" in str(e)
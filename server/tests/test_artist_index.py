@@ -0,0 +1,82 @@
+import artist_index
+from artist_index import SuggestIndex
+from cache_warmer import PopularityTracker
+
+JUPITER = "904e413a-1327-4418-a96d-114a14a874ff"
+BEYONCE = "859d0860-d480-4efd-970c-c05d5f1776b8"
+ACDC = "66c662b6-6e2f-4930-8610-912e24c63ed1"
+JUPITER_ENDING = "d7d6f2a7-5a4a-4a1b-b0b3-3f1d9f0e4b7c"
+
+
+def names(suggestions: list[dict]) -> list[str]:
+    return [suggestion["name"] for suggestion in suggestions]
+
+
+def make_index() -> SuggestIndex:
+    index = SuggestIndex()
+    index.add_many([(JUPITER, "Boys Go To Jupiter"), (BEYONCE, "Beyoncé"), (ACDC, "AC/DC")])
+    index.add(JUPITER_ENDING, "Jupiter Ending")
+    return index
+
+
+def test_prefixes():
+    index = make_index()
+    assert names(index.suggest("boys go")) == ["Boys Go To Jupiter"]
+    # Names starting with the query come before names with a word starting with it
+    assert names(index.suggest("jup")) == ["Jupiter Ending", "Boys Go To Jupiter"]
+    # Case, accents, punctuation and spacing don't matter
+    assert names(index.suggest("  BEYONCE")) == ["Beyoncé"]
+    assert names(index.suggest("acdc")) == names(index.suggest("ac/dc")) == ["AC/DC"]
+    assert index.suggest("") == []
+    assert index.suggest("zzz") == []
+
+
+def test_typos():
+    index = make_index()
+    assert names(index.suggest("jupitr ending")) == ["Jupiter Ending"]
+
+
+def test_popular_first():
+    index = make_index()
+    popularity = PopularityTracker()
+    popularity.record(JUPITER)
+    assert names(index.suggest("jup", popularity=popularity)) == ["Jupiter Ending", "Boys Go To Jupiter"]
+    index.add("e7c4b3a5-1111-4222-8333-944455556666", "Jupiter")
+    assert names(index.suggest("jupiter", limit=2, popularity=popularity)) == ["Jupiter", "Jupiter Ending"]
+
+    # Equally good matches go by popularity
+    endless = "0f0f0f0f-2222-4333-8444-955566667777"
+    index.add(endless, "Jupiter Endless")
+    assert names(index.suggest("jupiter end", limit=2, popularity=popularity)) == ["Jupiter Ending", "Jupiter Endless"]
+    popularity.record(endless)
+    assert names(index.suggest("jupiter end", limit=2, popularity=popularity)) == ["Jupiter Endless", "Jupiter Ending"]
+
+
+def test_renames():
+    index = make_index()
+    index.add(JUPITER, "Boys Went To Saturn")
+    assert names(index.suggest("boys")) == ["Boys Went To Saturn"]
+    assert names(index.suggest("boys go to jup")) == []
+    # Artists whose names couldn't be looked up aren't suggested
+    index.add("1a1a1a1a-3333-4444-8555-a66677778888", "??")
+    assert len(index) == 4
+
+
+def test_renames_while_loading():
+    # An artist a Fetcher added comes through the background load under a new name
+    index = SuggestIndex()
+    index.add(JUPITER, "Old Name")
+    index.add_many([(ACDC, "AC/DC"), (JUPITER, "Boys Go To Jupiter")])
+    assert index.suggest("old") == []
+    assert index.suggest("name") == []
+    assert names(index.suggest("boys")) == ["Boys Go To Jupiter"]
+    assert sorted(index._keys) == index._keys
+
+
+def test_suggest_endpoint(client, monkeypatch):
+    monkeypatch.setattr(artist_index, "index", make_index())
+    response = client.get("/api/artists/suggest?q=beyon")
+    assert response.status_code == 200
+    assert response.json == {"query": "beyon", "artists": [{"mbid": BEYONCE, "name": "Beyoncé"}]}
+    assert client.get("/api/artists/suggest?q=jup&limit=1").json["artists"][0]["mbid"] == JUPITER_ENDING
+    assert client.get("/api/artists/suggest?q=jup&limit=0").status_code == 400
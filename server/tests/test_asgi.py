@@ -0,0 +1,72 @@
+import json
+import pytest
+import requests_mock
+from pathlib import Path
+from starlette.testclient import WebSocketDenialResponse
+from starlette.websockets import WebSocketDisconnect
+
+JUPITER_MBID = "904e413a-1327-4418-a96d-114a14a874ff"
+
+jupiter_setlists = [
+    json.loads(Path(f"tests/mocks/GET_setlists_jupiter/p{i}.json").read_text(encoding="utf-8")) for i in range(1, 3)
+]
+
+
+def test_get_artist(asgi_client):
+    mock_data = json.loads(Path("tests/mocks/GET_artists_mxmtoon.json").read_text(encoding="utf-8"))
+    with requests_mock.Mocker() as m:
+        m.get("https://api.spotify.com/v1/search", status_code=404, json={})
+        m.get("https://api.setlist.fm/rest/1.0/search/artists", json=mock_data)
+
+        response = asgi_client.get("/api/artists/mxmtoon")
+
+        assert response.status_code == 200
+        assert response.json()["mbid"] == "ccbced49-2689-46f8-9101-1c265d6f7b8f"
+
+
+def test_invalid_url(asgi_client):
+    response = asgi_client.get("/api/nonsense")
+    assert response.status_code == 404
+
+
+def test_bad_mbid_param(asgi_client):
+    # No fetch has been started for this mbid, so the connection is refused
+    with pytest.raises(WebSocketDenialResponse) as e:
+        with asgi_client.websocket_connect("/ws?mbid=ccbced49-2689-46f8-9101-1c265d6f7b8f"):
+            pass
+    assert e.value.status_code == 401
+
+
+def test_fetch_over_websocket(asgi_client):
+    with requests_mock.Mocker() as m:
+        m.get("https://api.spotify.com/v1/search", status_code=404, json={})
+        m.get(f"https://api.setlist.fm/rest/1.0/artist/{JUPITER_MBID}", json={"name": "Boys Go To Jupiter"})
+        for i, page in enumerate(jupiter_setlists):
+            m.get(f"https://api.setlist.fm/rest/1.0/artist/{JUPITER_MBID}/setlists?p={i+1}", json=page)
+
+        response = asgi_client.get(f"/api/setlists/{JUPITER_MBID}")
+        assert response.json()["wssReady"] == True
+
+        # Same app, same port
+        with asgi_client.websocket_connect(f"/ws?mbid={JUPITER_MBID}") as websocket:
+            event = websocket.receive_json()
+            assert event["type"] == "hello"
+            assert event["artistMbid"] == JUPITER_MBID
+
+            received = 0
+            while True:
+                try:
+                    event = websocket.receive_json()
+                except WebSocketDisconnect:
+                    break
+                if event["type"] == "update":
+                    received += len(event["setlists"])
+                    # Map positions come with the setlists
+                    assert all("scatterLat" in s for s in event["setlists"] if s["isValid"])
+                else:
+                    assert event["type"] == "goodbye"
+                    assert event["totalSetlists"] == 4
+                    assert event["hadError"] == False
+                    break
+
+        assert received == 4
@@ -0,0 +1,91 @@
+import time
+from datetime import datetime, timezone
+import requests_mock
+import setlistfm_api
+import wss
+from cache_warmer import CacheWarmer, PopularityTracker, parse_hours, TRENDING_HALF_LIFE_S
+from memory_database import MemoryDatabase
+from setlistfm_api import BudgetedKeyPool, KeyPool
+
+JUPITER_MBID = "904e413a-1327-4418-a96d-114a14a874ff"
+HOUR = 3600
+
+
+def test_popular_and_trending():
+    tracker = PopularityTracker()
+    now = 1_000_000.0
+    # Requested a lot, two days ago
+    for _ in range(20):
+        tracker.record("classic", now - 48 * HOUR)
+    # Requested a few times just now
+    for _ in range(3):
+        tracker.record("viral", now)
+    tracker.record("meh", now - 24 * HOUR)
+
+    assert tracker.candidates(1, now) == ["classic", "viral"]
+    assert tracker.candidates(3, now)[:2] == ["classic", "viral"]
+    assert set(tracker.candidates(3, now)) == {"classic", "viral", "meh"}
+
+    # Much later, the viral artist's trending score has faded
+    later = now + 10 * TRENDING_HALF_LIFE_S
+    tracker.record("newer", later)
+    assert tracker.candidates(1, later) == ["classic", "newer"]
+
+
+def test_off_peak_hours(monkeypatch):
+    assert parse_hours("") is None
+    assert parse_hours("22-6") == (22, 6)
+
+    monkeypatch.setenv("CACHE_WARM_HOURS", "22-6")
+    monkeypatch.setenv("CACHE_WARM_TZ", "UTC")
+    warmer = CacheWarmer(PopularityTracker(), MemoryDatabase(), None)
+    assert warmer.is_off_peak(datetime(2025, 1, 1, 23, tzinfo=timezone.utc))
+    assert warmer.is_off_peak(datetime(2025, 1, 1, 5, tzinfo=timezone.utc))
+    assert not warmer.is_off_peak(datetime(2025, 1, 1, 6, tzinfo=timezone.utc))
+
+    monkeypatch.delenv("CACHE_WARM_HOURS")
+    assert not CacheWarmer(PopularityTracker(), MemoryDatabase(), None).enabled
+
+
+def test_next_artist(monkeypatch):
+    monkeypatch.setenv("CACHE_WARM_STALE_HOURS", "1")
+    db = MemoryDatabase()
+    tracker = PopularityTracker()
+    warmer = CacheWarmer(tracker, db, None)
+
+    for mbid in ["fresh", "fresh", "fresh", "stale", "stale", "new"]:
+        tracker.record(mbid)
+    db.insert_artist("fresh", "Fresh")
+    db.mark_artist_complete("fresh")
+    db.insert_artist("stale", "Stale")
+    db.mark_artist_complete("stale")
+    db._artists["stale"]["lastUpdated"] = datetime(2020, 1, 1, tzinfo=timezone.utc)
+
+    assert warmer.next_artist() == "stale"
+    db.reinsert_artist("stale")
+    # Being fetched right now
+    assert warmer.next_artist() == "new"
+
+
+def test_budget_share(monkeypatch):
+    monkeypatch.setattr(setlistfm_api, "RATE_LIMIT_MS", 20)
+    budget = BudgetedKeyPool(KeyPool(["a", "b"]), 0.25)
+
+    start = time.perf_counter()
+    for _ in range(5):
+        budget.acquire()
+    # 2 keys at 20 ms leave a quarter share one request per 40 ms
+    assert time.perf_counter() - start >= 4 * 0.04 * 0.9
+
+
+def test_requests_are_recorded(app, client):
+    with requests_mock.Mocker() as m:
+        m.get("https://api.spotify.com/v1/search", status_code=404, json={})
+        m.get(f"https://api.setlist.fm/rest/1.0/artist/{JUPITER_MBID}", json={"name": "Boys Go To Jupiter"})
+        m.get(f"https://api.setlist.fm/rest/1.0/artist/{JUPITER_MBID}/setlists", json={})
+
+        client.get(f"/api/setlists/{JUPITER_MBID}")
+        # Let the fetch finish while setlist.fm is still mocked
+        wss.fetchers[JUPITER_MBID].first_page_done.wait(5)
+
+    assert app.popularity.candidates() == [JUPITER_MBID]
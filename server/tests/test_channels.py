@@ -0,0 +1,143 @@
+import asyncio
+import json
+import time
+import requests_mock
+from threading import Thread
+from websockets.sync.client import connect
+import wss
+from fetcher import Fetcher
+from map_layout import ScatterLayout
+from test_setlist import JUPITER_MBID, jupiter_setlists
+
+
+def mock_jupiter(m: requests_mock.Mocker) -> None:
+    m.get("https://api.spotify.com/v1/search", status_code=404, json={})
+    m.get(f"https://api.setlist.fm/rest/1.0/artist/{JUPITER_MBID}", json={"name": "Boys Go To Jupiter"})
+    for i, page in enumerate(jupiter_setlists):
+        m.get(f"https://api.setlist.fm/rest/1.0/artist/{JUPITER_MBID}/setlists?p={i+1}", json=page)
+
+
+def wait_for(condition, timeout: float = 5) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.02)
+    return True
+
+
+def run_on_server(app, coroutine):
+    return asyncio.run_coroutine_threadsafe(coroutine, app.wss.loop).result(5)
+
+
+def test_late_client_gets_replay(client):
+    with requests_mock.Mocker() as m:
+        mock_jupiter(m)
+        client.get(f"/api/setlists/{JUPITER_MBID}")
+        # The fetch finishes before anyone connects
+        assert wait_for(lambda: JUPITER_MBID in wss.completed_channels)
+        fetcher = wss.fetchers[JUPITER_MBID]
+
+        # Requests in the meantime reuse the channel instead of fetching again
+        assert client.get(f"/api/setlists/{JUPITER_MBID}").json["wssReady"] == True
+        assert wss.fetchers[JUPITER_MBID] is fetcher
+
+    with connect(f"ws://localhost:5001?mbid={JUPITER_MBID}") as websocket:
+        hello = json.loads(websocket.recv())
+        assert hello["type"] == "hello" and hello["totalExpected"] == 4
+        update = json.loads(websocket.recv())
+        assert len(update["setlists"]) == 4
+        assert all("scatterLat" in setlist for setlist in update["setlists"] if setlist["isValid"])
+        goodbye = json.loads(websocket.recv())
+        assert goodbye == {"type": "goodbye", "totalSetlists": 4, "hadError": False, "stale": False}
+
+
+def test_snapshot_sent_in_frames(client, monkeypatch):
+    # One setlist per frame
+    monkeypatch.setattr(wss, "SNAPSHOT_FRAME_BYTES", 1)
+    with requests_mock.Mocker() as m:
+        mock_jupiter(m)
+        client.get(f"/api/setlists/{JUPITER_MBID}")
+        assert wait_for(lambda: JUPITER_MBID in wss.completed_channels)
+
+    with connect(f"ws://localhost:5001?mbid={JUPITER_MBID}") as websocket:
+        assert json.loads(websocket.recv())["type"] == "hello"
+        updates = [json.loads(websocket.recv()) for _ in range(4)]
+        assert all(update["type"] == "update" and update["totalExpected"] == 4 for update in updates)
+        assert all(len(update["setlists"]) == 1 for update in updates)
+        # Newest first
+        dates = [update["setlists"][0]["eventDate"] for update in updates]
+        assert dates == sorted(dates, reverse=True)
+        assert json.loads(websocket.recv())["type"] == "goodbye"
+
+
+def test_snapshot_frames():
+    assert [json.loads(frame) for frame in wss.Snapshot([], None).frames()] == [
+        {"type": "update", "setlists": [], "totalExpected": None}
+    ]
+    setlists = [
+        {"isValid": True, "eventDate": f"2024-01-{day:02}", "cityLat": 47.6, "cityLong": -122.3, "songs": ["Opener"]}
+        for day in range(1, 31)
+    ] + [{"isValid": False}]
+    frames = [json.loads(frame) for frame in wss.Snapshot(setlists, 31).frames()]
+    assert len(frames) == 1
+    sent = frames[0]["setlists"]
+    # Newest first, invalid setlists last
+    assert [setlist.get("eventDate") for setlist in sent] == [f"2024-01-{day:02}" for day in range(30, 0, -1)] + [None]
+    # Placed as the Fetcher places them, in the order they were stored
+    placed = {setlist["eventDate"]: setlist for setlist in ScatterLayout().place(setlists) if setlist["isValid"]}
+    for setlist in sent[:-1]:
+        assert "songs" not in setlist
+        assert (setlist["scatterLat"], setlist["scatterLong"]) == (
+            placed[setlist["eventDate"]]["scatterLat"], placed[setlist["eventDate"]]["scatterLong"]
+        )
+
+
+def test_expired_channels_are_reaped(app, client, monkeypatch):
+    with requests_mock.Mocker() as m:
+        mock_jupiter(m)
+        client.get(f"/api/setlists/{JUPITER_MBID}")
+        assert wait_for(lambda: JUPITER_MBID in wss.completed_channels)
+
+    assert app.wss.has_replay(JUPITER_MBID)
+    monkeypatch.setattr(wss, "CHANNEL_LINGER_S", 0)
+    assert not app.wss.has_replay(JUPITER_MBID)
+    run_on_server(app, app.wss.reap())
+    assert JUPITER_MBID not in wss.fetchers
+    assert JUPITER_MBID not in wss.mbids_to_connections
+
+
+def test_buffer_memory_cap(client, monkeypatch):
+    monkeypatch.setattr(wss, "CHANNEL_BUFFER_MAX_BYTES", 0)
+    with requests_mock.Mocker() as m:
+        mock_jupiter(m)
+        client.get(f"/api/setlists/{JUPITER_MBID}")
+        # No room to keep it, so the channel closes once done
+        assert wait_for(lambda: JUPITER_MBID not in wss.fetchers)
+    assert JUPITER_MBID not in wss.completed_channels
+
+
+def test_failed_fetch_closes_channel(client, monkeypatch):
+    async def broken_fetch(self, appending):
+        raise RuntimeError("oops")
+    monkeypatch.setattr(Fetcher, "_fetch_setlists", broken_fetch)
+
+    with requests_mock.Mocker() as m:
+        mock_jupiter(m)
+        client.get(f"/api/setlists/{JUPITER_MBID}")
+        assert wait_for(lambda: JUPITER_MBID not in wss.fetchers)
+    assert JUPITER_MBID not in wss.mbids_to_connections
+    assert JUPITER_MBID not in wss.completed_channels
+
+
+def test_orphaned_channels_are_reaped(app):
+    fetcher = Fetcher(JUPITER_MBID, app.wss, app.db)
+    # A fetch thread that died without finishing its channel
+    fetcher.thread = Thread(target=lambda: None)
+    fetcher.thread.start()
+    fetcher.thread.join()
+    app.wss.add_artist(JUPITER_MBID, fetcher)
+
+    run_on_server(app, app.wss.reap())
+    assert JUPITER_MBID not in wss.fetchers
+    assert JUPITER_MBID not in wss.mbids_to_connections
@@ -0,0 +1,105 @@
+import json
+import pytest
+import requests_mock
+from websockets.sync.client import connect
+import circuit_breaker
+import wss
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from setlistfm_api import KeyPool, SetlistFmAPI
+from test_channels import mock_jupiter, wait_for
+from test_setlist import JUPITER_MBID
+
+
+def trip(breaker: CircuitBreaker) -> None:
+    while breaker.allow():
+        breaker.record(False)
+    assert breaker.is_open
+
+
+def test_breaker_states(monkeypatch):
+    breaker = CircuitBreaker("upstream")
+    # The odd failure is fine
+    for i in range(circuit_breaker.WINDOW):
+        assert breaker.allow()
+        breaker.record(i % 4 != 0)
+    assert breaker.state == circuit_breaker.CLOSED
+
+    breaker = CircuitBreaker("upstream")
+    trip(breaker)
+    assert breaker.is_open
+    assert not breaker.allow()
+    assert breaker.retry_after_s > 0
+
+    # Once the open period is over, one probe at a time goes out
+    monkeypatch.setattr(circuit_breaker, "OPEN_S", 0)
+    assert breaker.allow()
+    assert breaker.state == circuit_breaker.HALF_OPEN
+    assert not breaker.allow()
+    breaker.record(False)
+    assert breaker.state == circuit_breaker.OPEN
+
+    assert breaker.allow()
+    breaker.record(True)
+    assert breaker.state == circuit_breaker.CLOSED
+    assert breaker.allow()
+
+
+def test_requests_fail_fast():
+    trip(circuit_breaker.setlistfm)
+    with requests_mock.Mocker() as m:
+        with pytest.raises(CircuitOpenError):
+            SetlistFmAPI(KeyPool(["mango"])).get_artist_info(JUPITER_MBID)
+        assert m.call_count == 0
+
+
+def test_outage_trips_breaker(monkeypatch):
+    monkeypatch.setattr("setlistfm_api.RATE_LIMIT_MS", 0)
+    monkeypatch.setattr("setlistfm_api.MAX_ATTEMPTS", 3)
+    api = SetlistFmAPI(KeyPool(["mango"]))
+    with requests_mock.Mocker() as m:
+        m.get("https://api.setlist.fm/rest/1.0/search/artists", status_code=502, text="Bad gateway")
+        for _ in range(circuit_breaker.MIN_CALLS // 3):
+            with pytest.raises(Exception):
+                api.search_artist("mxmtoon")
+        with pytest.raises(CircuitOpenError):
+            api.search_artist("mxmtoon")
+        calls = m.call_count
+        with pytest.raises(CircuitOpenError):
+            api.search_artist("mxmtoon")
+        assert m.call_count == calls
+
+
+def test_stored_artist_served_stale(client):
+    with requests_mock.Mocker() as m:
+        mock_jupiter(m)
+        client.get(f"/api/setlists/{JUPITER_MBID}")
+        assert wait_for(lambda: JUPITER_MBID in wss.completed_channels)
+    # Done with that channel
+    wss.completed_channels.pop(JUPITER_MBID)
+
+    trip(circuit_breaker.setlistfm)
+    with requests_mock.Mocker() as m:
+        assert client.get(f"/api/setlists/{JUPITER_MBID}").json["wssReady"] == True
+        assert m.call_count == 0
+    assert wss.fetchers[JUPITER_MBID].stale
+    # Only for those already on their way to it
+    assert wait_for(lambda: JUPITER_MBID in wss.completed_channels)
+    assert not client.application.wss.has_replay(JUPITER_MBID)
+
+    with connect(f"ws://localhost:5001?mbid={JUPITER_MBID}") as websocket:
+        hello = json.loads(websocket.recv())
+        assert hello["stale"] == True
+        update = json.loads(websocket.recv())
+        assert len(update["setlists"]) == 4
+        goodbye = json.loads(websocket.recv())
+        assert goodbye == {"type": "goodbye", "totalSetlists": 4, "hadError": False, "stale": True}
+
+
+def test_unknown_artist_unavailable(client):
+    trip(circuit_breaker.setlistfm)
+    response = client.get(f"/api/setlists/{JUPITER_MBID}")
+    assert response.status_code == 503
+    assert int(response.headers["Retry-After"]) > 0
+
+    response = client.get("/api/artists/mxmtoon")
+    assert response.status_code == 503
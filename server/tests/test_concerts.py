@@ -0,0 +1,57 @@
+from test_database import make_setlist
+
+MBID = "b4db7e5b-fb5f-4bc0-8a5a-2c1b4b7ab5b3"
+
+
+def store_setlists(app) -> None:
+    app.db.insert_artist(MBID, "Boys Go To Jupiter")
+    app.db.insert_setlists(MBID, [
+        make_setlist("2018-03-01"),
+        make_setlist("2019-05-01"),
+        make_setlist("2019-09-01") | {"venueName": "The Crocodile"},
+        make_setlist("2019-10-01", "Tokyo") | {"cityLat": 35.7, "cityLong": 139.7}
+    ])
+
+
+def test_concerts_near(app, client):
+    store_setlists(app)
+
+    response = client.get("/api/concerts/near?lat=47.6&long=-122.3&radiusKm=50&from=2019-01-01&to=2019-12-31")
+    assert response.status_code == 200
+    concerts = response.json["concerts"]
+    assert [c["eventDate"] for c in concerts] == ["2019-09-01", "2019-05-01"]
+    assert concerts[0]["artistMbid"] == MBID
+    assert concerts[0]["artistName"] == "Boys Go To Jupiter"
+    assert concerts[0]["distanceKm"] == 0
+    assert response.json["next"] is None
+
+
+def test_concerts_pages(app, client):
+    store_setlists(app)
+
+    seen = []
+    url = "/api/concerts/near?lat=47.6&long=-122.3&limit=2"
+    while url:
+        page = client.get(url).json
+        seen += [c["eventDate"] for c in page["concerts"]]
+        url = f"/api/concerts/near?lat=47.6&long=-122.3&limit=2&cursor={page['next']}" if page["next"] else None
+    assert seen == ["2019-09-01", "2019-05-01", "2018-03-01"]
+
+
+def test_concerts_at_venue(app, client):
+    store_setlists(app)
+
+    response = client.get("/api/concerts/venue?venue=the crocodile")
+    assert [c["eventDate"] for c in response.json["concerts"]] == ["2019-09-01"]
+    response = client.get("/api/concerts/venue?city=tokyo")
+    assert [c["cityName"] for c in response.json["concerts"]] == ["Tokyo"]
+
+
+def test_concerts_bad_requests(client):
+    assert client.get("/api/concerts/near?long=-122.3").status_code == 400
+    assert client.get("/api/concerts/near?lat=95&long=-122.3").status_code == 400
+    assert client.get("/api/concerts/near?lat=47.6&long=-122.3&cursor=nonsense").status_code == 400
+    # Not the end of the results, which would be an empty page
+    assert client.get("/api/concerts/near?lat=47.6&long=-122.3&cursor=2019-05-01_nonsense").status_code == 400
+    assert client.get("/api/concerts/venue?city=tokyo&cursor=2019-05-01_nonsense").status_code == 400
+    assert client.get("/api/concerts/venue").status_code == 400
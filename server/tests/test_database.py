@@ -0,0 +1,296 @@
+import os
+import pytest
+from types import SimpleNamespace
+from database import ConcertQuery, create_database
+from stats import ArtistStats
+
+MBID = "b4db7e5b-fb5f-4bc0-8a5a-2c1b4b7ab5b3"
+
+
+def make_setlist(date: str, city: str = "Seattle") -> dict:
+    return {
+        "isValid": True,
+        "eventDate": date,
+        "venueName": "Venue",
+        "cityName": city,
+        "cityLat": 47.6,
+        "cityLong": -122.3,
+        "stateName": "Washington",
+        "countryName": "United States",
+        "setlistUrl": "https://www.setlist.fm/",
+        "songsPerformed": 12
+    }
+
+
+@pytest.fixture(params=["memory", "sqlite", "sqlite-direct", "mongo"])
+def db(request, tmp_path, monkeypatch):
+    # "-direct" skips the write-behind buffer
+    backend, _, direct = request.param.partition("-")
+    if backend == "sqlite":
+        monkeypatch.setenv("SQLITE_PATH", str(tmp_path / "test.sqlite3"))
+    if backend == "mongo":
+        pymongo = pytest.importorskip("pymongo")
+        try:
+            pymongo.MongoClient(os.getenv("MONGO_URI"), serverSelectionTimeoutMS=500).admin.command("ping")
+        except pymongo.errors.PyMongoError:
+            pytest.skip("MongoDB is not running")
+
+    db = create_database(backend, write_behind=not direct)
+    db.delete_artist(MBID)
+    yield db
+    db.delete_artist(MBID)
+    db.close()
+
+
+def test_artist_status(db):
+    assert db.check_artist(MBID) == (False, False, None)
+
+    db.insert_artist(MBID, "Boys Go To Jupiter")
+    exists, in_progress, last_updated = db.check_artist(MBID)
+    assert exists == True
+    assert in_progress == True
+    assert last_updated is not None
+
+    db.mark_artist_complete(MBID)
+    assert db.check_artist(MBID)[1] == False
+
+    db.reinsert_artist(MBID)
+    assert db.check_artist(MBID)[1] == True
+
+    db.delete_artist(MBID)
+    assert db.check_artist(MBID)[0] == False
+
+
+def test_artist_names(db):
+    db.insert_artist(MBID, "Boys Go To Jupiter")
+    assert (MBID, "Boys Go To Jupiter") in db.get_artist_names()
+
+
+def test_setlists(db):
+    assert db.get_all_setlists(MBID) == []
+    assert list(db.iter_setlists(MBID)) == []
+    assert db.get_last_setlist(MBID) is None
+
+    db.insert_artist(MBID, "Boys Go To Jupiter")
+    db.insert_setlists(MBID, [make_setlist("2023-05-01"), make_setlist("2024-01-15", "Tacoma")])
+    db.insert_setlists(MBID, [make_setlist("2022-11-30", "Portland")])
+
+    # Insertion order is kept
+    assert [s["cityName"] for s in db.get_all_setlists(MBID)] == ["Seattle", "Tacoma", "Portland"]
+    assert db.get_last_setlist(MBID) == make_setlist("2024-01-15", "Tacoma")
+    assert list(db.iter_setlists(MBID)) == db.get_all_setlists(MBID)
+
+    # Invalid setlists have no date and never count as the latest
+    db.insert_setlists(MBID, [{"isValid": False}])
+    assert db.get_last_setlist(MBID)["eventDate"] == "2024-01-15"
+    assert len(db.get_all_setlists(MBID)) == 4
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        create_database("postgres")
+
+
+OTHER_MBID = "e2a5c1c0-7a2d-4c48-9a0b-3f1d8c4e2f10"
+
+
+def test_find_concerts(db):
+    db.delete_artist(OTHER_MBID)
+    db.insert_artist(MBID, "Boys Go To Jupiter")
+    db.insert_artist(OTHER_MBID, "Someone Else")
+    portland = make_setlist("2019-08-01", "Portland") | {"cityLat": 45.5, "cityLong": -122.7}
+    db.insert_setlists(MBID, [make_setlist("2019-05-01"), portland, {"isValid": False}])
+    db.insert_setlists(OTHER_MBID, [
+        make_setlist("2019-06-01") | {"venueName": "The  Showbox"},
+        make_setlist("2021-01-01")
+    ])
+
+    # Within 50 km of Seattle: Portland is ~230 km away
+    near = db.find_concerts(ConcertQuery(lat=47.61, long=-122.33, radius_km=50))
+    assert [c["eventDate"] for c in near] == ["2021-01-01", "2019-06-01", "2019-05-01"]
+    assert [c["artistName"] for c in near] == ["Someone Else", "Someone Else", "Boys Go To Jupiter"]
+    assert near[0]["distanceKm"] < 5
+    assert near[0]["cityName"] == "Seattle"
+
+    # Dates
+    in_2019 = db.find_concerts(ConcertQuery(lat=47.6, long=-122.3, radius_km=300, date_from="2019-01-01", date_to="2019-12-31"))
+    assert [c["eventDate"] for c in in_2019] == ["2019-08-01", "2019-06-01", "2019-05-01"]
+
+    # Venue and city, ignoring case and extra spaces
+    assert [c["eventDate"] for c in db.find_concerts(ConcertQuery(venue="the showbox"))] == ["2019-06-01"]
+    assert [c["artistMbid"] for c in db.find_concerts(ConcertQuery(city="PORTLAND"))] == [MBID]
+
+    # Pages continue after the last concert of the previous one
+    first = db.find_concerts(ConcertQuery(city="Seattle", limit=2))
+    assert [c["eventDate"] for c in first] == ["2021-01-01", "2019-06-01"]
+    after = (first[-1]["eventDate"], first[-1]["concertId"])
+    rest = db.find_concerts(ConcertQuery(city="Seattle", limit=2, after=after))
+    assert [c["eventDate"] for c in rest] == ["2019-05-01"]
+
+    # A cursor with an id the database couldn't have handed out isn't the end of the results
+    with pytest.raises(ValueError):
+        db.find_concerts(ConcertQuery(city="Seattle", after=("2019-05-01", "nonsense")))
+
+    # Deleted artists leave the index
+    db.delete_artist(OTHER_MBID)
+    assert [c["eventDate"] for c in db.find_concerts(ConcertQuery(city="Seattle"))] == ["2019-05-01"]
+
+
+def test_unknown_artist_not_indexed(db):
+    # Setlists for an artist that isn't stored (deleted, or never inserted) aren't indexed either
+    db.delete_artist(OTHER_MBID)
+    db.insert_setlists(OTHER_MBID, [make_setlist("2020-02-02") | {"songs": ["Hit Song"]}])
+    assert db.get_all_setlists(OTHER_MBID) == []
+    assert db.find_concerts(ConcertQuery(city="Seattle")) == []
+    assert db.top_songs(OTHER_MBID, None, 10) == []
+
+
+def test_memory_delete_unindexes_concerts():
+    # A deleted artist's concerts leave the index, which lets go of their setlists
+    from memory_database import MemoryDatabase
+    db = MemoryDatabase()
+    db.insert_artist(MBID, "Boys Go To Jupiter")
+    db.insert_artist(OTHER_MBID, "Someone Else")
+    db.insert_setlists(MBID, [make_setlist("2019-05-01"), make_setlist("2019-08-01", "Portland")])
+    db.insert_setlists(OTHER_MBID, [make_setlist("2021-01-01")])
+
+    db.delete_artist(MBID)
+    assert db._concerts[:2] == [None, None]
+    assert "portland" not in db._by_city
+    assert db._by_city["seattle"] == [2]
+    assert [c["artistMbid"] for c in db.find_concerts(ConcertQuery(lat=47.6, long=-122.3, radius_km=10))] == [OTHER_MBID]
+
+    # As when a stuck fetch starts over
+    db.insert_artist(MBID, "Boys Go To Jupiter")
+    db.insert_setlists(MBID, [make_setlist("2019-05-01")])
+    assert [c["eventDate"] for c in db.find_concerts(ConcertQuery(city="Seattle"))] == ["2021-01-01", "2019-05-01"]
+
+
+def test_concert_index_backfill(tmp_path):
+    # SQLite files from before the concert index get their setlists indexed when opened
+    import sqlite3
+    from sqlite_database import SqliteDatabase
+    path = str(tmp_path / "old.sqlite3")
+    db = SqliteDatabase(path)
+    db.insert_artist(MBID, "Boys Go To Jupiter")
+    db.insert_setlists(MBID, [make_setlist("2023-05-01")])
+    db.close()
+    conn = sqlite3.connect(path)
+    conn.executescript("DROP TABLE concerts; DROP TABLE concerts_geo;")
+    conn.close()
+
+    db = SqliteDatabase(path)
+    assert len(db.find_concerts(ConcertQuery(lat=47.6, long=-122.3, radius_km=10))) == 1
+    db.close()
+
+
+def test_mongo_concert_index_backfill():
+    # A backfill cut short, or preceded by a fetch, carries on without indexing anything twice
+    pymongo = pytest.importorskip("pymongo")
+    try:
+        pymongo.MongoClient(os.getenv("MONGO_URI"), serverSelectionTimeoutMS=500).admin.command("ping")
+    except pymongo.errors.PyMongoError:
+        pytest.skip("MongoDB is not running")
+    from mongo_database import MongoDatabase
+    db = MongoDatabase()
+    try:
+        db.delete_artist(MBID)
+        db.insert_artist(MBID, "Boys Go To Jupiter")
+        setlists = [make_setlist("2023-05-01") | {"setlistUrl": "https://www.setlist.fm/1"},
+                    make_setlist("2023-05-01") | {"setlistUrl": "https://www.setlist.fm/2"}]
+        db.insert_setlists(MBID, setlists)
+        # As if only the first one had been indexed when the backfill stopped
+        db._concerts.delete_many({"artistMbid": MBID, "setlist.setlistUrl": "https://www.setlist.fm/2"})
+        db._meta_collection.delete_one({"_id": "concertBackfill"})
+
+        db._prepare_concert_index()
+        concerts = db.find_concerts(ConcertQuery(city="Seattle"))
+        assert sorted(c["setlistUrl"] for c in concerts if c["artistMbid"] == MBID) == [
+            "https://www.setlist.fm/1", "https://www.setlist.fm/2"
+        ]
+        assert db._meta_collection.find_one({"_id": "concertBackfill"})["complete"] == True
+    finally:
+        db.delete_artist(MBID)
+        db.close()
+
+
+def test_stats(db):
+    stats = ArtistStats.from_setlists(MBID, [make_setlist("2023-05-01")]).to_document(complete=False)
+    # Unknown artists don't get stats
+    db.save_stats(MBID, stats)
+    assert db.get_stats(MBID) is None
+
+    db.insert_artist(MBID, "Boys Go To Jupiter")
+    db.save_stats(MBID, stats)
+    assert db.get_stats(MBID) == stats
+
+    # Saved along with the fetch's last writes
+    final = stats | {"complete": True}
+    db.save_stats(MBID, final)
+    db.mark_artist_complete(MBID)
+    assert db.get_stats(MBID) == final
+
+    db.delete_artist(MBID)
+    assert db.get_stats(MBID) is None
+
+
+def test_song_index(db):
+    db.insert_artist(MBID, "Boys Go To Jupiter")
+    db.insert_setlists(MBID, [
+        make_setlist("2023-05-01") | {"songs": ["Opener", "Hit Song", "Closer"]},
+        make_setlist("2023-06-01") | {"songs": ["Opener", "hit  song", "Hit Song"]},
+        make_setlist("2022-01-01"),
+    ])
+    db.insert_setlists(MBID, [
+        make_setlist("2024-03-01") | {"countryName": "Canada", "songs": ["Hit Song", "Encore"]}
+    ])
+
+    # Matched ignoring case and spaces, newest first
+    plays = db.find_song_plays(MBID, "HIT SONG", 10)
+    assert [setlist["eventDate"] for setlist in plays] == ["2024-03-01", "2023-06-01", "2023-05-01"]
+    assert [setlist["eventDate"] for setlist in db.find_song_plays(MBID, "hit song", 2)] == ["2024-03-01", "2023-06-01"]
+    assert db.find_song_plays(MBID, "Not Played", 10) == []
+
+    # Played twice in one show counts once
+    assert db.top_songs(MBID, None, 3) == [
+        {"song": "Hit Song", "plays": 3}, {"song": "Opener", "plays": 2}, {"song": "Closer", "plays": 1}
+    ]
+    assert db.top_songs(MBID, "canada", 10) == [{"song": "Encore", "plays": 1}, {"song": "Hit Song", "plays": 1}]
+    assert db.top_songs(MBID, "Japan", 10) == []
+
+    db.delete_artist(MBID)
+    assert db.find_song_plays(MBID, "Hit Song", 10) == []
+    assert db.top_songs(MBID, None, 10) == []
+
+
+def test_mongo_read_routing(monkeypatch):
+    # Only looks at where reads would go, so no server is needed
+    pytest.importorskip("pymongo")
+    from pymongo.read_preferences import Primary, SecondaryPreferred
+    import mongo_database
+    monkeypatch.setattr(mongo_database, "SECONDARY_READS", True)
+    # Connect when told to instead of in the background, so it's over (and failed) by the end of the test
+    connects = []
+    monkeypatch.setattr(
+        mongo_database, "Thread", lambda target, daemon: SimpleNamespace(start=lambda: connects.append(target))
+    )
+    db = mongo_database.MongoDatabase()
+    # Written while still connecting, as during startup
+    db._wrote("early")
+    connects[0]()
+    try:
+        artists = db._artists
+        assert db._for_reads(artists, "early").read_preference == Primary()
+        assert db._for_reads(artists, MBID).read_preference == SecondaryPreferred(max_staleness=90)
+        assert db._for_reads(db._concerts).read_preference == SecondaryPreferred(max_staleness=90)
+
+        # Read your writes
+        db._wrote(MBID)
+        assert db._for_reads(artists, MBID).read_preference == Primary()
+        assert db._for_reads(artists, "another").read_preference == SecondaryPreferred(max_staleness=90)
+
+        # Long enough ago that every secondary in use has it
+        monkeypatch.setattr(mongo_database, "READ_YOUR_WRITES_S", 0)
+        assert db._for_reads(artists, MBID).read_preference == SecondaryPreferred(max_staleness=90)
+    finally:
+        db.close()
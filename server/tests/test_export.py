@@ -0,0 +1,69 @@
+import csv
+import io
+import json
+import export
+from test_database import make_setlist
+
+MBID = "b4db7e5b-fb5f-4bc0-8a5a-2c1b4b7ab5b3"
+
+
+def store_artist(app, setlists: list[dict], complete: bool = True) -> None:
+    app.db.insert_artist(MBID, "Boys Go To Jupiter")
+    app.db.insert_setlists(MBID, setlists)
+    if complete:
+        app.db.mark_artist_complete(MBID)
+
+
+def test_export_ndjson(app, client):
+    setlists = [make_setlist("2023-05-01"), {"isValid": False}, make_setlist("2024-01-15", "Tacoma")]
+    store_artist(app, setlists)
+
+    response = client.get(f"/api/export/{MBID}")
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    assert response.headers["X-Export-Complete"] == "true"
+    assert MBID in response.headers["Content-Disposition"]
+    assert [json.loads(line) for line in response.text.splitlines()] == setlists
+
+
+def test_export_csv(app, client):
+    store_artist(app, [make_setlist("2023-05-01"), make_setlist("2024-01-15", "Tacoma")], complete=False)
+
+    response = client.get(f"/api/export/{MBID}?format=csv")
+    assert response.status_code == 200
+    assert response.mimetype == "text/csv"
+    assert response.headers["X-Export-Complete"] == "false"
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert [row["cityName"] for row in rows] == ["Seattle", "Tacoma"]
+    assert rows[0]["songsPerformed"] == "12"
+
+
+def test_export_geojson(app, client):
+    store_artist(app, [make_setlist("2023-05-01"), {"isValid": False}])
+
+    response = client.get(f"/api/export/{MBID}?format=geojson")
+    assert response.status_code == 200
+    collection = response.json if response.is_json else json.loads(response.text)
+    assert collection["type"] == "FeatureCollection"
+    # The invalid setlist has nowhere to go
+    assert len(collection["features"]) == 1
+    feature = collection["features"][0]
+    assert feature["geometry"] == {"type": "Point", "coordinates": [-122.3, 47.6]}
+    assert feature["properties"]["eventDate"] == "2023-05-01"
+    assert "cityLat" not in feature["properties"]
+
+
+def test_export_errors(client):
+    # Artist not stored
+    assert client.get(f"/api/export/{MBID}").status_code == 404
+    # Rejected by validation
+    assert client.get(f"/api/export/{MBID}?format=xml").status_code == 400
+
+
+def test_export_chunks(monkeypatch):
+    monkeypatch.setattr(export, "CHUNK_BYTES", 1000)
+    setlists = [make_setlist(f"2020-01-{day:02d}") for day in range(1, 21)]
+    chunks = list(export._chunked(export.encode_ndjson(setlists)))
+    # Several rows per chunk, nothing lost
+    assert 1 < len(chunks) < len(setlists)
+    assert [json.loads(line) for line in b"".join(chunks).splitlines()] == setlists
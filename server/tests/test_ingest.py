@@ -0,0 +1,95 @@
+import gzip
+import io
+import json
+import pytest
+from pathlib import Path
+from ingest import Ingest
+from memory_database import MemoryDatabase
+from setlist import convert_raw_setlists
+
+JUPITER_MBID = "904e413a-1327-4418-a96d-114a14a874ff"
+MXTMOON_MBID = "ccbced49-2689-46f8-9101-1c265d6f7b8f"
+
+
+def load_pages(name: str) -> list[dict]:
+    return [json.loads(path.read_bytes()) for path in sorted(Path(f"tests/mocks/GET_setlists_{name}").glob("p*.json"))]
+
+
+def expected_setlists(pages: list[dict]) -> list[dict]:
+    return convert_raw_setlists([raw for page in pages for raw in page.get("setlist", [])])
+
+
+@pytest.fixture()
+def archives(tmp_path: Path) -> Path:
+    # mxmtoon's pages as gzipped JSONL, Boys Go To Jupiter's as a plain JSON list of pages
+    with gzip.open(tmp_path / "mxmtoon.jsonl.gz", "wt", encoding="utf-8") as f:
+        for page in load_pages("mxmtoon"):
+            f.write(json.dumps(page) + "\n")
+    (tmp_path / "jupiter.json").write_text(json.dumps(load_pages("jupiter")))
+    return tmp_path
+
+
+def test_ingest(archives: Path, tmp_path: Path):
+    db = MemoryDatabase()
+    state = Ingest(db, str(tmp_path / "state.json"), workers=2, chunk_bytes=1, out=io.StringIO()).run([str(archives)])
+
+    assert db.get_all_setlists(MXTMOON_MBID) == expected_setlists(load_pages("mxmtoon"))
+    assert db.get_all_setlists(JUPITER_MBID) == expected_setlists(load_pages("jupiter"))
+    # Stored artists are complete, and named after their setlists' artist
+    assert db.check_artist(MXTMOON_MBID)[1] == False
+    assert db._artists[JUPITER_MBID]["name"] == "Boys Go To Jupiter"
+    assert state["setlists"] == 107
+
+    # Running again does nothing, since every archive is done
+    Ingest(db, str(tmp_path / "state.json"), workers=2, out=io.StringIO()).run([str(archives)])
+    assert len(db.get_all_setlists(MXTMOON_MBID)) == 103
+
+
+def test_existing_artists_left_alone(archives: Path):
+    db = MemoryDatabase()
+    db.insert_artist(JUPITER_MBID, "Boys Go To Jupiter")
+    db.insert_setlists(JUPITER_MBID, [{"isValid": False}])
+
+    Ingest(db, None, workers=1, out=io.StringIO()).run([str(archives)])
+    assert db.get_all_setlists(JUPITER_MBID) == [{"isValid": False}]
+    assert len(db.get_all_setlists(MXTMOON_MBID)) == 103
+
+
+def test_resume(archives: Path, tmp_path: Path):
+    class CrashingDatabase(MemoryDatabase):
+        batches = 0
+
+        def write_batch(self, writes):
+            self.batches += 1
+            if self.batches == 3:
+                raise RuntimeError("crash")
+            super().write_batch(writes)
+
+    db = CrashingDatabase()
+    state_path = str(tmp_path / "state.json")
+    with pytest.raises(RuntimeError):
+        Ingest(db, state_path, workers=2, chunk_bytes=1, out=io.StringIO()).run([str(archives / "mxmtoon.jsonl.gz")])
+    assert 0 < len(db.get_all_setlists(MXTMOON_MBID)) < 103
+
+    # Picks up from the last stored chunk, without storing anything twice
+    Ingest(db, state_path, workers=2, chunk_bytes=1, out=io.StringIO()).run([str(archives / "mxmtoon.jsonl.gz")])
+    assert db.get_all_setlists(MXTMOON_MBID) == expected_setlists(load_pages("mxmtoon"))
+
+
+def test_malformed_lines_skipped(tmp_path: Path):
+    pages = load_pages("mxmtoon")
+    with open(tmp_path / "mxmtoon.jsonl", "w", encoding="utf-8") as f:
+        for i, page in enumerate(pages):
+            f.write(json.dumps(page) + "\n")
+            if i == 0:
+                # Cut off halfway
+                f.write(json.dumps(pages[1])[:100] + "\n")
+    db = MemoryDatabase()
+    out = io.StringIO()
+    ingest = Ingest(db, None, workers=2, chunk_bytes=1, out=out)
+    ingest.run([str(tmp_path / "mxmtoon.jsonl")])
+
+    # Every other line is stored
+    assert db.get_all_setlists(MXTMOON_MBID) == expected_setlists(pages)
+    assert ingest.bad_lines == 1
+    assert "1 malformed lines" in out.getvalue()
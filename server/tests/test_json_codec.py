@@ -0,0 +1,80 @@
+import json
+import pytest
+from pathlib import Path
+import json_codec
+from setlist import Setlist, convert_raw_setlists
+
+PAGES = sorted(Path("tests/mocks").glob("GET_setlists_*/p*.json"))
+
+
+@pytest.mark.parametrize("codec", ["orjson", "stdlib"])
+def test_loads(codec, monkeypatch):
+    if codec == "orjson":
+        pytest.importorskip("orjson")
+    monkeypatch.setattr(json_codec, "CODEC", codec)
+
+    for path in PAGES:
+        raw = path.read_bytes()
+        assert json_codec.loads(raw) == json.loads(raw.decode("utf-8"))
+
+
+def test_convert_raw_setlists_matches_setlist():
+    for path in PAGES:
+        raw_setlists = json.loads(path.read_bytes()).get("setlist", [])
+        assert convert_raw_setlists(raw_setlists) == Setlist.convert_setlists(raw_setlists), path
+
+
+def test_convert_raw_setlists_incomplete():
+    raw_setlists = [
+        {"eventDate": "15-01-2024", "venue": {"name": "Venue", "city": {"name": "Nowhere"}}, "sets": {"set": []}},
+        {"eventDate": "15-01-2024", "venue": {"city": {"coords": {"lat": 1.5, "long": 2.5}}}},
+        {"url": "https://www.setlist.fm/setlist/x.html"},
+    ]
+    converted = convert_raw_setlists(raw_setlists)
+
+    assert converted[0] == {"isValid": False}
+    assert converted[1]["eventDate"] == "2024-01-15"
+    assert converted[1]["venueName"] is None
+    assert converted[1]["songsPerformed"] is None
+    assert converted[2] == {"isValid": False}
+
+
+def test_dumps_same_for_both_codecs(monkeypatch):
+    pytest.importorskip("orjson")
+    setlists = convert_raw_setlists(json.loads(PAGES[0].read_bytes())["setlist"])
+    event = {"type": "update", "setlists": setlists + [{"cityName": "서울"}], "totalExpected": None}
+
+    outputs = []
+    for codec in ["orjson", "stdlib"]:
+        monkeypatch.setattr(json_codec, "CODEC", codec)
+        outputs.append(json_codec.dumps_bytes(event, sort_keys=True))
+        assert json_codec.dumps(event, sort_keys=True) == outputs[-1].decode("utf-8")
+
+    assert outputs[0] == outputs[1]
+    assert json.loads(outputs[0]) == event
+
+
+@pytest.mark.parametrize("codec", ["orjson", "stdlib"])
+def test_dumps_default(codec, monkeypatch):
+    import datetime
+    if codec == "orjson":
+        pytest.importorskip("orjson")
+    monkeypatch.setattr(json_codec, "CODEC", codec)
+
+    # Like the json module, datetimes go through default
+    when = datetime.datetime(2024, 1, 15, tzinfo=datetime.timezone.utc)
+    assert json_codec.dumps({"when": when}, default=lambda o: "custom") == '{"when":"custom"}'
+
+
+
+def test_flask_responses(client):
+    import requests_mock
+    with requests_mock.Mocker() as m:
+        m.get("https://api.spotify.com/v1/search", status_code=404, json={})
+        m.get("https://api.setlist.fm/rest/1.0/search/artists", status_code=404, json={})
+
+        # jsonify goes through json_codec as well
+        response = client.get("/api/artists/squish")
+        assert response.status_code == 404
+        assert response.is_json
+        assert response.data == b'{"error":"Artist not found"}\n'
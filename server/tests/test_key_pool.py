@@ -0,0 +1,158 @@
+import time
+import requests_mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+import setlistfm_api
+from setlistfm_api import KeyPool, SetlistFmAPI
+
+
+def test_keys_from_env(monkeypatch):
+    monkeypatch.setenv("SETLISTFM_API_KEYS", "a, b,,c")
+    assert [key.key for key in KeyPool.from_env().keys] == ["a", "b", "c"]
+
+    monkeypatch.delenv("SETLISTFM_API_KEYS")
+    monkeypatch.setenv("SETLISTFM_API_KEY", "mango")
+    assert [key.key for key in KeyPool.from_env().keys] == ["mango"]
+
+
+def test_requests_spread_across_keys(monkeypatch):
+    monkeypatch.setattr(setlistfm_api, "RATE_LIMIT_MS", 1000)
+    pool = KeyPool(["a", "b", "c"])
+
+    start = time.perf_counter()
+    keys = [pool.acquire().key for _ in range(3)]
+    # Each key had a free slot, so nobody waited
+    assert time.perf_counter() - start < 0.5
+    assert sorted(keys) == ["a", "b", "c"]
+
+
+def test_quarantine(monkeypatch):
+    monkeypatch.setattr(setlistfm_api, "RATE_LIMIT_MS", 0)
+    pool = KeyPool(["a", "b"])
+    a, b = pool.keys
+
+    # A 429 now and then is fine
+    pool.report(a, 429)
+    pool.report(a, 200)
+    pool.report(a, 429)
+    assert pool.usage()[0]["quarantined"] == False
+
+    for _ in range(setlistfm_api.QUARANTINE_AFTER_429S):
+        pool.report(a, 429)
+    assert pool.usage()[0]["quarantined"] == True
+    assert all(pool.acquire() is b for _ in range(5))
+
+    # With every key quarantined, requests still go out, with the key that comes back first
+    pool.report(b, 401)
+    assert pool.acquire() is a
+    assert pool.usage()[1] == {
+        "key": "key ...b", "requests": 5, "rateLimited": 0, "authErrors": 1, "quarantined": True
+    }
+
+
+def test_rate_limited_request_retries_with_other_key(monkeypatch):
+    monkeypatch.setattr(setlistfm_api, "RATE_LIMIT_MS", 0)
+    pool = KeyPool(["tired", "fresh"])
+    api = SetlistFmAPI(pool)
+
+    def respond(request, context):
+        context.status_code = 429 if request.headers["x-api-key"] == "tired" else 200
+        return {"name": "mxmtoon"}
+
+    with requests_mock.Mocker() as m:
+        m.get("https://api.setlist.fm/rest/1.0/artist/x", json=respond)
+        start = time.perf_counter()
+        for _ in range(4):
+            assert api.get_artist_info("x") == {"name": "mxmtoon"}
+
+    # No backoff was needed, and the tired key was eventually set aside
+    assert time.perf_counter() - start < 1
+    tired, fresh = pool.usage()
+    assert fresh["requests"] == 4
+    assert tired["quarantined"] == True
+
+
+def test_timeouts_follow_latency(monkeypatch):
+    tracker = setlistfm_api.LatencyTracker()
+    # Too soon to tell
+    assert tracker.timeout_s() == setlistfm_api.MAX_TIMEOUT_S
+    assert tracker.hedge_after_s() is None
+
+    for _ in range(95):
+        tracker.record(1.0)
+    for _ in range(5):
+        tracker.record(2.0)
+    assert tracker.percentile(95) == 1.0
+    assert tracker.timeout_s() == 6.0
+    assert tracker.hedge_after_s() == 1.0
+
+    # Never below the minimum, or above the maximum
+    for _ in range(setlistfm_api.LATENCY_WINDOW):
+        tracker.record(0.01)
+    assert tracker.timeout_s() == setlistfm_api.MIN_TIMEOUT_S
+    for _ in range(setlistfm_api.LATENCY_WINDOW):
+        tracker.record(60)
+    assert tracker.timeout_s() == setlistfm_api.MAX_TIMEOUT_S
+
+
+def test_slow_request_hedged(monkeypatch):
+    monkeypatch.setattr(setlistfm_api, "RATE_LIMIT_MS", 0)
+    monkeypatch.setattr(setlistfm_api, "MIN_HEDGE_AFTER_S", 0.05)
+    monkeypatch.setattr(setlistfm_api, "HEDGE_SHARE", 1)
+    monkeypatch.setattr(setlistfm_api, "latencies", {})
+    monkeypatch.setattr(setlistfm_api, "hedge_budget", setlistfm_api.HedgeBudget())
+    api = SetlistFmAPI(KeyPool(["a", "b"]))
+    keys = []
+
+    # requests_mock sends one request at a time, so hedges need a real server
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            keys.append(self.headers["x-api-key"])
+            # The first request of the last call stalls
+            if len(keys) == setlistfm_api.MIN_LATENCY_SAMPLES + 1:
+                time.sleep(1)
+            self.send_response(200)
+            self.end_headers()
+            self.wfile.write(b'{"name": "mxmtoon"}')
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(setlistfm_api, "API_URL", f"http://127.0.0.1:{server.server_port}")
+    try:
+        for _ in range(setlistfm_api.MIN_LATENCY_SAMPLES):
+            api.get_artist_info("x")
+        assert setlistfm_api.hedge_budget.hedges == 0
+
+        start = time.perf_counter()
+        assert api.get_artist_info("x") == {"name": "mxmtoon"}
+        # The hedge answered, without waiting on the stalled request
+        assert time.perf_counter() - start < 0.5
+        assert setlistfm_api.hedge_budget.hedges == 1
+        # Each went out with its own key
+        assert keys[-2] != keys[-1]
+    finally:
+        server.shutdown()
+
+
+def test_rate_limit_wait_not_hedged(monkeypatch):
+    monkeypatch.setattr(setlistfm_api, "RATE_LIMIT_MS", 200)
+    monkeypatch.setattr(setlistfm_api, "MIN_HEDGE_AFTER_S", 0.05)
+    monkeypatch.setattr(setlistfm_api, "HEDGE_SHARE", 1)
+    monkeypatch.setattr(setlistfm_api, "hedge_budget", setlistfm_api.HedgeBudget())
+    # Upstream answers in 10 ms, so requests still going after 50 ms get hedged
+    tracker = setlistfm_api.LatencyTracker()
+    for _ in range(setlistfm_api.MIN_LATENCY_SAMPLES):
+        tracker.record(0.01)
+    monkeypatch.setattr(setlistfm_api, "latencies", {"/artist/{mbid}": tracker})
+    api = SetlistFmAPI(KeyPool(["a"]))
+
+    with requests_mock.Mocker() as m:
+        m.get("https://api.setlist.fm/rest/1.0/artist/x", json={"name": "mxmtoon"})
+        for _ in range(3):
+            api.get_artist_info("x")
+    # Each waited about 200 ms for its slot, but none was slow once it went out
+    assert m.call_count == 3
+    assert setlistfm_api.hedge_budget.hedges == 0
@@ -0,0 +1,60 @@
+from map_layout import ScatterLayout, cluster_setlists, scatter_point
+from test_database import make_setlist
+
+MBID = "b4db7e5b-fb5f-4bc0-8a5a-2c1b4b7ab5b3"
+
+
+def test_scatter_points_are_stable():
+    setlists = [make_setlist(f"2023-01-{day:02d}") for day in range(1, 11)]
+
+    # Placing setlists page by page gives the same points as placing them all at once
+    all_at_once = ScatterLayout().place(setlists)
+    layout = ScatterLayout()
+    page_by_page = layout.place(setlists[:3]) + layout.place(setlists[3:])
+    assert all_at_once == page_by_page
+    # Same for a layout that starts out from stored setlists
+    assert ScatterLayout(setlists[:7]).place(setlists[7:]) == all_at_once[7:]
+
+    # First one on the city, the rest all on different points around it
+    assert (all_at_once[0]["scatterLat"], all_at_once[0]["scatterLong"]) == (47.6, -122.3)
+    assert len({(s["scatterLat"], s["scatterLong"]) for s in all_at_once}) == 10
+
+    # The originals are left alone
+    assert "scatterLat" not in setlists[0]
+
+
+def test_scatter_by_city():
+    tacoma = make_setlist("2023-01-02", "Tacoma") | {"cityLat": 47.25, "cityLong": -122.44}
+    placed = ScatterLayout().place([make_setlist("2023-01-01"), tacoma, {"isValid": False}, make_setlist("2023-01-03")])
+    # Each city has its own spiral
+    assert (placed[1]["scatterLat"], placed[1]["scatterLong"]) == (47.25, -122.44)
+    assert (placed[3]["scatterLat"], placed[3]["scatterLong"]) == scatter_point(47.6, -122.3, 1)
+    assert placed[2] == {"isValid": False}
+
+
+def test_clusters():
+    tacoma = make_setlist("2023-01-02", "Tacoma") | {"cityLat": 47.25, "cityLong": -122.44}
+    tokyo = make_setlist("2019-01-02", "Tokyo") | {"cityLat": 35.7, "cityLong": 139.7}
+    setlists = [make_setlist("2023-01-01"), make_setlist("2020-05-01"), tacoma, tokyo, {"isValid": False}]
+
+    # Zoomed out, Seattle and Tacoma are one cluster
+    clusters = cluster_setlists(setlists, 2)
+    assert [(c["count"], c["cities"]) for c in clusters] == [(3, 2), (1, 1)]
+    assert (clusters[0]["firstDate"], clusters[0]["lastDate"]) == ("2020-05-01", "2023-01-02")
+    assert clusters[1]["lat"] == 35.7
+
+    # Zoomed in, they split
+    assert [(c["count"], c["cities"]) for c in cluster_setlists(setlists, 10)] == [(2, 1), (1, 1), (1, 1)]
+
+
+def test_clusters_endpoint(app, client):
+    assert client.get(f"/api/clusters/{MBID}").status_code == 404
+
+    app.db.insert_artist(MBID, "Boys Go To Jupiter")
+    app.db.insert_setlists(MBID, [make_setlist("2023-01-01"), make_setlist("2024-01-01")])
+    response = client.get(f"/api/clusters/{MBID}?zoom=3")
+    assert response.status_code == 200
+    assert response.json["zoom"] == 3
+    assert response.json["clusters"][0]["count"] == 2
+
+    assert client.get(f"/api/clusters/{MBID}?zoom=30").status_code == 400
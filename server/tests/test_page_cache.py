@@ -0,0 +1,75 @@
+import datetime
+import requests_mock
+import setlistfm_api
+from page_cache import PageCache, cache_key
+from setlistfm_api import KeyPool, SetlistFmAPI
+
+SETLISTS_URL = "https://api.setlist.fm/rest/1.0/artist/x/setlists"
+
+
+def make_page(year: int, total: int = 40) -> dict:
+    return {"total": total, "setlist": [{"eventDate": f"01-06-{year}"}]}
+
+
+def make_api(tmp_path, monkeypatch) -> SetlistFmAPI:
+    monkeypatch.setattr(setlistfm_api, "RATE_LIMIT_MS", 0)
+    return SetlistFmAPI(KeyPool(["mango"]), PageCache(str(tmp_path / "cache.sqlite3")))
+
+
+def test_cache_key():
+    assert cache_key("/a", {"p": 2, "b": "c"}) == cache_key("/a", {"b": "c", "p": "2"}) == "/a?b=c&p=2"
+
+
+def test_old_pages_served_from_cache(tmp_path, monkeypatch):
+    api = make_api(tmp_path, monkeypatch)
+    with requests_mock.Mocker() as m:
+        m.get(SETLISTS_URL, json=make_page(2001))
+        assert api.get_artist_setlists("x", 3) == make_page(2001)
+        assert api.get_artist_setlists("x", 3) == make_page(2001)
+        # Page 3 was downloaded once
+        assert m.call_count == 1
+    assert api.cache.usage() == {"hits": 1, "revalidated": 0, "misses": 1}
+    assert api.cache.get("/artist/x/setlists", {"p": 3}).expires_at > datetime.datetime.now().timestamp() + 7 * 24 * 3600
+
+
+def test_changed_total_skips_cache(tmp_path, monkeypatch):
+    api = make_api(tmp_path, monkeypatch)
+    with requests_mock.Mocker() as m:
+        m.get(SETLISTS_URL, json=make_page(2001))
+        api.get_artist_setlists("x", 3, total=40)
+        api.get_artist_setlists("x", 3, total=40)
+        assert m.call_count == 1
+        # A setlist was added since: everything after it moved along
+        m.get(SETLISTS_URL, json=make_page(2002, total=41))
+        assert api.get_artist_setlists("x", 3, total=41) == make_page(2002, total=41)
+        assert m.call_count == 2
+
+
+def test_first_page_revalidated(tmp_path, monkeypatch):
+    api = make_api(tmp_path, monkeypatch)
+    this_year = datetime.date.today().year
+
+    def respond(request, context):
+        if request.headers.get("If-None-Match") == '"v1"':
+            context.status_code = 304
+            return None
+        context.headers["ETag"] = '"v1"'
+        return make_page(this_year)
+
+    with requests_mock.Mocker() as m:
+        m.get(SETLISTS_URL, json=respond)
+        assert api.get_artist_setlists("x", 1) == make_page(this_year)
+        # Page 1 is always checked, but it hasn't changed
+        assert api.get_artist_setlists("x", 1) == make_page(this_year)
+        assert m.call_count == 2
+        assert m.request_history[1].headers["If-None-Match"] == '"v1"'
+    assert api.cache.usage() == {"hits": 0, "revalidated": 1, "misses": 1}
+
+
+def test_search_not_cached(tmp_path, monkeypatch):
+    api = make_api(tmp_path, monkeypatch)
+    with requests_mock.Mocker() as m:
+        m.get("https://api.setlist.fm/rest/1.0/search/artists", json={"artist": []})
+        api.search_artist("mxmtoon")
+        api.search_artist("mxmtoon")
+        assert m.call_count == 2
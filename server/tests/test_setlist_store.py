@@ -0,0 +1,64 @@
+import json
+from setlist import Setlist
+from setlist_store import SetlistStore
+
+
+def load_setlists() -> list[dict]:
+    setlists = []
+    for i in range(1, 7):
+        with open(f"tests/mocks/GET_setlists_mxmtoon/p{i}.json", encoding="utf-8") as f:
+            setlists.extend(Setlist.convert_setlists(json.load(f).get("setlist", [])))
+    return setlists
+
+
+def test_round_trip():
+    setlists = load_setlists()
+    store = SetlistStore(setlists)
+
+    assert len(store) == len(setlists)
+    assert store.to_list() == setlists
+    # Same key order too, since clients may see the JSON
+    assert [list(s) for s in store] == [list(s) for s in setlists]
+    assert store[-1] == setlists[-1]
+    # Song titles come back too, interned or not
+    assert any(s.get("songs") for s in store)
+
+
+def test_unusual_values():
+    setlist = {
+        "isValid": True,
+        "eventDate": "2024-01-15",
+        "venueName": None,
+        "cityName": "Seattle",
+        "cityLat": 47.6,
+        "cityLong": -122.3,
+        "stateName": None,
+        "countryName": "United States",
+        "setlistUrl": "https://example.com/setlist",
+        "songsPerformed": None
+    }
+    store = SetlistStore([setlist, {"isValid": False}])
+    assert store.to_list() == [setlist, {"isValid": False}]
+
+    # Stored before song titles were kept, or with an empty setlist
+    with_songs = [setlist | {"songs": []}, setlist | {"songs": ["Ünïcode", ""]}]
+    store.extend(with_songs)
+    assert store.to_list()[2:] == with_songs
+
+
+def test_last():
+    def valid(date: str, city: str) -> dict:
+        return Setlist.convert_setlists([{
+            "eventDate": "-".join(date.split("-")[::-1]),
+            "url": f"https://www.setlist.fm/setlist/{city}.html",
+            "venue": {"name": "Venue", "city": {"name": city, "coords": {"lat": 1.0, "long": 2.0}}},
+            "sets": {"set": []}
+        }])[0]
+
+    store = SetlistStore()
+    assert store.last() is None
+
+    store.extend([{"isValid": False}, valid("2023-05-01", "A"), valid("2024-01-15", "B"), valid("2024-01-15", "C")])
+    # First of the latest date wins
+    assert store.last()["cityName"] == "B"
+
@@ -0,0 +1,41 @@
+from test_database import make_setlist
+
+MBID = "b4db7e5b-fb5f-4bc0-8a5a-2c1b4b7ab5b3"
+
+
+def store_setlists(app):
+    app.db.insert_artist(MBID, "Boys Go To Jupiter")
+    app.db.insert_setlists(MBID, [
+        make_setlist("2023-05-01") | {"songs": ["Opener", "Hit Song"]},
+        make_setlist("2024-03-01") | {"countryName": "Canada", "songs": ["Hit Song", "Encore"]},
+    ])
+    app.db.mark_artist_complete(MBID)
+
+
+def test_top_songs(app, client):
+    assert client.get(f"/api/artists/{MBID}/songs").status_code == 404
+    store_setlists(app)
+
+    response = client.get(f"/api/artists/{MBID}/songs")
+    assert response.status_code == 200
+    assert response.json["country"] is None
+    assert response.json["songs"][0] == {"song": "Hit Song", "plays": 2}
+    assert len(response.json["songs"]) == 3
+
+    response = client.get(f"/api/artists/{MBID}/songs?country=Canada&limit=1")
+    assert response.json["songs"] == [{"song": "Encore", "plays": 1}]
+
+    assert client.get(f"/api/artists/{MBID}/songs?limit=0").status_code == 400
+
+
+def test_song_plays(app, client):
+    store_setlists(app)
+
+    response = client.get(f"/api/artists/{MBID}/songs/plays?song=hit%20song")
+    assert response.status_code == 200
+    assert [setlist["eventDate"] for setlist in response.json["plays"]] == ["2024-03-01", "2023-05-01"]
+    # Song lists stay on the server
+    assert all("songs" not in setlist for setlist in response.json["plays"])
+
+    assert client.get(f"/api/artists/{MBID}/songs/plays?song=encore").json["plays"][0]["countryName"] == "Canada"
+    assert client.get(f"/api/artists/{MBID}/songs/plays").status_code == 400
@@ -0,0 +1,68 @@
+import time
+import requests_mock
+from stats import ArtistStats
+from test_database import make_setlist
+from test_setlist import JUPITER_MBID, jupiter_setlists, load_json
+
+MBID = "b4db7e5b-fb5f-4bc0-8a5a-2c1b4b7ab5b3"
+
+
+def test_stats_add_up():
+    setlists = [
+        make_setlist("2019-05-01"),
+        make_setlist("2019-06-01") | {"songsPerformed": None},
+        make_setlist("2021-01-01") | {"countryName": "Canada", "songsPerformed": 18},
+        {"isValid": False}
+    ]
+    stats = ArtistStats.from_setlists(MBID, setlists).to_document(complete=True)
+    assert stats["totalSetlists"] == 4
+    assert stats["validSetlists"] == 3
+    assert (stats["firstShow"], stats["lastShow"]) == ("2019-05-01", "2021-01-01")
+    assert stats["showsPerYear"] == {"2019": 2, "2021": 1}
+    assert stats["countries"] == [{"country": "United States", "shows": 2}, {"country": "Canada", "shows": 1}]
+    assert stats["countriesVisited"] == 2
+    # The show without a song count doesn't drag the average down
+    assert stats["averageSongsPerShow"] == 15
+
+    # Continuing from saved stats is the same as counting everything at once
+    partial = ArtistStats.from_setlists(MBID, setlists[:2]).to_document(complete=False)
+    continued = ArtistStats(MBID, partial)
+    continued.add(setlists[2:])
+    assert continued.to_document(complete=True) == stats
+
+
+def test_stats_after_fetch(app, client):
+    with requests_mock.Mocker() as m:
+        m.get("https://api.spotify.com/v1/search", status_code=404, json={})
+        m.get(f"https://api.setlist.fm/rest/1.0/artist/{JUPITER_MBID}", json={"name": "Boys Go To Jupiter"})
+        for i, page in enumerate(jupiter_setlists):
+            m.get(f"https://api.setlist.fm/rest/1.0/artist/{JUPITER_MBID}/setlists?p={i+1}", json=page)
+
+        client.get(f"/api/setlists/{JUPITER_MBID}")
+        # Wait for the fetch to be stored
+        for _ in range(50):
+            if not app.db.check_artist(JUPITER_MBID)[1]:
+                break
+            time.sleep(0.1)
+
+    response = client.get(f"/api/artists/{JUPITER_MBID}/stats")
+    assert response.status_code == 200
+    expected = load_json("tests/output/setlists_jupiter.json")
+    assert response.json["complete"] == True
+    assert response.json["totalSetlists"] == len(expected)
+    assert response.json["lastShow"] == max(s["eventDate"] for s in expected)
+
+
+def test_stats_without_fetch(app, client):
+    assert client.get(f"/api/artists/{MBID}/stats").status_code == 404
+
+    # Stored without stats, like a bulk load
+    app.db.insert_artist(MBID, "Boys Go To Jupiter")
+    app.db.insert_setlists(MBID, [make_setlist("2023-05-01"), make_setlist("2024-01-15")])
+    app.db.mark_artist_complete(MBID)
+
+    response = client.get(f"/api/artists/{MBID}/stats")
+    assert response.status_code == 200
+    assert response.json["showsPerYear"] == {"2023": 1, "2024": 1}
+    # Counted once, then kept
+    assert app.db.get_stats(MBID) == response.json
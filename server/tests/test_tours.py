@@ -0,0 +1,113 @@
+import random
+import time
+import numpy as np
+import requests_mock
+import tours
+from setlist import convert_raw_setlists
+from tours import TourTracker, haversine_km
+from test_database import make_setlist
+from test_setlist import MXTMOON_MBID as MXMTOON_MBID, mxmtoon_setlists
+from test_stats import MBID
+
+
+def at(date: str, city: str, lat: float, long: float, country: str = "United States") -> dict:
+    return make_setlist(date, city) | {"cityLat": lat, "cityLong": long, "countryName": country}
+
+
+def test_haversine():
+    # Paris to London
+    distance = haversine_km(np.array([48.8566]), np.array([2.3522]), np.array([51.5074]), np.array([-0.1278]))
+    assert abs(distance[0] - 343.6) < 1
+
+
+def test_tours_split_on_gaps():
+    setlists = [
+        at("2023-03-01", "Seattle", 47.6, -122.3),
+        at("2023-03-03", "Portland", 45.5, -122.7),
+        at("2023-03-04", "Portland", 45.5, -122.7),
+        at("2023-03-20", "Vancouver", 49.3, -123.1, "Canada"),
+        # Two months off, then a one-off show
+        at("2023-05-20", "Chicago", 41.9, -87.6),
+        at("2023-09-01", "London", 51.5, -0.1, "United Kingdom"),
+        at("2023-09-02", "Paris", 48.9, 2.4, "France"),
+        at("2023-09-05", "London", 51.5, -0.1, "United Kingdom"),
+        {"isValid": False}
+    ]
+    tracker = TourTracker(setlists)
+    assert tracker.seen == 9
+    assert tracker.one_off_shows() == 1
+
+    europe, west_coast = tracker.tours()
+    assert (europe["firstShow"], europe["lastShow"], europe["shows"]) == ("2023-09-01", "2023-09-05", 3)
+    assert europe["countries"] == ["United Kingdom", "France"]
+    assert west_coast["shows"] == 4
+    assert west_coast["countries"] == ["United States", "Canada"]
+    # The flight to Chicago isn't part of either tour
+    assert 670 < europe["distanceKm"] < 690
+
+    # Staying in Portland isn't a leg
+    legs = tracker.tours(with_legs=True)[1]["legs"]
+    assert [(leg["from"], leg["to"]) for leg in legs] == [("Seattle", "Portland"), ("Portland", "Vancouver")]
+    assert sum(leg["distanceKm"] for leg in legs) == west_coast["distanceKm"]
+
+
+def test_added_in_any_order():
+    setlists = [setlist for page in mxmtoon_setlists for setlist in convert_raw_setlists(page["setlist"])]
+    expected = TourTracker(setlists).tours(with_legs=True)
+    assert len(expected) > 1
+
+    # Pages newest first, like a fetch
+    tracker = TourTracker()
+    for start in range(0, len(setlists), 20):
+        tracker.add(setlists[start:start + 20])
+    assert tracker.tours(with_legs=True) == expected
+
+    # Oldest first, then a bit of everything
+    tracker = TourTracker(setlists[60:])
+    tracker.add(setlists[:30])
+    shuffled = setlists[30:60]
+    random.Random(1).shuffle(shuffled)
+    tracker.add(shuffled[:15])
+    tracker.add(shuffled[15:])
+    assert tracker.tours(with_legs=True) == expected
+    assert tracker.seen == len(setlists)
+
+
+def test_tours_after_fetch(app, client):
+    assert client.get(f"/api/artists/{MBID}/tours").status_code == 404
+
+    with requests_mock.Mocker() as m:
+        m.get("https://api.spotify.com/v1/search", status_code=404, json={})
+        m.get(f"https://api.setlist.fm/rest/1.0/artist/{MXMTOON_MBID}", json={"name": "mxmtoon"})
+        for i, page in enumerate(mxmtoon_setlists):
+            m.get(f"https://api.setlist.fm/rest/1.0/artist/{MXMTOON_MBID}/setlists?p={i+1}", json=page)
+        # The page after the last one
+        m.get(f"https://api.setlist.fm/rest/1.0/artist/{MXMTOON_MBID}/setlists?p=7", status_code=404, json={})
+        client.get(f"/api/setlists/{MXMTOON_MBID}")
+        for _ in range(50):
+            if not app.db.check_artist(MXMTOON_MBID)[1]:
+                break
+            time.sleep(0.1)
+
+    # Kept up to date by the fetch
+    tracker = tours.cached(MXMTOON_MBID)
+    assert tracker.seen == len(app.db.get_all_setlists(MXMTOON_MBID))
+
+    response = client.get(f"/api/artists/{MXMTOON_MBID}/tours?legs=true")
+    assert response.status_code == 200
+    assert response.json["complete"] == True
+    assert response.json["tours"] == tracker.tours(with_legs=True)
+    assert response.json["oneOffShows"] + sum(tour["shows"] for tour in response.json["tours"]) == len(tracker)
+    assert "legs" not in client.get(f"/api/artists/{MXMTOON_MBID}/tours").json["tours"][0]
+
+
+def test_tours_of_ingested_setlists(app, client):
+    # Stored without a fetch, so nothing is cached
+    app.db.insert_artist(MBID, "Boys Go To Jupiter")
+    app.db.insert_setlists(MBID, [make_setlist(f"2024-01-0{day}") for day in range(1, 4)])
+    app.db.mark_artist_complete(MBID)
+
+    response = client.get(f"/api/artists/{MBID}/tours")
+    assert response.status_code == 200
+    assert [tour["shows"] for tour in response.json["tours"]] == [3]
+    assert tours.cached(MBID).seen == 3
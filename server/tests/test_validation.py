@@ -0,0 +1,71 @@
+import validation
+from validation import CompiledParameterValidator, SampledJSONResponseValidator
+
+
+def test_compiled_validator_reused():
+    compiled = {}
+    schema = {"type": "string", "format": "uuid"}
+    first = validation._compile(compiled, schema, validation.Draft4Validator)
+    assert validation._compile(compiled, schema, validation.Draft4Validator) is first
+    # Equal but distinct schemas get their own validator
+    assert validation._compile(compiled, dict(schema), validation.Draft4Validator) is not first
+
+
+def test_compiled_validators_per_app():
+    # Each app has its own copy of the spec's schemas, so its own cache, freed along with it
+    first, second = validation.api_options()["validator_map"], validation.api_options()["validator_map"]
+    assert first["parameter"].compiled is first["response"]["application/json"].compiled
+    assert first["parameter"].compiled is not second["parameter"].compiled
+
+    param = {"name": "page", "in": "query", "schema": {"type": "integer"}}
+    assert first["parameter"].validate_parameter("query", 3, param) is None
+    assert len(first["parameter"].compiled) == 1
+    assert len(second["parameter"].compiled) == 0
+
+
+def test_parameter_validation():
+    param = {"name": "page", "in": "query", "required": True, "schema": {"type": "integer"}}
+    assert CompiledParameterValidator.validate_parameter("query", 3, param) is None
+    assert "is not of type 'integer'" in CompiledParameterValidator.validate_parameter("query", "x", param)
+    assert CompiledParameterValidator.validate_parameter("query", None, param) == "Missing query parameter 'page'"
+
+
+def test_response_sampling():
+    def send(message):
+        pass
+
+    class Never(SampledJSONResponseValidator):
+        sample_rate = 0.0
+
+    class Always(SampledJSONResponseValidator):
+        sample_rate = 1.0
+
+    never = Never(None, schema={"type": "object"}, nullable=False, encoding="utf-8")
+    always = Always(None, schema={"type": "object"}, nullable=False, encoding="utf-8")
+    assert never.wrap_send(send) is send
+    assert always.wrap_send(send) is not send
+    # Nothing to validate without a schema
+    assert Always(None, schema={}, nullable=False, encoding="utf-8").wrap_send(send) is send
+
+
+def test_production_options(monkeypatch):
+    monkeypatch.setenv("OPENAPI_VALIDATION", "production")
+    monkeypatch.setenv("OPENAPI_RESPONSE_SAMPLE_RATE", "0")
+    options = validation.api_options()
+    assert options["strict_validation"] == True
+    assert options["validate_responses"] == False
+
+    monkeypatch.setenv("OPENAPI_VALIDATION", "strict")
+    options = validation.api_options()
+    assert options["validate_responses"] == True
+    assert options["validator_map"]["response"]["application/json"].sample_rate == 1.0
+
+
+def test_spec_cache(monkeypatch, tmp_path):
+    monkeypatch.setenv("OPENAPI_CACHE_DIR", str(tmp_path))
+    spec = validation.load_spec()
+    assert len(list(tmp_path.glob("cm-openapi-*.json"))) == 1
+
+    # Second load comes from the cache
+    monkeypatch.setattr(validation.yaml, "safe_load", None)
+    assert validation.load_spec() == spec
@@ -0,0 +1,147 @@
+import time
+import pytest
+from memory_database import MemoryDatabase
+from write_behind import WriteBehindDatabase
+
+MBID = "b4db7e5b-fb5f-4bc0-8a5a-2c1b4b7ab5b3"
+
+
+class CountingDatabase(MemoryDatabase):
+    """Counts the batches that reach the database."""
+    def __init__(self):
+        super().__init__()
+        self.batches = 0
+
+    def write_batch(self, writes):
+        self.batches += 1
+        super().write_batch(writes)
+
+
+def make_db(**kwargs) -> tuple[WriteBehindDatabase, CountingDatabase]:
+    inner = CountingDatabase()
+    db = WriteBehindDatabase(inner, **kwargs)
+    db.insert_artist(MBID, "Boys Go To Jupiter")
+    return db, inner
+
+
+def test_writes_are_coalesced():
+    db, inner = make_db(flush_size=1000, flush_interval=60)
+    for i in range(10):
+        db.insert_setlists(MBID, [{"isValid": False}] * 20)
+    # Nothing reached the database yet
+    assert inner.get_all_setlists(MBID) == []
+
+    db.mark_artist_complete(MBID)
+    # All pages and the status change were applied in one batch, before mark_artist_complete returned
+    assert inner.batches == 1
+    assert len(inner.get_all_setlists(MBID)) == 200
+    assert inner.check_artist(MBID)[1] == False
+    db.close()
+
+
+def test_reads_see_buffered_writes():
+    db, inner = make_db(flush_size=1000, flush_interval=60)
+    setlist = {
+        "isValid": True,
+        "eventDate": "2024-01-15",
+        "venueName": "Venue",
+        "cityName": "Seattle",
+        "cityLat": 47.6,
+        "cityLong": -122.3,
+        "stateName": "Washington",
+        "countryName": "United States",
+        "setlistUrl": "https://www.setlist.fm/",
+        "songsPerformed": 12
+    }
+    db.insert_setlists(MBID, [setlist])
+    assert db.get_last_setlist(MBID)["eventDate"] == "2024-01-15"
+
+    db.reinsert_artist(MBID)
+    assert db.check_artist(MBID)[1] == True
+    db.close()
+
+
+def test_flush_by_size_and_time():
+    db, inner = make_db(flush_size=50, flush_interval=0.2)
+    db.insert_setlists(MBID, [{"isValid": False}] * 50)
+    time.sleep(0.1)
+    assert len(inner.get_all_setlists(MBID)) == 50
+
+    db.insert_setlists(MBID, [{"isValid": False}])
+    time.sleep(0.4)
+    assert len(inner.get_all_setlists(MBID)) == 51
+    db.close()
+
+
+def test_delete_drops_buffered_writes():
+    db, inner = make_db(flush_size=1000, flush_interval=60)
+    db.insert_setlists(MBID, [{"isValid": False}] * 5)
+    db.delete_artist(MBID)
+    db.insert_artist(MBID, "Boys Go To Jupiter")
+    assert db.get_all_setlists(MBID) == []
+
+    # Closing applies whatever is left
+    db.insert_setlists(MBID, [{"isValid": False}])
+    db.close()
+    assert len(inner.get_all_setlists(MBID)) == 1
+
+
+def make_setlist(date: str) -> dict:
+    return {
+        "isValid": True,
+        "eventDate": date,
+        "venueName": "Venue",
+        "cityName": "Seattle",
+        "cityLat": 47.6,
+        "cityLong": -122.3,
+        "stateName": "Washington",
+        "countryName": "United States",
+        "setlistUrl": "https://www.setlist.fm/",
+        "songsPerformed": 12
+    }
+
+
+class FailingDatabase(CountingDatabase):
+    """Fails the next `failures` batches."""
+    def __init__(self, failures: int):
+        super().__init__()
+        self.failures = failures
+
+    def write_batch(self, writes):
+        if self.failures > 0:
+            self.failures -= 1
+            raise RuntimeError("database unavailable")
+        super().write_batch(writes)
+
+
+def test_failed_flush_keeps_writes():
+    inner = FailingDatabase(failures=0)
+    db = WriteBehindDatabase(inner, flush_size=1000, flush_interval=60)
+    db.insert_artist(MBID, "Boys Go To Jupiter")
+    db.insert_setlists(MBID, [make_setlist("2024-01-01")])
+    inner.failures = 1
+    with pytest.raises(RuntimeError):
+        db.flush()
+    assert inner.get_all_setlists(MBID) == []
+
+    # The failed page goes out with the next one, in order, when the fetch completes
+    db.insert_setlists(MBID, [make_setlist("2024-01-02")])
+    db.mark_artist_complete(MBID)
+    assert [setlist["eventDate"] for setlist in inner.get_all_setlists(MBID)] == ["2024-01-01", "2024-01-02"]
+    assert inner.check_artist(MBID)[1] == False
+    db.close()
+
+
+def test_failed_completion_leaves_artist_in_progress():
+    inner = FailingDatabase(failures=0)
+    db = WriteBehindDatabase(inner, flush_size=1000, flush_interval=60)
+    db.insert_artist(MBID, "Boys Go To Jupiter")
+    db.insert_setlists(MBID, [{"isValid": False}])
+    inner.failures = 1
+    with pytest.raises(RuntimeError):
+        db.mark_artist_complete(MBID)
+
+    # Stored once the database is back, but not as complete
+    db.close()
+    assert len(inner.get_all_setlists(MBID)) == 1
+    assert inner.check_artist(MBID)[1] == True